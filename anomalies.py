@@ -0,0 +1,159 @@
+import json
+import os
+import math
+import time
+import logging
+
+import pandas as pd
+import gspread
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+REALTIME_BASELINE_FILE = "realtime_baseline.json"
+ALERTS_WORKSHEET = "Alertas"
+SLOT_HOURS = 2  # uma faixa por execução em tempo real (a cada 2h)
+DECAY_ALPHA = 0.1  # peso mínimo da observação nova: dias antigos perdem peso aos poucos
+MIN_OBSERVATIONS = 4  # mesmo dia da semana e faixa: ~1 mês de histórico antes de alertar
+Z_THRESHOLD = 3.0
+MIN_RELATIVE_CHANGE = 0.3  # ignora desvios "estatísticos" pequenos em clientes muito estáveis
+MONITORED_METRICS = ["faturamento", "investimento", "quantidade_vendas", "visitas"]
+ALERT_COLUMNS = [
+    "data_geracao", "periodo_consulta", "cliente", "metrica", "faixa_horaria",
+    "valor_atual", "esperado", "desvio_padrao", "z_score", "direcao",
+]
+ALERT_KEY_COLUMNS = ["periodo_consulta", "cliente", "metrica", "faixa_horaria"]  # colunas B:E da aba
+
+# --- Estatísticas Incrementais ---
+
+def update_stats(stats, value):
+    """
+    Média e variância com decaimento exponencial, em O(1) por observação.
+    O peso é 1/n nas primeiras observações (Welford exato) e DECAY_ALPHA depois.
+    """
+    n = stats.get("n", 0) + 1
+    alpha = max(1.0 / n, DECAY_ALPHA)
+    mean = stats.get("media", 0.0)
+    diff = value - mean
+    stats["media"] = mean + alpha * diff
+    stats["variancia"] = (1 - alpha) * (stats.get("variancia", 0.0) + alpha * diff * diff)
+    stats["n"] = n
+    return stats
+
+def score(stats, value):
+    """(z-score, desvio padrão) do valor contra a expectativa; None sem histórico suficiente."""
+    if stats.get("n", 0) < MIN_OBSERVATIONS:
+        return None
+    std = math.sqrt(stats["variancia"])
+    mean = stats["media"]
+    if std == 0:
+        return None if value == mean else (math.copysign(float("inf"), value - mean), std)
+    return (value - mean) / std, std
+
+class RealtimeBaseline:
+    """
+    Expectativa dos totais parciais do dia por cliente, dia da semana e faixa horária, em JSON.
+    Cada execução compara os números atuais com a expectativa e depois atualiza as estatísticas,
+    sem reler o histórico. Uma faixa só recebe uma observação por dia: reexecuções na mesma faixa
+    não entram nas estatísticas nem geram alertas de novo.
+    """
+    def __init__(self, path=REALTIME_BASELINE_FILE):
+        self.path = path
+        self.stats = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Base de expectativas '{path}' inválida. Começando vazia.")
+
+    @staticmethod
+    def slot_key(moment):
+        slot = moment.hour // SLOT_HOURS
+        return f"{moment.weekday()}|{slot * SLOT_HOURS:02d}-{(slot + 1) * SLOT_HOURS:02d}h"
+
+    def observe(self, client_name, moment, metrics):
+        """
+        Compara as métricas parciais com a expectativa da faixa e atualiza a base.
+        Retorna a lista de alertas (dicionários com as colunas de ALERT_COLUMNS, exceto data_geracao e cliente),
+        vazia se a faixa do dia já foi observada.
+        """
+        slot = self.slot_key(moment)
+        slot_stats = self.stats.setdefault(client_name, {}).setdefault(slot, {})
+        day = moment.strftime('%Y-%m-%d')
+        if slot_stats.get("ultimo_dia") == day:
+            logger.info(f"Faixa {slot} de {day} já observada para '{client_name}'. Amostra ignorada.")
+            return []
+
+        alerts = []
+        for metric in MONITORED_METRICS:
+            value = metrics.get(metric)
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            value = float(value)
+            stats = slot_stats.setdefault(metric, {})
+            result = score(stats, value)
+            if result is not None:
+                z, std = result
+                mean = stats["media"]
+                relative = abs(value - mean) / abs(mean) if mean else float("inf")
+                if abs(z) >= Z_THRESHOLD and relative >= MIN_RELATIVE_CHANGE:
+                    alerts.append({
+                        "periodo_consulta": day, "metrica": metric, "faixa_horaria": slot.split("|")[1],
+                        "valor_atual": round(value, 2), "esperado": round(mean, 2), "desvio_padrao": round(std, 2),
+                        "z_score": round(z, 2) if math.isfinite(z) else "inf",
+                        "direcao": "pico" if value > mean else "queda",
+                    })
+            update_stats(stats, value)
+
+        slot_stats["ultimo_dia"] = day
+        slot_stats["atualizado_em"] = time.time()
+        return alerts
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stats, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+# --- Gravação dos Alertas ---
+
+def partial_metrics(business_metrics, ads_metrics):
+    """Totais parciais monitorados, a partir das métricas do coletor (pedidos/visitas e Ads)."""
+    return {
+        "faturamento": business_metrics.get("faturamento_bruto", 0), "investimento": ads_metrics.get("cost"),
+        "quantidade_vendas": business_metrics.get("quantidade_vendas", 0), "visitas": business_metrics.get("visitas"),
+    }
+
+def write_alerts(spreadsheet, alerts):
+    """
+    Acrescenta os alertas da execução à aba de alertas, sem repetir a chave
+    (dia, cliente, métrica, faixa) de um alerta já gravado (ex.: execução refeita).
+    Só as colunas da chave são lidas da aba.
+    """
+    if not alerts:
+        return
+    try:
+        try:
+            worksheet = spreadsheet.worksheet(ALERTS_WORKSHEET)
+        except gspread.WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title=ALERTS_WORKSHEET, rows="1", cols=len(ALERT_COLUMNS))
+            worksheet.update([ALERT_COLUMNS], value_input_option='RAW')
+            logger.info(f"Aba '{ALERTS_WORKSHEET}' criada com sucesso.")
+        existing = {tuple(str(v) for v in row) for row in worksheet.get_values("B2:E")}
+        new_alerts = []
+        for alert in alerts:
+            key = tuple(str(alert.get(col, "")) for col in ALERT_KEY_COLUMNS)
+            if key not in existing:
+                existing.add(key)
+                new_alerts.append(alert)
+        if len(new_alerts) < len(alerts):
+            logger.info(f"{len(alerts) - len(new_alerts)} alertas já gravados ignorados.")
+        if not new_alerts:
+            return
+        alerts = new_alerts
+        df_alerts = pd.DataFrame(alerts, columns=ALERT_COLUMNS)
+        worksheet.append_rows(df_alerts.astype(object).where(pd.notna(df_alerts), "").values.tolist(), value_input_option='USER_ENTERED')
+        logger.info(f"{len(alerts)} alertas gravados na aba '{ALERTS_WORKSHEET}'.")
+    except gspread.exceptions.APIError as e:
+        logger.error(f"ERRO DE API ao gravar a aba '{ALERTS_WORKSHEET}': {e}")
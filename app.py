@@ -1,5 +1,6 @@
 # app.py
 import streamlit as st
+from utils import start_background_refresh
 
 st.set_page_config(
     page_title="Dashboard Operação - Verderosi&Co",
@@ -7,6 +8,9 @@ st.set_page_config(
     layout="wide"
 )
 
+# Aquece os snapshots das páginas em segundo plano enquanto o usuário ainda está na página inicial
+start_background_refresh()
+
 st.title("🚀 DASHBOARD OPERAÇÃO")
 st.header("Verderosi&Co")
 st.markdown("---")
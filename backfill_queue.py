@@ -0,0 +1,250 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import logging
+import argparse
+import multiprocessing
+import os
+import socket
+
+import pandas as pd
+
+import historical_data_run_v2 as historical
+from meli_collector import get_new_access_token, MercadoLivreAdsCollector, load_clients_and_credentials, open_consolidated_sheet
+from ledger import CompletionLedger
+from rollups import refresh_rollups
+from telemetry import telemetry
+from preflight import ClientIdCache, get_fresh_client
+
+# --- Configuração do Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(processName)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+QUEUE_FILE = "backfill_queue.sqlite"
+DEFAULT_WINDOW_DAYS = 30
+LEASE_SECONDS = 15 * 60
+MAX_ATTEMPTS = 3
+IDLE_SLEEP_SECONDS = 10
+
+STATUS_PENDING = "pendente"
+STATUS_LEASED = "em_execucao"
+STATUS_DONE = "concluida"
+STATUS_FAILED = "falhou"
+
+# --- Fila Local com Lease (SQLite) ---
+
+class WorkQueue:
+    """
+    Fila de unidades (cliente, intervalo de datas, fonte) em SQLite.
+    Um worker "aluga" uma unidade por LEASE_SECONDS; se não confirmar nesse prazo
+    (processo morto, máquina reiniciada), a unidade volta a ficar disponível.
+    Cada cliente tem no máximo uma unidade em execução, respeitando o limite de taxa por cliente.
+    """
+    def __init__(self, path=QUEUE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS work_units (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cliente TEXT NOT NULL,
+                inicio TEXT NOT NULL,
+                fim TEXT NOT NULL,
+                fonte TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                lease_ate REAL,
+                worker TEXT,
+                ultimo_erro TEXT,
+                UNIQUE (cliente, inicio, fim, fonte)
+            )
+        """)
+
+    def enqueue(self, client_name, start_str, end_str, source):
+        """Adiciona a unidade; se ela já existia concluída ou falha, volta a ficar pendente."""
+        self.conn.execute("""
+            INSERT INTO work_units (cliente, inicio, fim, fonte) VALUES (?, ?, ?, ?)
+            ON CONFLICT (cliente, inicio, fim, fonte) DO UPDATE SET status = 'pendente', tentativas = 0, ultimo_erro = NULL
+            WHERE status IN ('concluida', 'falhou')
+        """, (client_name, start_str, end_str, source))
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Aluga a próxima unidade disponível (mais recente primeiro). Retorna um dict ou None."""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("""
+                SELECT id, cliente, inicio, fim, fonte FROM work_units
+                WHERE (status = 'pendente' OR (status = 'em_execucao' AND lease_ate < ?))
+                  AND cliente NOT IN (SELECT cliente FROM work_units WHERE status = 'em_execucao' AND lease_ate >= ?)
+                ORDER BY fim DESC, id
+                LIMIT 1
+            """, (now, now)).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute("""
+                UPDATE work_units SET status = 'em_execucao', lease_ate = ?, worker = ?, tentativas = tentativas + 1
+                WHERE id = ?
+            """, (now + lease_seconds, worker_id, row[0]))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return dict(zip(["id", "cliente", "inicio", "fim", "fonte"], row))
+
+    def heartbeat(self, unit_id, worker_id, lease_seconds=LEASE_SECONDS):
+        """Estende o lease de uma unidade ainda em execução por este worker."""
+        self.conn.execute("UPDATE work_units SET lease_ate = ? WHERE id = ? AND worker = ? AND status = 'em_execucao'",
+                          (time.time() + lease_seconds, unit_id, worker_id))
+
+    def ack(self, unit_id, worker_id):
+        self.conn.execute("UPDATE work_units SET status = 'concluida', lease_ate = NULL WHERE id = ? AND worker = ?", (unit_id, worker_id))
+
+    def fail(self, unit_id, worker_id, error, max_attempts=MAX_ATTEMPTS):
+        """Devolve a unidade para a fila, ou a marca como falha após max_attempts tentativas."""
+        self.conn.execute("""
+            UPDATE work_units SET status = CASE WHEN tentativas >= ? THEN 'falhou' ELSE 'pendente' END,
+                                  lease_ate = NULL, ultimo_erro = ?
+            WHERE id = ? AND worker = ?
+        """, (max_attempts, str(error)[:500], unit_id, worker_id))
+
+    def active_days(self, client_name, source):
+        """Dias ('YYYY-MM-DD') cobertos por unidades pendentes ou em execução do cliente na fonte."""
+        rows = self.conn.execute("""
+            SELECT inicio, fim FROM work_units WHERE cliente = ? AND fonte = ? AND status IN ('pendente', 'em_execucao')
+        """, (client_name, source)).fetchall()
+        return {d.strftime('%Y-%m-%d') for start_str, end_str in rows for d in pd.date_range(start=start_str, end=end_str, freq='D')}
+
+    def has_pending(self):
+        row = self.conn.execute("SELECT COUNT(*) FROM work_units WHERE status IN ('pendente', 'em_execucao')").fetchone()
+        return row[0] > 0
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM work_units GROUP BY status").fetchall())
+
+# --- Coordenador ---
+
+def split_into_windows(pending_days, window_days):
+    """Agrupa dias pendentes ('YYYY-MM-DD') em intervalos contíguos de no máximo window_days dias."""
+    windows, current = [], []
+    for day in sorted(pending_days):
+        day_obj = datetime.strptime(day, '%Y-%m-%d').date()
+        if current and (day_obj - current[-1] != timedelta(days=1) or len(current) >= window_days):
+            windows.append((current[0], current[-1]))
+            current = []
+        current.append(day_obj)
+    if current:
+        windows.append((current[0], current[-1]))
+    return [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in windows]
+
+def plan_backfill(queue, clients_df, ledger, window_days=DEFAULT_WINDOW_DAYS):
+    """
+    Enfileira, por cliente, apenas as janelas que contêm dias pendentes no ledger.
+    Dias já cobertos por unidades pendentes ou em execução ficam de fora: replanejar com outra
+    janela não cria unidades sobrepostas.
+    """
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    today = datetime.now(brasil_timezone).date()
+    total_units = 0
+    for _, client_info in clients_df.iterrows():
+        client_name = client_info["client_name"]
+        start_date = historical.get_client_start_date(client_info, brasil_timezone).date()
+        pending_days = ledger.plan(client_name, historical.LEDGER_SOURCE, start_date, today)
+        queued_days = queue.active_days(client_name, historical.LEDGER_SOURCE)
+        windows = split_into_windows([day for day in pending_days if day not in queued_days], window_days)
+        for start_str, end_str in windows:
+            queue.enqueue(client_name, start_str, end_str, historical.LEDGER_SOURCE)
+        total_units += len(windows)
+        logger.info(f"Cliente '{client_name}': {len(pending_days)} dias pendentes em {len(windows)} unidades.")
+    logger.info(f"Planejamento concluído: {total_units} unidades enfileiradas.")
+
+# --- Worker ---
+
+def run_worker(worker_id, queue_path=QUEUE_FILE):
+    """Aluga, executa e confirma unidades até a fila esvaziar."""
+    telemetry.start_run(f"backfill_{worker_id}")
+    google_creds, clients_df = load_clients_and_credentials()
+    clients_by_name = {row["client_name"]: row for _, row in clients_df.iterrows()}
+    spreadsheet, worksheet_consolidado, consolidado_index = open_consolidated_sheet(google_creds)
+    queue = WorkQueue(queue_path)
+    ledger = CompletionLedger()
+    prepared_clients = {}
+    id_cache = ClientIdCache()
+
+    while True:
+        unit = queue.claim(worker_id)
+        if unit is None:
+            if not queue.has_pending():
+                break
+            # Há unidades, mas todas de clientes já em execução em outro worker
+            telemetry.sleep(IDLE_SLEEP_SECONDS, "fila_ocupada")
+            continue
+
+        client_name = unit["cliente"]
+        # Outros workers (e máquinas) acrescentam ao ledger: os dias concluídos por eles não são refeitos
+        ledger.refresh()
+        logger.info(f"[{worker_id}] Unidade {unit['id']}: {client_name} de {unit['inicio']} até {unit['fim']}.")
+        try:
+            client_info = clients_by_name.get(client_name)
+            if client_info is None:
+                raise Exception(f"Cliente '{client_name}' não está no CSV de clientes.")
+            # Workers de longa duração: o token é renovado quando expira, sem novas consultas de ids
+            prepared_client = get_fresh_client(prepared_clients, client_info, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+            if not prepared_client:
+                raise Exception(f"Não foi possível autenticar o cliente '{client_name}'.")
+
+            pending_days = ledger.plan(client_name, unit["fonte"], unit["inicio"], unit["fim"])
+            queue.heartbeat(unit["id"], worker_id)
+            with telemetry.client_timer(client_name):
+                # O lease é renovado a cada dia: uma unidade longa não expira e não é alugada por outro worker
+                consolidado_index, touched_keys = historical.process_client_days(
+                    client_name, prepared_client, pending_days, worksheet_consolidado, consolidado_index, ledger,
+                    on_day_done=lambda: queue.heartbeat(unit["id"], worker_id))
+                if touched_keys:
+                    # Outros workers também escrevem na aba: o perfil por dia da semana
+                    # precisa do histórico completo do cliente, então o índice das chaves é relido antes
+                    consolidado_index.load()
+                    refresh_rollups(spreadsheet, consolidado_index.frame_for_clients({client for client, _ in touched_keys}), touched_keys)
+
+            remaining = ledger.plan(client_name, unit["fonte"], unit["inicio"], unit["fim"])
+            if remaining:
+                raise Exception(f"{len(remaining)} dias continuam pendentes na unidade.")
+            queue.ack(unit["id"], worker_id)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Falha na unidade {unit['id']} ({client_name}): {e}")
+            queue.fail(unit["id"], worker_id, e)
+
+    telemetry.write_summary()
+    logger.info(f"[{worker_id}] Fila vazia. Worker finalizado.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill histórico distribuído em unidades (cliente, janela de datas).")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    planejar = subparsers.add_parser("planejar", help="Enfileira as janelas com dias pendentes no ledger.")
+    planejar.add_argument("--janela", type=int, default=DEFAULT_WINDOW_DAYS, help="Tamanho máximo da janela em dias.")
+    trabalhar = subparsers.add_parser("trabalhar", help="Executa workers que consomem a fila.")
+    trabalhar.add_argument("--processos", type=int, default=1, help="Número de processos worker nesta máquina.")
+    subparsers.add_parser("status", help="Mostra a contagem de unidades por status.")
+    args = parser.parse_args()
+
+    if args.comando == "planejar":
+        _, clients_df = load_clients_and_credentials()
+        ledger = CompletionLedger()
+        for legacy_state_file in historical.LEGACY_STATE_FILES:
+            ledger.import_legacy_state(legacy_state_file, historical.LEDGER_SOURCE)
+        plan_backfill(WorkQueue(), clients_df, ledger, args.janela)
+    elif args.comando == "trabalhar":
+        base_id = f"{socket.gethostname()}-{os.getpid()}"
+        workers = [multiprocessing.Process(target=run_worker, args=(f"{base_id}-{i}",), name=f"worker-{i}") for i in range(args.processos)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        logger.info(f"Unidades por status: {WorkQueue().counts()}")
+
+if __name__ == "__main__":
+    main()
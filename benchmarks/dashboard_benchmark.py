@@ -0,0 +1,166 @@
+"""
+Benchmark do dashboard contra datasets sintéticos (generate_dataset.py) em várias escalas.
+
+Para cada escala (clientes x anos) mede tempo e pico de memória (tracemalloc) das etapas:
+carga (clean_data sobre células em texto), snapshot Arrow (gravação e leitura), índice ordenado,
+filtro de período/clientes (máscara antiga x índice), rollups, KPIs, perfil por dia da semana,
+pivô do perfil horário e, com --render, a execução completa de cada página via streamlit.testing.
+
+Uso:
+    python benchmarks/dashboard_benchmark.py --escalas 7x1 100x2 500x3 --saida bench_dashboard.json
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from generate_dataset import generate_all, as_sheet_strings, DAILY_SHEET, CONSOLIDATED_SHEET, PROFILE_SHEET
+from utils import (
+    clean_data, write_snapshot, read_snapshot, DashboardIndex, derived_ratios, weekday_profile,
+    ROLLUP_SHEETS, _snapshot_path,
+)
+from rollups import consolidated_to_daily, compute_rollups, ROLLUP_DAILY, ROLLUP_WEEKDAY
+
+PAGES = ["1_Overview_Performance.py", "2_Análise_de_Período_Fator_Diário.py", "3_Perfil_Horário.py"]
+
+# --- Medição ---
+
+def measure(fn, repeats=3):
+    """Executa fn `repeats` vezes (menor tempo) e mais uma sob tracemalloc para o pico de memória."""
+    timings = []
+    result = None
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"tempo_ms": round(min(timings) * 1000, 2), "pico_mb": round(peak / 1e6, 2)}
+
+def legacy_filter(df, start_date, end_date, clients):
+    """Filtro anterior ao índice (um date Python por linha + isin sobre todo o frame), para comparação."""
+    df_filtered = df[(df['data'].dt.date >= start_date) & (df['data'].dt.date <= end_date)]
+    return df_filtered[df_filtered['cliente'].isin(clients)]
+
+def dashboard_rollups(df_consolidado, index):
+    """Monta o dict de load_rollups a partir da aba consolidada, passando pela mesma limpeza do dashboard."""
+    tables = compute_rollups(consolidated_to_daily(df_consolidado))
+    by_key = {ROLLUP_SHEETS["diario"]: ROLLUP_DAILY, ROLLUP_SHEETS["dia_semana"]: ROLLUP_WEEKDAY}
+    rollups = {key: clean_data(as_sheet_strings(tables[by_key[sheet]])) for key, sheet in ROLLUP_SHEETS.items()}
+    rollups["indice"] = index
+    return rollups, tables
+
+def hourly_pivot(df_profile, clients):
+    df = df_profile[df_profile['cliente'].isin(clients)]
+    return df.pivot_table(index='dia_semana', columns='hora', values='faturamento', aggfunc='sum').reindex(index=range(7), columns=range(24)).fillna(0)
+
+def render_pages(datasets, tables, workdir):
+    """Roda cada página com streamlit.testing.AppTest, servindo os dados por snapshots locais."""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {"erro": "streamlit.testing indisponível nesta versão do Streamlit"}
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for name, df in datasets.items():
+            write_snapshot(clean_data(as_sheet_strings(df)), _snapshot_path(name))
+        for sheet, df in tables.items():
+            write_snapshot(clean_data(as_sheet_strings(df)), _snapshot_path(sheet))
+        results = {}
+        for page in PAGES:
+            def _run():
+                app = AppTest.from_file(os.path.join(REPO_DIR, "pages", page), default_timeout=300)
+                app.secrets["connections"] = {"gcs": {"spreadsheet": "benchmark"}}
+                app.run()
+                return app
+            app, stats = measure(_run, repeats=1)
+            stats["excecoes"] = [str(e.value) for e in app.exception]
+            results[page] = stats
+        return results
+    finally:
+        os.chdir(cwd)
+
+def run_scale(n_clients, years, repeats, render):
+    report = {"clientes": n_clients, "anos": years, "etapas": {}}
+    etapas = report["etapas"]
+
+    started = time.perf_counter()
+    datasets = generate_all(n_clients, years, hourly="hora")
+    report["geracao_s"] = round(time.perf_counter() - started, 2)
+    report["linhas"] = {name: len(df) for name, df in datasets.items()}
+
+    raw_daily = as_sheet_strings(datasets[DAILY_SHEET])
+    df, etapas["carga_clean_data"] = measure(lambda: clean_data(raw_daily), repeats)
+
+    workdir = tempfile.mkdtemp(prefix="dashboard-bench-")
+    path = os.path.join(workdir, "Dados_Gerais.arrow")
+    _, etapas["snapshot_gravacao"] = measure(lambda: write_snapshot(df, path), repeats)
+    _, etapas["snapshot_leitura"] = measure(lambda: read_snapshot(path), repeats)
+    report["snapshot_mb"] = round(os.path.getsize(path) / 1e6, 2)
+
+    index, etapas["indice"] = measure(lambda: DashboardIndex(df), repeats)
+
+    # Seleção típica: últimos 90 dias de 10% dos clientes
+    end_date = pd.Timestamp(index.max_date).date()
+    start_date = (pd.Timestamp(end_date) - pd.Timedelta(days=89)).date()
+    clients = index.clients[:max(1, len(index.clients) // 10)]
+    _, etapas["filtro_mascara_antiga"] = measure(lambda: legacy_filter(df, start_date, end_date, clients), repeats)
+    _, etapas["filtro_indice"] = measure(lambda: index.select(start_date, end_date, clients), repeats)
+
+    (rollups, tables), etapas["rollups"] = measure(lambda: dashboard_rollups(datasets[CONSOLIDATED_SHEET], index), 1)
+    history_start = pd.Timestamp(index.min_date).date()
+    _, etapas["kpis_prefixo"] = measure(lambda: derived_ratios(index.totals(start_date, end_date, clients)), repeats)
+    _, etapas["kpis_prefixo_historico"] = measure(lambda: derived_ratios(index.totals(history_start, end_date, index.clients)), repeats)
+    _, etapas["perfil_dia_semana"] = measure(lambda: weekday_profile(rollups, start_date, end_date, clients), repeats)
+
+    df_profile = clean_data(as_sheet_strings(datasets[PROFILE_SHEET]))
+    _, etapas["pivo_perfil_horario"] = measure(lambda: hourly_pivot(df_profile, clients), repeats)
+
+    if render:
+        report["render"] = render_pages(datasets, tables, workdir)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do dashboard em escalas sintéticas.")
+    parser.add_argument("--escalas", nargs="+", default=["7x1", "100x2", "500x3"], help="Escalas no formato CLIENTESxANOS.")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--render", action="store_true", help="Também executa as páginas com streamlit.testing.AppTest.")
+    parser.add_argument("--saida", help="Arquivo JSON para o relatório.")
+    args = parser.parse_args()
+
+    reports = []
+    for scale in args.escalas:
+        n_clients, years = scale.lower().split("x")
+        print(f"--- Escala {n_clients} clientes x {years} anos ---")
+        report = run_scale(int(n_clients), float(years), args.repeticoes, args.render)
+        for step, stats in report["etapas"].items():
+            print(f"{step:<28} {stats['tempo_ms']:>10.1f} ms {stats['pico_mb']:>10.1f} MB")
+        reports.append(report)
+
+    # ru_maxrss é em KB no Linux
+    output = {"escalas": reports, "pico_rss_processo_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+    print(f"Pico de RSS do processo: {output['pico_rss_processo_mb']} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Servidores locais que imitam a API do Mercado Livre e a API de valores do Google Sheets
+(mais o endpoint do Drive usado por gspread.open), para medir os coletores sem tocar produção.
+
+Uso isolado:
+    python benchmarks/fake_services.py --clientes 7 --porta-meli 8701 --porta-sheets 8702
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+# --- Vendedores Sintéticos ---
+
+class SyntheticSellers:
+    """
+    Gera vendedores com volumes de pedidos variados (distribuição log-normal) e pedidos
+    determinísticos por (vendedor, dia), para que execuções repetidas vejam os mesmos dados.
+    """
+    def __init__(self, n_clients, seed=42, mean_orders_per_day=40):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.sellers = []
+        for i in range(n_clients):
+            volume = max(0, int(rng.lognormvariate(0, 1.2) * mean_orders_per_day))
+            self.sellers.append({
+                "client_name": f"CLIENTE_{i:04d}",
+                "app_id": str(1000000 + i),
+                "client_secret": f"secret-{i}",
+                "refresh_token": f"TG-fake-{i}",
+                "user_id": 500000 + i,
+                "advertiser_id": 900000 + i,
+                "orders_per_day": volume,
+            })
+        self.by_app_id = {s["app_id"]: s for s in self.sellers}
+        self.by_user_id = {s["user_id"]: s for s in self.sellers}
+        self.by_advertiser_id = {s["advertiser_id"]: s for s in self.sellers}
+        self.by_token = {f"token-{s['app_id']}": s for s in self.sellers}
+
+    def clients_csv(self, start_date=None):
+        lines = ["client_name,app_id,client_secret,refresh_token,start_date"]
+        for s in self.sellers:
+            lines.append(f"{s['client_name']},{s['app_id']},{s['client_secret']},{s['refresh_token']},{start_date or ''}")
+        return "\n".join(lines) + "\n"
+
+    def _rng(self, *key):
+        digest = hashlib.sha256(":".join(map(str, (self.seed,) + key)).encode()).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    @staticmethod
+    def _payment(rng, amount, created):
+        """Pagamento com o conjunto de campos de uma resposta real de /orders/search."""
+        timestamp = created.strftime('%Y-%m-%dT%H:%M:%S.000-03:00')
+        return {
+            "id": rng.randint(1, 10**11), "order_id": None, "payer_id": rng.randint(1, 10**9),
+            "collector": {"id": None}, "card_id": None, "site_id": "MLB", "reason": "Produto sintético",
+            "payment_method_id": rng.choice(["pix", "master", "visa", "bolbradesco"]), "currency_id": "BRL",
+            "installments": rng.choice([1, 1, 2, 3, 6, 10]), "issuer_id": str(rng.randint(1, 9999)),
+            "atm_transfer_reference": {"company_id": None, "transaction_id": None},
+            "coupon_id": None, "activation_uri": None, "operation_type": "regular_payment",
+            "payment_type": "credit_card", "available_actions": ["refund"], "status": "approved",
+            "status_code": None, "status_detail": "accredited", "transaction_amount": round(amount, 2),
+            "transaction_amount_refunded": 0, "taxes_amount": 0, "shipping_cost": 0, "coupon_amount": 0,
+            "overpaid_amount": 0, "total_paid_amount": round(amount, 2), "installment_amount": None,
+            "deferred_period": None, "date_approved": timestamp, "authorization_code": str(rng.randint(100000, 999999)),
+            "transaction_order_id": None, "date_created": timestamp, "date_last_modified": timestamp,
+        }
+
+    def orders_for_day(self, seller, date_str):
+        rng = self._rng(seller["user_id"], date_str)
+        # Fins de semana vendem menos; alguns dias ficam zerados
+        day = datetime.strptime(date_str, '%Y-%m-%d')
+        factor = 0.7 if day.weekday() >= 5 else 1.0
+        count = 0 if rng.random() < 0.03 else int(rng.gauss(seller["orders_per_day"] * factor, seller["orders_per_day"] * 0.2 + 1))
+        orders = []
+        for n in range(max(0, count)):
+            seconds = int(rng.betavariate(2.5, 2) * 86399)
+            created = day + timedelta(seconds=seconds)
+            quantity = rng.choice([1, 1, 1, 2, 3])
+            unit_price = round(rng.uniform(19.9, 399.9), 2)
+            orders.append({
+                "id": int(f"2{seller['user_id']}{day.strftime('%y%m%d')}{n:05d}"),
+                "date_created": created.strftime('%Y-%m-%dT%H:%M:%S.000-03:00'),
+                "last_updated": created.strftime('%Y-%m-%dT%H:%M:%S.000-03:00'),
+                "status": rng.choices(["paid", "shipped", "delivered", "cancelled"], [3, 3, 6, 1])[0],
+                "tags": ["test_order"] if rng.random() < 0.005 else ["paid"],
+                "total_amount": round(unit_price * quantity, 2),
+                "buyer": {"id": rng.randint(1, 10**9), "nickname": f"COMPRADOR{rng.randint(1, 99999)}"},
+                "shipping": {"id": rng.randint(1, 10**11)},
+                "payments": [self._payment(rng, unit_price * quantity, created)],
+                "context": {"channel": "marketplace", "site": "MLB", "flows": []},
+                "feedback": {"buyer": None, "seller": None},
+                "taxes": {"amount": None, "currency_id": None, "id": None},
+                "coupon": {"amount": 0, "id": None},
+                "order_request": {"change": None, "return": None},
+                "pack_id": None, "pickup_id": None, "fulfilled": None, "manufacturing_ending_date": None,
+                "mediations": [], "internal_tags": [], "static_tags": [],
+                "seller": {"id": seller["user_id"]},
+                "currency_id": "BRL", "paid_amount": round(unit_price * quantity, 2),
+                "date_closed": created.strftime('%Y-%m-%dT%H:%M:%S.000-03:00'),
+                "order_items": [{
+                    "item": {"id": f"MLB{seller['user_id'] % 1000:03d}{rng.randint(0, 49):04d}", "title": "Produto sintético",
+                             "category_id": "MLB1234", "variation_id": None, "seller_custom_field": None,
+                             "variation_attributes": [], "warranty": "Garantia de fábrica: 90 dias", "condition": "new",
+                             "seller_sku": None, "global_price": None, "net_weight": None},
+                    "quantity": quantity,
+                    "requested_quantity": {"measure": "unit", "value": quantity},
+                    "picked_quantity": None,
+                    "unit_price": unit_price,
+                    "full_unit_price": unit_price,
+                    "currency_id": "BRL",
+                    "manufacturing_days": None,
+                    "sale_fee": round(unit_price * 0.16, 2),
+                    "listing_type_id": rng.choice(["gold_special", "gold_pro"]),
+                }],
+            })
+        return sorted(orders, key=lambda o: o["date_created"])
+
+# --- Infraestrutura Comum ---
+
+class FakeServiceConfig:
+    """Latência artificial (ms) e probabilidade de responder 429 em cada requisição."""
+    def __init__(self, latency_ms=0, rate_limit_probability=0.0, seed=7):
+        self.latency_ms = latency_ms
+        self.rate_limit_probability = rate_limit_probability
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.bytes_sent = 0
+
+    def should_throttle(self):
+        with self.lock:
+            return self.rng.random() < self.rate_limit_probability
+
+    def count(self, endpoint, size=0):
+        with self.lock:
+            self.counters[endpoint] += 1
+            self.bytes_sent += size
+
+    def stats(self):
+        with self.lock:
+            return {"requisicoes": dict(self.counters), "total_requisicoes": sum(self.counters.values()), "bytes_enviados": self.bytes_sent}
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, endpoint):
+        body = json.dumps(payload).encode()
+        self.config.count(endpoint, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if not raw:
+            return {}
+        if "json" in (self.headers.get("Content-Type") or ""):
+            return json.loads(raw)
+        return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+    def _pre(self, endpoint):
+        if self.config.latency_ms:
+            threading.Event().wait(self.config.latency_ms / 1000)
+        if endpoint != "__stats" and self.config.should_throttle():
+            self._send(429, {"message": "too_many_requests"}, f"{endpoint} (429)")
+            return False
+        return True
+
+# --- Mercado Livre ---
+
+def make_meli_handler(sellers, config):
+    class MeliHandler(_JsonHandler):
+        def _seller_from_token(self):
+            token = (self.headers.get("Authorization") or "").replace("Bearer ", "")
+            return sellers.by_token.get(token)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path != "/oauth/token":
+                return self._send(404, {"message": "not_found"}, "404")
+            if not self._pre("oauth/token"):
+                return
+            data = self._body()
+            seller = sellers.by_app_id.get(str(data.get("client_id")))
+            if not seller or data.get("refresh_token") != seller["refresh_token"]:
+                return self._send(400, {"error": "invalid_grant", "message": "Invalid refresh token"}, "oauth/token")
+            self._send(200, {"access_token": f"token-{seller['app_id']}", "token_type": "bearer", "expires_in": 21600,
+                             "refresh_token": seller["refresh_token"], "user_id": seller["user_id"]}, "oauth/token")
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            path, params = parsed.path, {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            if path == "/__stats":
+                return self._send(200, config.stats(), "__stats")
+
+            seller = self._seller_from_token()
+            if path == "/users/me":
+                endpoint = "users/me"
+            elif path == "/orders/search":
+                endpoint = "orders/search"
+            elif re.fullmatch(r"/users/\d+/items_visits", path):
+                endpoint = "items_visits"
+            elif path == "/advertising/advertisers":
+                endpoint = "advertising/advertisers"
+            elif re.fullmatch(r"/advertising/advertisers/\d+/product_ads/campaigns", path):
+                endpoint = "product_ads/campaigns"
+            elif path == "/items":
+                endpoint = "items"
+            else:
+                return self._send(404, {"message": "not_found"}, "404")
+            if not self._pre(endpoint):
+                return
+            if seller is None:
+                return self._send(401, {"message": "invalid_token"}, endpoint)
+
+            if endpoint == "users/me":
+                return self._send(200, {"id": seller["user_id"], "nickname": seller["client_name"]}, endpoint)
+            if endpoint == "orders/search":
+                return self._send(200, self._orders_search(seller, params), endpoint)
+            if endpoint == "items_visits":
+                rng = sellers._rng("visits", seller["user_id"], params.get("date_from"))
+                return self._send(200, {"user_id": seller["user_id"], "total_visits": rng.randint(0, seller["orders_per_day"] * 60 + 10)}, endpoint)
+            if endpoint == "advertising/advertisers":
+                return self._send(200, {"advertisers": [{"advertiser_id": seller["advertiser_id"], "advertiser_name": seller["client_name"], "site_id": "MLB"}]}, endpoint)
+            if endpoint == "product_ads/campaigns":
+                return self._send(200, self._campaigns(seller, params), endpoint)
+            return self._send(200, self._items(params), endpoint)
+
+        def _orders_search(self, seller, params):
+            date_str = params.get("order.date_created.from", "")[:10]
+            orders = sellers.orders_for_day(seller, date_str) if date_str else []
+            if params.get("sort") == "date_desc":
+                orders = orders[::-1]
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", 50))
+            page = orders[offset:offset + limit]
+            if params.get("attributes"):
+                # Projeção no estilo do parâmetro 'attributes' da API: 'paging,results.campo,...'
+                fields = [a.split(".", 1)[1] for a in params["attributes"].split(",") if a.startswith("results.")]
+                page = [{f: o[f] for f in fields if f in o} for o in page]
+                return {"results": page, "paging": {"total": len(orders), "offset": offset, "limit": limit}}
+            return {"query": "", "results": page, "paging": {"total": len(orders), "offset": offset, "limit": limit}}
+
+        def _campaigns(self, seller, params):
+            rng = sellers._rng("ads", seller["user_id"], params.get("date_from"))
+            cost = round(rng.uniform(0, seller["orders_per_day"] * 15 + 5), 2)
+            total = round(cost * rng.uniform(2, 12), 2)
+            summary = {"cost": cost, "acos": round(cost / total * 100, 2) if total else 0, "direct_amount": round(total * 0.7, 2),
+                       "indirect_amount": round(total * 0.3, 2), "total_amount": total, "clicks": rng.randint(0, 3000), "prints": rng.randint(0, 90000)}
+            if params.get("metrics_summary") == "true":
+                return {"metrics_summary": summary}
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", 50))
+            campaigns = [{"id": i, "name": f"Campanha {i}", "status": "active", "budget": rng.choice([50, 850, 1000, 4500]),
+                          "metrics": {"clicks": rng.randint(0, 500), "cost": round(rng.uniform(0, 300), 2), "acos": round(rng.uniform(2, 40), 2),
+                                      "total_amount": round(rng.uniform(0, 3000), 2)}} for i in range(rng.randint(0, 8))]
+            return {"results": campaigns[offset:offset + limit], "paging": {"total": len(campaigns), "offset": offset, "limit": limit}}
+
+        def _items(self, params):
+            ids = [i for i in params.get("ids", "").split(",") if i]
+            return [{"code": 200, "body": {"id": item_id, "title": f"Produto {item_id}", "price": 99.9, "available_quantity": 10}} for item_id in ids]
+
+    MeliHandler.config = config
+    return MeliHandler
+
+# --- Google Sheets / Drive ---
+
+def _column_index(letters):
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+def parse_a1(range_name):
+    """'Aba'!A2:C10, 'Aba'!1:1, Aba ou Aba!A5 -> (aba, linha0, col0, linha_fim, col_fim) com None = aberto."""
+    range_name = unquote(range_name)
+    if "!" in range_name:
+        title, cells = range_name.rsplit("!", 1)
+    else:
+        title, cells = range_name, ""
+    title = title.strip("'").replace("''", "'")
+    if not cells:
+        return title, 0, 0, None, None
+    parts = cells.split(":")
+
+    def _cell(ref):
+        match = re.fullmatch(r"([A-Za-z]*)(\d*)", ref)
+        letters, digits = match.groups()
+        return (int(digits) - 1 if digits else None), (_column_index(letters) if letters else None)
+
+    start_row, start_col = _cell(parts[0])
+    end_row, end_col = _cell(parts[1]) if len(parts) > 1 else (start_row, start_col)
+    if len(parts) == 1 and start_row is not None and start_col is not None:
+        end_row, end_col = None, None
+    return title, start_row or 0, start_col or 0, end_row, end_col
+
+class FakeSpreadsheetStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spreadsheets = {}
+        self.titles = {}
+
+    def create(self, title, worksheets=()):
+        spreadsheet_id = hashlib.md5(title.encode()).hexdigest()
+        self.spreadsheets[spreadsheet_id] = {"title": title, "sheets": {}}
+        self.titles[title] = spreadsheet_id
+        for name in worksheets:
+            self.add_sheet(spreadsheet_id, name)
+        return spreadsheet_id
+
+    def add_sheet(self, spreadsheet_id, title):
+        sheets = self.spreadsheets[spreadsheet_id]["sheets"]
+        sheets[title] = {"sheetId": len(sheets) + 1, "index": len(sheets), "rows": []}
+        return sheets[title]
+
+def make_sheets_handler(store, config):
+    class SheetsHandler(_JsonHandler):
+        def _route(self, method):
+            parsed = urlparse(self.path)
+            path, query = unquote(parsed.path), parse_qs(parsed.query)
+            if path == "/__stats":
+                return self._send(200, config.stats(), "__stats")
+            if path.startswith("/drive/v3/files"):
+                if not self._pre("drive.files.list"):
+                    return
+                match = re.search(r"name = '(.+?)'", query.get("q", [""])[0])
+                files = [{"id": sid, "name": title, "createdTime": "2024-01-01T00:00:00.000Z", "modifiedTime": "2024-01-01T00:00:00.000Z"}
+                         for title, sid in store.titles.items() if not match or match.group(1) == title]
+                return self._send(200, {"files": files}, "drive.files.list")
+
+            match = re.fullmatch(r"/v4/spreadsheets/([^/:]+)(.*)", path)
+            if not match or match.group(1) not in store.spreadsheets:
+                return self._send(404, {"error": {"message": "not_found"}}, "404")
+            spreadsheet_id, rest = match.groups()
+            spreadsheet = store.spreadsheets[spreadsheet_id]
+
+            if rest == "" and method == "GET":
+                endpoint = "spreadsheets.get"
+            elif rest == ":batchUpdate":
+                endpoint = "spreadsheets.batchUpdate"
+            elif rest == "/values:batchUpdate":
+                endpoint = "values.batchUpdate"
+            elif rest == "/values:batchGet":
+                endpoint = "values.batchGet"
+            elif rest.startswith("/values/") and rest.endswith(":append"):
+                endpoint = "values.append"
+            elif rest.startswith("/values/") and rest.endswith(":clear"):
+                endpoint = "values.clear"
+            elif rest.startswith("/values/") and method == "PUT":
+                endpoint = "values.update"
+            elif rest.startswith("/values/"):
+                endpoint = "values.get"
+            else:
+                return self._send(404, {"error": {"message": "not_found"}}, "404")
+            if not self._pre(endpoint):
+                return
+            body = self._body() if method in ("POST", "PUT") else {}
+            with store.lock:
+                payload = self._handle(endpoint, spreadsheet_id, spreadsheet, rest, query, body)
+            return self._send(200, payload, endpoint)
+
+        def _handle(self, endpoint, spreadsheet_id, spreadsheet, rest, query, body):
+            sheets = spreadsheet["sheets"]
+            if endpoint == "spreadsheets.get":
+                return {"spreadsheetId": spreadsheet_id, "properties": {"title": spreadsheet["title"]},
+                        "sheets": [{"properties": {"title": t, "sheetId": s["sheetId"], "index": s["index"],
+                                                   "gridProperties": {"rowCount": max(len(s["rows"]), 1000), "columnCount": 26}}}
+                                   for t, s in sheets.items()]}
+            if endpoint == "spreadsheets.batchUpdate":
+                replies = []
+                for request in body.get("requests", []):
+                    if "addSheet" in request:
+                        title = request["addSheet"]["properties"]["title"]
+                        sheet = store.add_sheet(spreadsheet_id, title)
+                        replies.append({"addSheet": {"properties": {"title": title, "sheetId": sheet["sheetId"], "index": sheet["index"],
+                                                                     "gridProperties": {"rowCount": 1000, "columnCount": 26}}}})
+                    else:
+                        replies.append({})
+                return {"spreadsheetId": spreadsheet_id, "replies": replies}
+            if endpoint == "values.get":
+                return self._read(sheets, rest[len("/values/"):])
+            if endpoint == "values.batchGet":
+                return {"spreadsheetId": spreadsheet_id, "valueRanges": [self._read(sheets, r) for r in query.get("ranges", [])]}
+            if endpoint == "values.update":
+                return self._write(sheets, rest[len("/values/"):], body.get("values", []))
+            if endpoint == "values.batchUpdate":
+                for data in body.get("data", []):
+                    self._write(sheets, data["range"], data.get("values", []))
+                return {"spreadsheetId": spreadsheet_id, "totalUpdatedRows": len(body.get("data", []))}
+            if endpoint == "values.append":
+                title = parse_a1(rest[len("/values/"):-len(":append")])[0]
+                sheet = sheets.setdefault(title, store.add_sheet(spreadsheet_id, title)) if title not in sheets else sheets[title]
+                sheet["rows"].extend([list(map(self._cell_value, row)) for row in body.get("values", [])])
+                return {"spreadsheetId": spreadsheet_id, "updates": {"updatedRows": len(body.get("values", []))}}
+            if endpoint == "values.clear":
+                title = parse_a1(rest[len("/values/"):-len(":clear")])[0]
+                if title in sheets:
+                    sheets[title]["rows"] = []
+                return {"spreadsheetId": spreadsheet_id}
+
+        @staticmethod
+        def _cell_value(value):
+            return "" if value is None else str(value) if not isinstance(value, str) else value
+
+        def _read(self, sheets, range_name):
+            title, row0, col0, row1, col1 = parse_a1(range_name)
+            rows = sheets.get(title, {"rows": []})["rows"]
+            selected = rows[row0:(row1 + 1) if row1 is not None else None]
+            values = [row[col0:(col1 + 1) if col1 is not None else None] for row in selected]
+            while values and not any(values[-1]):
+                values.pop()
+            return {"range": range_name, "majorDimension": "ROWS", "values": values}
+
+        def _write(self, sheets, range_name, values):
+            title, row0, col0, _, _ = parse_a1(range_name)
+            rows = sheets[title]["rows"]
+            for offset, new_row in enumerate(values):
+                while len(rows) <= row0 + offset:
+                    rows.append([])
+                row = rows[row0 + offset]
+                while len(row) < col0 + len(new_row):
+                    row.append("")
+                row[col0:col0 + len(new_row)] = [self._cell_value(v) for v in new_row]
+            return {"updatedRange": range_name, "updatedRows": len(values)}
+
+        def do_GET(self):
+            self._route("GET")
+
+        def do_POST(self):
+            self._route("POST")
+
+        def do_PUT(self):
+            self._route("PUT")
+
+    SheetsHandler.config = config
+    return SheetsHandler
+
+# --- Inicialização ---
+
+def start_server(handler, port=0):
+    """Sobe o servidor numa thread daemon e retorna (servidor, url base)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidores locais do Mercado Livre e do Google Sheets para benchmarks.")
+    parser.add_argument("--clientes", type=int, default=7)
+    parser.add_argument("--porta-meli", type=int, default=8701)
+    parser.add_argument("--porta-sheets", type=int, default=8702)
+    parser.add_argument("--latencia-ms", type=int, default=0)
+    parser.add_argument("--prob-429", type=float, default=0.0)
+    args = parser.parse_args()
+
+    sellers = SyntheticSellers(args.clientes)
+    store = FakeSpreadsheetStore()
+    store.create("Histórico de Vendas Meli - 2024", ["Dados Consolidados v2"])
+    _, meli_url = start_server(make_meli_handler(sellers, FakeServiceConfig(args.latencia_ms, args.prob_429)), args.porta_meli)
+    _, sheets_url = start_server(make_sheets_handler(store, FakeServiceConfig(args.latencia_ms, args.prob_429)), args.porta_sheets)
+    print(f"Mercado Livre falso em {meli_url} | Sheets falso em {sheets_url}")
+    print(f"Exemplo: MELI_API_BASE_URL={meli_url}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
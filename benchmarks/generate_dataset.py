@@ -0,0 +1,252 @@
+"""
+Gerador de datasets sintéticos no formato das abas da planilha, para testes de carga do dashboard.
+
+Produz, para N clientes ao longo de X anos:
+  - Dados_Gerais            (diário numérico lido pelo dashboard)
+  - Dados Consolidados v2   (diário formatado como os coletores gravam: 'R$ 1,234.56', '12.34%')
+  - Dados_Horarios          (uma linha por pedido) ou Dados_Horarios_Agregados (uma linha por hora)
+  - Perfil_Horario          (grade 24x7 por cliente)
+
+Com sazonalidade semanal e anual (Black Friday, Natal, janeiro fraco), crescimento por cliente,
+clientes que entram no meio do histórico, dias zerados e outliers.
+
+Uso:
+    python benchmarks/generate_dataset.py --clientes 500 --anos 3 --saida /tmp/dataset
+    python benchmarks/generate_dataset.py --clientes 500 --anos 3 --saida /tmp/dataset --snapshots
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# --- Constantes ---
+DAILY_SHEET = "Dados_Gerais"
+CONSOLIDATED_SHEET = "Dados Consolidados v2"
+HOURLY_ORDER_SHEET = "Dados_Horarios"
+HOURLY_BUCKET_SHEET = "Dados_Horarios_Agregados"
+PROFILE_SHEET = "Perfil_Horario"
+
+WEEKDAY_FACTOR = np.array([1.05, 1.10, 1.05, 1.00, 0.95, 0.80, 0.75])
+MONTH_FACTOR = np.array([0.80, 0.85, 0.95, 0.95, 1.05, 1.00, 0.95, 1.00, 1.00, 1.05, 1.35, 1.30])
+# Distribuição dos pedidos ao longo do dia (pico no almoço e à noite)
+HOUR_WEIGHTS = np.array([1.2, 0.7, 0.4, 0.3, 0.3, 0.5, 1.0, 2.0, 3.2, 4.2, 4.8, 5.2,
+                         5.6, 5.4, 5.0, 4.8, 4.7, 4.8, 5.2, 5.8, 6.4, 6.6, 5.4, 3.0])
+HOUR_WEIGHTS = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+# --- Geração Diária ---
+
+def _black_friday(year):
+    """Última sexta-feira de novembro."""
+    last_day = pd.Timestamp(year=year, month=11, day=30)
+    return last_day - pd.Timedelta(days=(last_day.dayofweek - 4) % 7)
+
+def generate_daily(n_clients, years, seed=42, zero_day_rate=0.02, outlier_rate=0.003, end_date=None):
+    """
+    Linhas diárias (cliente, data, métricas) no formato numérico de Dados_Gerais.
+    Tudo vetorizado: o custo é proporcional ao número de linhas, não de clientes.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = pd.Timestamp(end_date or pd.Timestamp.today().normalize())
+    dates = pd.date_range(end=end_date, periods=int(years * 365), freq='D')
+    n_days = len(dates)
+
+    clients = np.array([f"CLIENTE_{i:04d}" for i in range(n_clients)])
+    base_orders = rng.lognormal(mean=2.8, sigma=1.0, size=n_clients)
+    growth = rng.normal(0.25, 0.2, size=n_clients)
+    ticket = rng.lognormal(mean=4.5, sigma=0.5, size=n_clients)
+    conversion = rng.uniform(0.015, 0.06, size=n_clients)
+    tacos = rng.uniform(0.03, 0.15, size=n_clients)
+    ads_share = rng.uniform(0.3, 0.7, size=n_clients)
+    # Um terço dos clientes entra depois do início do histórico
+    start_offset = np.where(rng.random(n_clients) < 0.33, rng.integers(0, max(n_days - 30, 1), size=n_clients), 0)
+
+    client_idx = np.repeat(np.arange(n_clients), n_days)
+    day_idx = np.tile(np.arange(n_days), n_clients)
+    keep = day_idx >= start_offset[client_idx]
+    client_idx, day_idx = client_idx[keep], day_idx[keep]
+    day_dates = dates[day_idx]
+
+    # Fatores sazonais calculados por data e depois espalhados para as linhas
+    black_fridays = pd.DatetimeIndex([_black_friday(y) for y in range(dates[0].year, dates[-1].year + 1)])
+    days_to_bf = np.abs((dates.values[:, None] - black_fridays.values[None, :]) // np.timedelta64(1, 'D')).min(axis=1)
+    day_factor = WEEKDAY_FACTOR[dates.dayofweek] * MONTH_FACTOR[dates.month - 1]
+    day_factor *= np.where(days_to_bf == 0, 4.0, np.where(days_to_bf <= 3, 1.8, 1.0))
+    seasonal = day_factor[day_idx]
+    trend = 1 + growth[client_idx] * (day_idx / max(n_days - 1, 1))
+
+    expected = base_orders[client_idx] * seasonal * trend
+    outliers = rng.random(len(expected)) < outlier_rate
+    expected = np.where(outliers, expected * rng.uniform(5, 20, size=len(expected)), expected)
+    orders = rng.poisson(expected)
+    orders = np.where(rng.random(len(orders)) < zero_day_rate, 0, orders)
+
+    units = orders + rng.poisson(orders * 0.3)
+    revenue = np.round(units * ticket[client_idx] * rng.gamma(20, 1 / 20, size=len(units)), 2)
+    visits = np.round(orders / conversion[client_idx] * rng.uniform(0.8, 1.2, size=len(orders))).astype(np.int64)
+    investment = np.round(revenue * tacos[client_idx] * rng.uniform(0.7, 1.3, size=len(revenue)) + rng.uniform(0, 5, size=len(revenue)), 2)
+    ads_revenue = revenue * ads_share[client_idx]
+    clicks = np.round(investment / rng.uniform(0.5, 2.0, size=len(investment))).astype(np.int64)
+    prints = np.round(clicks / rng.uniform(0.005, 0.03, size=len(clicks))).astype(np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df = pd.DataFrame({
+            "data": day_dates,
+            "cliente": clients[client_idx],
+            "faturamento": revenue,
+            "investimento": investment,
+            "quantidade_vendas": orders,
+            "unidades_vendidas": units,
+            "visitas": visits,
+            "clicks": clicks,
+            "prints": prints,
+            "acos": np.where(ads_revenue > 0, investment / ads_revenue, np.nan),
+            "tacos": np.where(revenue > 0, investment / revenue, np.nan),
+            "roi_media": np.where(investment > 0, ads_revenue / investment, np.nan),
+        })
+    return df
+
+def to_consolidated(df_daily):
+    """Formata as linhas diárias como a aba 'Dados Consolidados v2' gravada pelos coletores."""
+    def _money(values):
+        return ["R$ {:,.2f}".format(v) for v in values]
+
+    def _percent(values):
+        return [None if pd.isna(v) else f"{v * 100:.2f}%" for v in values]
+
+    investment, revenue = df_daily["investimento"].values, df_daily["faturamento"].values
+    ads_revenue = np.nan_to_num(df_daily["roi_media"].values) * investment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conversion = np.where(df_daily["visitas"] > 0, df_daily["quantidade_vendas"] / df_daily["visitas"], np.nan)
+        cpc = np.where(df_daily["clicks"] > 0, investment / df_daily["clicks"], np.nan)
+        ctr = np.where(df_daily["prints"] > 0, df_daily["clicks"] / df_daily["prints"], np.nan)
+    return pd.DataFrame({
+        "data_geracao": (df_daily["data"] + pd.Timedelta(hours=23, minutes=50)).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        "periodo_consulta": df_daily["data"].dt.strftime('%Y-%m-%d'),
+        "cliente": df_daily["cliente"].values,
+        "Faturamento": _money(revenue),
+        "Investimento": _money(investment),
+        "Quantidade de Vendas": df_daily["quantidade_vendas"].values,
+        "Unidades Vendidas": df_daily["unidades_vendidas"].values,
+        "Visitas": df_daily["visitas"].values,
+        "Taxa de Conversão Média": _percent(conversion),
+        "ACOS": _percent(df_daily["acos"].values),
+        "TACOS": _percent(df_daily["tacos"].values),
+        "ROAS": [None if pd.isna(v) else f"{v:.2f}" for v in df_daily["roi_media"].values],
+        "ROI Média": [None if pd.isna(v) else f"{v:.2f}" for v in df_daily["roi_media"].values],
+        "Vendas por Ads": _money(ads_revenue),
+        "Vendas sem Ads": _money(revenue - ads_revenue),
+        "Cliques": df_daily["clicks"].values,
+        "CPC": ["R$ {:,.2f}".format(v) if v > 0 else None for v in np.nan_to_num(cpc)],
+        "CTR": _percent(ctr),
+        "Impressões": df_daily["prints"].values,
+    })
+
+# --- Geração Horária ---
+
+def generate_hourly_orders(df_daily, seed=43):
+    """Uma linha por pedido (data_hora, quantidade_vendas, faturamento, cliente), como em Dados_Horarios."""
+    rng = np.random.default_rng(seed)
+    orders = df_daily["quantidade_vendas"].values.astype(np.int64)
+    row_idx = np.repeat(np.arange(len(df_daily)), orders)
+    hours = rng.choice(24, size=len(row_idx), p=HOUR_WEIGHTS)
+    seconds = rng.integers(0, 3600, size=len(row_idx))
+    timestamps = df_daily["data"].values[row_idx] + (hours * 3600 + seconds).astype('timedelta64[s]')
+
+    avg_units = np.divide(df_daily["unidades_vendidas"].values, orders, out=np.ones(len(orders)), where=orders > 0)
+    avg_ticket = np.divide(df_daily["faturamento"].values, orders, out=np.zeros(len(orders)), where=orders > 0)
+    units = np.maximum(1, rng.poisson(avg_units[row_idx]))
+    revenue = np.round(avg_ticket[row_idx] * rng.gamma(8, 1 / 8, size=len(row_idx)), 2)
+    df = pd.DataFrame({
+        "data_hora": pd.to_datetime(timestamps).strftime('%Y-%m-%d %H:%M:%S'),
+        "quantidade_vendas": units,
+        "faturamento": revenue,
+        "cliente": df_daily["cliente"].values[row_idx],
+    })
+    return df.sort_values(["cliente", "data_hora"], kind="stable").reset_index(drop=True)
+
+def to_hourly_buckets(df_orders):
+    """Agrega as linhas por pedido em (cliente, hora), no formato de Dados_Horarios_Agregados."""
+    df = df_orders.assign(data_hora=pd.to_datetime(df_orders["data_hora"]).dt.floor('h'), pedidos=1)
+    df = df.groupby(["cliente", "data_hora"], as_index=False)[["pedidos", "quantidade_vendas", "faturamento"]].sum()
+    df["data_hora"] = df["data_hora"].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df[["data_hora", "pedidos", "quantidade_vendas", "faturamento", "cliente"]]
+
+def to_hourly_profile(df_orders):
+    """Grade 24x7 por cliente, no formato de Perfil_Horario."""
+    ts = pd.to_datetime(df_orders["data_hora"])
+    df = pd.DataFrame({
+        "cliente": df_orders["cliente"].values, "dia_semana": ts.dt.dayofweek.values, "hora": ts.dt.hour.values,
+        "pedidos": 1, "unidades": df_orders["quantidade_vendas"].values, "faturamento": df_orders["faturamento"].values,
+    })
+    return df.groupby(["cliente", "dia_semana", "hora"], as_index=False)[["pedidos", "unidades", "faturamento"]].sum()
+
+# --- Saída ---
+
+def generate_all(n_clients, years, hourly="hora", seed=42):
+    """Gera todas as abas. hourly: 'pedido', 'hora' ou 'nenhum'."""
+    datasets = {}
+    df_daily = generate_daily(n_clients, years, seed=seed)
+    datasets[DAILY_SHEET] = df_daily
+    datasets[CONSOLIDATED_SHEET] = to_consolidated(df_daily)
+    if hourly != "nenhum":
+        df_orders = generate_hourly_orders(df_daily, seed=seed + 1)
+        datasets[PROFILE_SHEET] = to_hourly_profile(df_orders)
+        if hourly == "pedido":
+            datasets[HOURLY_ORDER_SHEET] = df_orders
+        else:
+            datasets[HOURLY_BUCKET_SHEET] = to_hourly_buckets(df_orders)
+    return datasets
+
+def as_sheet_strings(df):
+    """Simula o que o gsheetsdb devolve: todas as células como texto, vazias como ''."""
+    return df.astype(object).where(df.notna(), "").astype(str)
+
+def save_datasets(datasets, output_dir, fmt="csv"):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for name, df in datasets.items():
+        extension = "csv" if fmt == "csv" else "arrow"
+        path = os.path.join(output_dir, f"{name}.{extension}")
+        if fmt == "csv":
+            df.to_csv(path, index=False)
+        else:
+            df.reset_index(drop=True).to_feather(path)
+        paths[name] = path
+    return paths
+
+def save_snapshots(datasets):
+    """Publica os datasets como snapshots do dashboard (utils.SNAPSHOT_DIR), para rodar o Streamlit contra eles."""
+    from utils import write_snapshot, clean_data, _snapshot_path
+    for name, df in datasets.items():
+        write_snapshot(clean_data(as_sheet_strings(df)), _snapshot_path(name))
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera datasets sintéticos no formato das abas da planilha.")
+    parser.add_argument("--clientes", type=int, default=500)
+    parser.add_argument("--anos", type=float, default=3)
+    parser.add_argument("--horario", choices=["pedido", "hora", "nenhum"], default="hora",
+                        help="Granularidade horária: uma linha por pedido, por hora, ou não gerar.")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", default="dataset_sintetico", help="Diretório de saída.")
+    parser.add_argument("--formato", choices=["csv", "arrow"], default="arrow")
+    parser.add_argument("--snapshots", action="store_true", help="Também grava os snapshots em .cache/snapshots do diretório atual.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    datasets = generate_all(args.clientes, args.anos, args.horario, args.semente)
+    for name, df in datasets.items():
+        print(f"{name}: {len(df):,} linhas, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB em memória")
+    paths = save_datasets(datasets, args.saida, args.formato)
+    if args.snapshots:
+        save_snapshots(datasets)
+    print(f"Gerado em {time.perf_counter() - started:.1f}s: {', '.join(paths.values())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Bytes por pedido e tempo de decodificação por página de /orders/search, com e sem projeção de campos,
+usando json da biblioteca padrão e orjson (se instalado).
+
+As páginas vêm dos vendedores sintéticos de fake_services.py; com --http, as páginas são baixadas
+do servidor local (inclui transferência e montagem da resposta).
+
+Uso:
+    python benchmarks/payload_benchmark.py --paginas 200
+    python benchmarks/payload_benchmark.py --paginas 50 --http --latencia-ms 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_services import SyntheticSellers, FakeServiceConfig, make_meli_handler, start_server
+from order_pipeline import ORDER_ATTRIBUTES, ORDER_FIELDS, ORDERS_PAGE_LIMIT, compact_order
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Páginas Sintéticas ---
+
+def build_pages(n_pages, limit=ORDERS_PAGE_LIMIT):
+    """Páginas completas de /orders/search, tiradas de um vendedor de alto volume."""
+    sellers = SyntheticSellers(1, mean_orders_per_day=400)
+    seller = sellers.sellers[0]
+    orders, day = [], 0
+    while len(orders) < n_pages * limit:
+        orders.extend(sellers.orders_for_day(seller, f"2024-03-{(day % 28) + 1:02d}"))
+        day += 1
+    return [{"query": "", "results": orders[i * limit:(i + 1) * limit], "paging": {"total": len(orders), "offset": i * limit, "limit": limit}}
+            for i in range(n_pages)]
+
+def project_page(page):
+    """O que a API devolve com attributes=ORDER_ATTRIBUTES."""
+    return {"results": [{f: o[f] for f in ORDER_FIELDS if f in o} for o in page["results"]], "paging": page["paging"]}
+
+# --- Medição ---
+
+def decode_stats(bodies, loads, n_orders):
+    started = time.perf_counter()
+    for body in bodies:
+        loads(body)
+    decode_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for body in bodies:
+        [compact_order(o) for o in loads(body)["results"]]
+    decode_compact_s = time.perf_counter() - started
+    return {
+        "decode_ms_por_pagina": round(decode_s / len(bodies) * 1000, 3),
+        "decode_compactar_ms_por_pagina": round(decode_compact_s / len(bodies) * 1000, 3),
+        "decode_us_por_pedido": round(decode_s / n_orders * 1e6, 2),
+    }
+
+def offline_benchmark(n_pages):
+    pages = build_pages(n_pages)
+    n_orders = sum(len(p["results"]) for p in pages)
+    variants = {"completo": [json.dumps(p).encode() for p in pages],
+                "projetado": [json.dumps(project_page(p)).encode() for p in pages]}
+    parsers = {"json": json.loads}
+    if orjson is not None:
+        parsers["orjson"] = orjson.loads
+
+    report = {"paginas": n_pages, "pedidos": n_orders, "variantes": {}}
+    for variant, bodies in variants.items():
+        total_bytes = sum(len(b) for b in bodies)
+        entry = {"bytes_por_pedido": round(total_bytes / n_orders, 1), "bytes_por_pagina": round(total_bytes / n_pages)}
+        for parser_name, loads in parsers.items():
+            entry[parser_name] = decode_stats(bodies, loads, n_orders)
+        report["variantes"][variant] = entry
+    return report
+
+def http_benchmark(n_pages, latency_ms):
+    """Baixa as mesmas páginas do servidor local, com e sem o parâmetro attributes."""
+    import requests
+    sellers = SyntheticSellers(1, mean_orders_per_day=400)
+    config = FakeServiceConfig(latency_ms=latency_ms)
+    server, base_url = start_server(make_meli_handler(sellers, config))
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer token-{sellers.sellers[0]['app_id']}"
+    loads = orjson.loads if orjson is not None else json.loads
+
+    report = {}
+    for variant, extra in {"completo": {}, "projetado": {"attributes": ORDER_ATTRIBUTES}}.items():
+        fetched, total_bytes, orders = 0, 0, 0
+        started = time.perf_counter()
+        day = 0
+        while fetched < n_pages:
+            offset = 0
+            while fetched < n_pages:
+                params = {"seller": sellers.sellers[0]["user_id"], "order.date_created.from": f"2024-03-{(day % 28) + 1:02d}T00:00:00.000-03:00",
+                          "sort": "date_asc", "offset": offset, "limit": ORDERS_PAGE_LIMIT, **extra}
+                response = session.get(f"{base_url}/orders/search", params=params)
+                data = loads(response.content)
+                fetched += 1
+                total_bytes += len(response.content)
+                orders += len(data["results"])
+                offset += ORDERS_PAGE_LIMIT
+                if offset >= data["paging"]["total"]:
+                    break
+            day += 1
+        elapsed = time.perf_counter() - started
+        report[variant] = {"ms_por_pagina": round(elapsed / fetched * 1000, 2), "bytes_por_pedido": round(total_bytes / max(orders, 1), 1)}
+    server.shutdown()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de payload e decodificação de /orders/search.")
+    parser.add_argument("--paginas", type=int, default=200)
+    parser.add_argument("--http", action="store_true", help="Também mede o download pelo servidor local.")
+    parser.add_argument("--latencia-ms", type=int, default=0)
+    parser.add_argument("--saida", help="Arquivo JSON para o relatório.")
+    args = parser.parse_args()
+
+    report = {"orjson_instalado": orjson is not None, "offline": offline_benchmark(args.paginas)}
+    if args.http:
+        report["http"] = http_benchmark(args.paginas, args.latencia_ms)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark ponta a ponta dos coletores contra os servidores locais de fake_services.py.
+
+Executa daily_collector, historical_data_run_v2 e realtime_update com 7, 100 ou 1000 clientes
+sintéticos e reporta tempo de parede, requisições por endpoint (Mercado Livre e Sheets) e o tempo
+de espera solicitado via time.sleep (backoff e pausas entre clientes).
+
+Uso:
+    python benchmarks/run_benchmark.py --clientes 100 --dias-historico 7 --latencia-ms 30
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from fake_services import (
+    SyntheticSellers, FakeSpreadsheetStore, FakeServiceConfig,
+    make_meli_handler, make_sheets_handler, start_server,
+)
+
+# --- Constantes ---
+SPREADSHEET_TITLE = "Histórico de Vendas Meli - 2024"
+CONSOLIDATED_HEADER = [
+    "data_geracao", "periodo_consulta", "cliente",
+    "Faturamento", "Investimento", "Quantidade de Vendas", "Unidades Vendidas", "Visitas",
+    "Taxa de Conversão Média", "ACOS", "TACOS", "ROAS", "ROI Média",
+    "Vendas por Ads", "Vendas sem Ads", "Cliques", "CPC", "CTR", "Impressões"
+]
+SCRIPTS = ["daily_collector", "historical_data_run_v2", "realtime_update"]
+GOOGLE_PREFIXES = ["https://sheets.googleapis.com", "https://www.googleapis.com"]
+
+# --- Redirecionamento do gspread ---
+
+class RedirectAdapter(HTTPAdapter):
+    """Reescreve as URLs do Google para o servidor local antes de enviar."""
+    def __init__(self, prefix, target):
+        super().__init__()
+        self.prefix = prefix
+        self.target = target
+
+    def send(self, request, **kwargs):
+        request.url = self.target + request.url[len(self.prefix):]
+        return super().send(request, **kwargs)
+
+def make_fake_gspread_client(sheets_url):
+    import gspread
+    from google.oauth2.credentials import Credentials as UserCredentials
+    session = requests.Session()
+    for prefix in GOOGLE_PREFIXES:
+        session.mount(prefix, RedirectAdapter(prefix, sheets_url))
+    return gspread.Client(auth=UserCredentials(token="fake"), session=session)
+
+class SleepRecorder:
+    """Substitui time.sleep: soma o tempo solicitado e dorme apenas uma fração dele."""
+    def __init__(self, scale):
+        self.scale = scale
+        self.requested = 0.0
+        self.calls = 0
+        self._real_sleep = time.sleep
+
+    def __call__(self, seconds):
+        self.requested += seconds
+        self.calls += 1
+        if self.scale:
+            self._real_sleep(seconds * self.scale)
+
+# --- Execução ---
+
+def run_script(module_name, meli_config, sheets_config):
+    module = __import__(module_name)
+    meli_before, sheets_before = meli_config.stats()["requisicoes"], sheets_config.stats()["requisicoes"]
+    started = time.perf_counter()
+    module.main()
+    elapsed = time.perf_counter() - started
+
+    def _delta(after, before):
+        return {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0)}
+
+    return {
+        "tempo_s": round(elapsed, 3),
+        "meli": _delta(meli_config.stats()["requisicoes"], meli_before),
+        "sheets": _delta(sheets_config.stats()["requisicoes"], sheets_before),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta com Mercado Livre e Sheets locais.")
+    parser.add_argument("--clientes", type=int, choices=[7, 100, 1000], default=7)
+    parser.add_argument("--dias-historico", type=int, default=3, help="Janela do backfill histórico (start_date no CSV).")
+    parser.add_argument("--latencia-ms", type=int, default=0, help="Latência artificial por requisição.")
+    parser.add_argument("--prob-429", type=float, default=0.0, help="Probabilidade de resposta 429 por requisição.")
+    parser.add_argument("--escala-sleep", type=float, default=0.0, help="Fração do time.sleep solicitado que é de fato dormida.")
+    parser.add_argument("--scripts", nargs="+", choices=SCRIPTS, default=SCRIPTS)
+    parser.add_argument("--saida", help="Arquivo JSON para o relatório (padrão: apenas stdout).")
+    args = parser.parse_args()
+    if args.saida:
+        args.saida = os.path.abspath(args.saida)
+
+    sellers = SyntheticSellers(args.clientes)
+    store = FakeSpreadsheetStore()
+    spreadsheet_id = store.create(SPREADSHEET_TITLE, ["Dados Consolidados v2"])
+    store.spreadsheets[spreadsheet_id]["sheets"]["Dados Consolidados v2"]["rows"].append(list(CONSOLIDATED_HEADER))
+
+    meli_config = FakeServiceConfig(args.latencia_ms, args.prob_429)
+    sheets_config = FakeServiceConfig(args.latencia_ms, args.prob_429)
+    meli_server, meli_url = start_server(make_meli_handler(sellers, meli_config))
+    sheets_server, sheets_url = start_server(make_sheets_handler(store, sheets_config))
+
+    start_date = (datetime.now() - timedelta(days=args.dias_historico)).strftime('%Y-%m-%d')
+    os.environ["MELI_API_BASE_URL"] = meli_url
+    os.environ["MELI_CLIENTS_CSV"] = sellers.clients_csv(start_date)
+    os.environ["GOOGLE_CREDENTIALS"] = '[google_credentials]\ntype = "service_account"\n'
+
+    # Diretório temporário: sem .streamlit/secrets.toml, os scripts leem as variáveis de ambiente,
+    # e ledger/estado gravados pelo histórico não poluem o repositório.
+    workdir = tempfile.mkdtemp(prefix="meli-bench-")
+    os.chdir(workdir)
+    sleep_recorder = SleepRecorder(args.escala_sleep)
+    fake_client = make_fake_gspread_client(sheets_url)
+
+    report = {"clientes": args.clientes, "dias_historico": args.dias_historico, "latencia_ms": args.latencia_ms,
+              "prob_429": args.prob_429, "diretorio_trabalho": workdir, "scripts": {}}
+    with mock.patch("gspread.authorize", return_value=fake_client), \
+         mock.patch("google.oauth2.service_account.Credentials.from_service_account_info", return_value=None), \
+         mock.patch("time.sleep", sleep_recorder):
+        for script in args.scripts:
+            sleep_before, calls_before = sleep_recorder.requested, sleep_recorder.calls
+            result = run_script(script, meli_config, sheets_config)
+            result["sleep_solicitado_s"] = round(sleep_recorder.requested - sleep_before, 2)
+            result["chamadas_sleep"] = sleep_recorder.calls - calls_before
+            report["scripts"][script] = result
+
+    report["totais"] = {"meli": meli_config.stats(), "sheets": sheets_config.stats()}
+    report["linhas_planilha"] = {title: len(sheet["rows"]) for title, sheet in store.spreadsheets[spreadsheet_id]["sheets"].items()}
+    meli_server.shutdown()
+    sheets_server.shutdown()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
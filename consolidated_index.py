@@ -0,0 +1,237 @@
+import re
+import logging
+
+import pandas as pd
+import gspread
+from gspread.utils import rowcol_to_a1
+
+from telemetry import telemetry
+from partitions import PartitionCatalog
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+KEY_COLUMNS = ['periodo_consulta', 'cliente']
+ROW_RANGES_PER_REQUEST = 200  # intervalos por chamada de values.batchGet (limite prático da URL)
+FULL_READ_FRACTION = 0.3  # acima dessa fração das linhas, uma leitura da aba inteira sai mais barata
+
+def _column_letter(position):
+    """Letra da coluna (1 = A)."""
+    return re.sub(r"\d+", "", rowcol_to_a1(1, position))
+
+def _contiguous_runs(row_numbers):
+    """Agrupa números de linha ordenados em intervalos contíguos [(início, fim)]."""
+    runs = []
+    for number in row_numbers:
+        if runs and number == runs[-1][1] + 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return [tuple(run) for run in runs]
+
+# --- Índice das Chaves da Aba Consolidada ---
+
+class ConsolidatedSheetIndex:
+    """
+    Índice da aba consolidada para o upsert: o cabeçalho e só as colunas-chave (lidas como
+    intervalos de coluna), com o número da linha de cada chave e as linhas de cada cliente.
+    Linhas completas são baixadas sob demanda: as que casam com uma chave no merge e as dos
+    clientes tocados, para os rollups. Substitui o get_all_records da aba inteira na partida.
+    """
+    def __init__(self, worksheet, key_cols=KEY_COLUMNS):
+        self.worksheet = worksheet
+        self.key_cols = list(key_cols)
+        self.load()
+
+    def load(self):
+        self.header = self.worksheet.row_values(1)
+        self.rows = {}  # chave -> número da linha (a primeira ocorrência prevalece, como no cache antigo)
+        self.client_rows = {}  # cliente -> números de linha
+        self.row_cache = {}  # número da linha -> valores já baixados ou escritos nesta execução
+        self.last_row = 1
+        if not self.header:
+            return
+        missing = [col for col in self.key_cols if col not in self.header]
+        if missing:
+            logger.warning(f"Colunas-chave {missing} ausentes na aba '{self.worksheet.title}'. Índice vazio.")
+            return
+
+        letters = [_column_letter(self.header.index(col) + 1) for col in self.key_cols]
+        columns = [[row[0] if row else "" for row in value_range]
+                   for value_range in self.worksheet.batch_get([f"{letter}2:{letter}" for letter in letters])]
+        total = max((len(col) for col in columns), default=0)
+        for offset in range(total):
+            key = tuple(str(col[offset]) if offset < len(col) else "" for col in columns)
+            if all(key):
+                self._register(key, offset + 2)
+        self.last_row = total + 1
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def columns(self):
+        return list(self.header)
+
+    def _register(self, key, row_number):
+        if key in self.rows:
+            return
+        self.rows[key] = row_number
+        self.client_rows.setdefault(key[self.key_cols.index('cliente')], []).append(row_number)
+        self.last_row = max(self.last_row, row_number)
+
+    def find(self, key):
+        return self.rows.get(tuple(str(v) for v in key))
+
+    def fetch_rows(self, row_numbers):
+        """
+        Valores completos das linhas pedidas. Linhas contíguas viram um só intervalo, em lotes por chamada;
+        se faltar boa parte da aba, ela é lida de uma vez.
+        """
+        missing = sorted(set(row_numbers) - set(self.row_cache))
+        if missing and len(missing) > FULL_READ_FRACTION * max(self.last_row - 1, 1):
+            for row_number, row in enumerate(self.worksheet.get_all_values()[1:], start=2):
+                self.row_cache[row_number] = row
+        elif missing:
+            last_letter = _column_letter(max(len(self.header), 1))
+            runs = _contiguous_runs(missing)
+            for start in range(0, len(runs), ROW_RANGES_PER_REQUEST):
+                chunk = runs[start:start + ROW_RANGES_PER_REQUEST]
+                value_ranges = self.worksheet.batch_get([f"A{first}:{last_letter}{last}" for first, last in chunk])
+                for (first, last), value_range in zip(chunk, value_ranges):
+                    for offset in range(last - first + 1):
+                        self.row_cache[first + offset] = list(value_range[offset]) if offset < len(value_range) else []
+        return {row_number: self.row_cache.get(row_number, []) for row_number in row_numbers}
+
+    def record_row(self, row_number, values, key):
+        self.row_cache[row_number] = list(values)
+        self._register(tuple(str(v) for v in key), row_number)
+
+    def record_appended(self, rows, keys, response):
+        """Registra as linhas adicionadas, pela faixa devolvida pelo append (ou após a última linha conhecida)."""
+        updated_range = ((response or {}).get("updates") or {}).get("updatedRange", "")
+        match = re.search(r"![A-Z]+(\d+)", updated_range)
+        first_row = int(match.group(1)) if match else self.last_row + 1
+        for offset, (values, key) in enumerate(zip(rows, keys)):
+            self.record_row(first_row + offset, values, key)
+
+    def frame_for_clients(self, clients):
+        """DataFrame (colunas do cabeçalho) com todas as linhas dos clientes, para recalcular os rollups."""
+        row_numbers = sorted({n for client in clients for n in self.client_rows.get(str(client), [])})
+        rows = self.fetch_rows(row_numbers)
+        width = len(self.header)
+        data = [(rows[n] + [""] * width)[:width] for n in row_numbers]
+        return pd.DataFrame(data, columns=self.header)
+
+class PartitionedSheetIndex:
+    """
+    Índice de uma base particionada por período (ver partitions.py): um ConsolidatedSheetIndex por partição,
+    carregado só quando a partição é escrita ou lida. O upsert toca apenas a partição da data de cada linha.
+    """
+    def __init__(self, catalog, base, key_cols=KEY_COLUMNS):
+        self.catalog = catalog
+        self.base = base
+        self.key_cols = list(key_cols)
+        self.indexes = {}
+        self.header = catalog.base_header(base)
+
+    def load(self):
+        """Relê o catálogo e descarta os índices das partições (recarregados sob demanda)."""
+        self.catalog.load()
+        self.indexes = {}
+        self.header = self.catalog.base_header(self.base)
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes.values())
+
+    @property
+    def columns(self):
+        return list(self.header)
+
+    def index_for(self, date_str):
+        worksheet = self.catalog.worksheet_for(self.base, date_str, self.header or None)
+        if worksheet.title not in self.indexes:
+            self.indexes[worksheet.title] = ConsolidatedSheetIndex(worksheet, self.key_cols)
+        return self.indexes[worksheet.title]
+
+    def frame_for_clients(self, clients):
+        """Linhas dos clientes em todas as partições (os rollups por dia da semana dependem do histórico inteiro)."""
+        frames = []
+        for title in self.catalog.titles_between(self.base):
+            if title not in self.indexes:
+                self.indexes[title] = ConsolidatedSheetIndex(self.catalog.spreadsheet.worksheet(title), self.key_cols)
+            frames.append(self.indexes[title].frame_for_clients(clients))
+        frames = [frame for frame in frames if not frame.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.header)
+
+def open_sheet_index(spreadsheet, worksheet):
+    """Índice da aba: por partição se a base estiver no catálogo de partições, senão da aba única."""
+    catalog = PartitionCatalog(spreadsheet)
+    if catalog.is_partitioned(worksheet.title):
+        return PartitionedSheetIndex(catalog, worksheet.title)
+    return ConsolidatedSheetIndex(worksheet)
+
+# --- Upsert pela Chave ---
+
+def update_or_append_rows(df_new, worksheet, sheet_index, key_cols=KEY_COLUMNS):
+    """
+    Atualiza em lote as linhas cujas chaves já existem (mesclando os valores não vazios sobre a linha atual,
+    baixada só agora) e adiciona as novas. Numa base particionada, `worksheet` é ignorada e cada linha
+    vai para a partição da sua data (primeira coluna-chave). Retorna o índice atualizado.
+    """
+    if isinstance(sheet_index, PartitionedSheetIndex):
+        # Cada linha vai para a partição do seu período; só as partições tocadas são carregadas
+        for date_str, df_part in df_new.groupby(df_new[key_cols[0]].astype(str).str[:10], sort=False):
+            partition_index = sheet_index.index_for(date_str)
+            update_or_append_rows(df_part.copy(), partition_index.worksheet, partition_index, key_cols)
+        return sheet_index
+
+    logger.info(f"Iniciando atualização em lote da aba '{worksheet.title}' com {len(df_new)} novas linhas.")
+    for col in key_cols:
+        if col in df_new.columns: df_new[col] = df_new[col].astype(str)
+    header = sheet_index.header
+    if not header:
+        try:
+            header = df_new.columns.tolist()
+            worksheet.update([header], value_input_option='USER_ENTERED')
+            sheet_index.header = header
+        except gspread.exceptions.APIError as e:
+            logger.error(f"ERRO DE API ao escrever o cabeçalho de '{worksheet.title}'. Pausando por 60s. Erro: {e}")
+            telemetry.sleep(60, "cota_sheets"); raise e
+
+    new_rows = [(tuple(str(new_row[col]) for col in key_cols), new_row) for _, new_row in df_new.iterrows()]
+    matches = {key: sheet_index.find(key) for key, _ in new_rows}
+    try:
+        existing_rows = sheet_index.fetch_rows([n for n in matches.values() if n])
+    except gspread.exceptions.APIError as e:
+        logger.error(f"ERRO DE API ao ler as linhas existentes de '{worksheet.title}'. Pausando por 60s. Erro: {e}")
+        telemetry.sleep(60, "cota_sheets"); raise e
+
+    updates_to_batch, rows_to_append, appended_keys, updated_rows = [], [], [], []
+    for key, new_row in new_rows:
+        row_number = matches[key]
+        if row_number:
+            existing_row_dict = dict(zip(header, existing_rows[row_number]))
+            for col, value in new_row.items():
+                if pd.notna(value) and str(value).strip() not in ["", "N/A"]: existing_row_dict[col] = value
+            final_row_values = [existing_row_dict.get(col, "") for col in header]
+            updates_to_batch.append({'range': f'A{row_number}', 'values': [final_row_values]})
+            updated_rows.append((row_number, final_row_values, key))
+        else:
+            df_aligned = pd.DataFrame([new_row]).reindex(columns=header)
+            rows_to_append.extend(df_aligned.fillna("").values.tolist())
+            appended_keys.append(key)
+    try:
+        if updates_to_batch:
+            worksheet.batch_update(updates_to_batch, value_input_option='USER_ENTERED')
+            for row_number, values, key in updated_rows:
+                sheet_index.record_row(row_number, values, key)
+            logger.info(f"SUCESSO: {len(updates_to_batch)} linhas atualizadas em lote.")
+        if rows_to_append:
+            response = worksheet.append_rows(rows_to_append, value_input_option='USER_ENTERED')
+            sheet_index.record_appended(rows_to_append, appended_keys, response)
+            logger.info(f"SUCESSO: {len(rows_to_append)} novas linhas adicionadas.")
+    except gspread.exceptions.APIError as e:
+        logger.error(f"ERRO DE API ao escrever em lote. Pausando por 60s. Erro: {e}")
+        telemetry.sleep(60, "cota_sheets"); raise e
+    return sheet_index
@@ -1,15 +1,27 @@
 import pandas as pd
-import requests
-import gspread
 import time
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import logging
-from google.oauth2.service_account import Credentials
-import os
-from io import StringIO
-import toml
-import json
+import signal
+import threading
+from order_pipeline import ItemSalesSink, HourlyRowsSink
+from items import ItemMetadataCache, fetch_item_metadata, build_item_rows, write_item_rows
+from rollups import refresh_rollups
+from consolidated_index import update_or_append_rows
+from telemetry import telemetry
+from preflight import ClientIdCache, get_fresh_client
+from meli_collector import (
+    get_new_access_token, MercadoLivreAdsCollector, load_clients_and_credentials, open_consolidated_sheet,
+    prepare_client, prepare_all_clients, build_consolidated_row,
+)
+from scheduling import ClientRunHistory, RunDeadline, COLLECTOR_MAX_WORKERS, REALTIME_DEADLINE_MINUTES
+from anomalies import RealtimeBaseline, partial_metrics, write_alerts
+from pacing import PacingCurves, refresh_curves_from_sheet, build_projection_row, write_projections
+from hourly_profile import HourlyProfile, ProfileMergeLog
+from hourly_output import write_hourly_day
+from partitions import PartitionCatalog
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse # <-- 1. Importado para lidar com argumentos de linha de comando
 
 # --- Configuração do Logging ---
@@ -18,187 +30,261 @@ logger = logging.getLogger(__name__)
 
 # --- Constantes e Configurações ---
 # O STATE_FILE foi removido, pois a lógica agora é determinística (hoje ou ontem)
-API_TIMEOUT = 60
-MAX_RETRIES = 3
-
-# --- Funções de Autenticação ---
-# As funções de estado (load_state, save_state) foram removidas
-def get_new_access_token(client_info):
-    url = "https://api.mercadolibre.com/oauth/token"
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    data = {
-        "grant_type": "refresh_token", "client_id": client_info["app_id"],
-        "client_secret": client_info["client_secret"], "refresh_token": client_info["refresh_token"]
-    }
-    try:
-        response = requests.post(url, headers=headers, data=data, timeout=API_TIMEOUT)
-        response.raise_for_status()
-        logger.info("Access Token renovado com sucesso.")
-        return response.json()["access_token"]
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao renovar o Access Token: {e.response.json() if e.response else e}")
-        return None
-
-# --- Módulo de Coleta de Dados ---
-class MercadoLivreAdsCollector:
-    def __init__(self, access_token):
-        self.access_token = access_token
-        self.base_url = "https://api.mercadolibre.com"
-        self.session = requests.Session()
-        self.session.headers.update({"Authorization": f"Bearer {self.access_token}"})
-
-    def _make_request(self, url, params=None, headers=None):
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = self.session.get(url, params=params, headers=headers, timeout=API_TIMEOUT)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                logger.warning(f"Tentativa {attempt + 1}/{MAX_RETRIES} falhou para {url}. Erro: {e}")
-                if attempt + 1 == MAX_RETRIES:
-                    logger.error("Número máximo de retentativas atingido.")
-                    raise
-                time.sleep(5 * (attempt + 1))
-        return None
-
-    def get_user_id(self):
+# Modo daemon: mesmos horários do workflow agendado (tempo real a cada 2h, D-1 às 05:00 UTC)
+REALTIME_INTERVAL_HOURS = 2
+D1_HOUR_UTC = 5
+SHEET_CACHE_MAX_AGE_SECONDS = 6 * 60 * 60
+RUN_HISTORY_KIND = "daily_collector"
+
+# --- Coleta do Dia ---
+
+def collect_client_day(client_info, date_str, get_prepared_client, hourly_output=False):
+    """
+    Parte da coleta que só fala com o Mercado Livre (roda nos workers do pool).
+    Retorna dict com a linha consolidada, as vendas por item e o tempo gasto, ou None se o cliente falhar.
+    Com `hourly_output` (dia completo), a mesma passada pelos pedidos gera as linhas horárias e o perfil do cliente.
+    """
+    client_name = client_info["client_name"]
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    started = time.time()
+    with telemetry.client_timer(client_name):
+        logger.info(f"\n{'='*50}\n--- Processando cliente: {client_name} para a data {date_str} ---\n{'='*50}")
+
+        prepared_client = get_prepared_client(client_info)
+        if not prepared_client: return None
+        collector, user_id, advertiser_id, client_name_from_api = prepared_client
+
         try:
-            data = self._make_request(f"{self.base_url}/users/me")
-            return data.get('id') if data else None
+            item_sink = ItemSalesSink(date_str, brasil_timezone)
+            # Um perfil por cliente: cada worker só escreve no seu, e a thread principal o grava
+            hourly_sink = HourlyRowsSink(client_name, HourlyProfile(brasil_timezone)) if hourly_output else None
+            extra_sinks = [item_sink] + ([hourly_sink] if hourly_sink else [])
+            business_metrics = collector.get_business_metrics(seller_id=user_id, date_str=date_str, extra_sinks=extra_sinks)
+            ads_metrics = collector.get_ads_summary_metrics(advertiser_id, date_str) if advertiser_id else {}
+            final_data = build_consolidated_row(business_metrics, ads_metrics, date_str, client_name_from_api, brasil_timezone)
+            telemetry.sleep(1.5, "pausa_entre_clientes")
         except Exception as e:
-            logger.error(f"Não foi possível obter o ID do usuário: {e}")
+            logger.error(f"ERRO IRRECUPERÁVEL ao processar o dia {date_str} para {client_name}. O script continuará para o próximo cliente. Erro: {e}", exc_info=True)
             return None
 
-    def get_business_metrics(self, seller_id, date_str):
-        logger.info(f"Iniciando coleta de métricas para {date_str}...")
-        brasil_timezone = ZoneInfo("America/Sao_Paulo")
-        target_date_object = datetime.strptime(date_str, '%Y-%m-%d').date()
-        date_from_str = f"{date_str}T00:00:00.000-03:00"
-        date_to_str = f"{date_str}T23:59:59.999-03:00"
-        
-        all_orders, offset, limit = [], 0, 50
-        
-        while True:
-            params = {
-                "seller": seller_id, "order.date_created.from": date_from_str,
-                "order.date_created.to": date_to_str, "sort": "date_desc",
-                "offset": offset, "limit": limit
-            }
-            logger.info(f"Buscando pedidos... Página com offset {offset}")
-            data = self._make_request(f"{self.base_url}/orders/search", params=params)
-            if not data:
-                raise Exception(f"Falha irrecuperável ao buscar página de pedidos com offset {offset}")
-            page_orders = data.get('results', [])
-            all_orders.extend(page_orders)
-            
-            paging = data.get('paging', {})
-            if (paging.get('offset', 0) + limit) >= paging.get('total', 0):
-                logger.info(f"Paginação concluída. Total de {len(all_orders)} pedidos recebidos da API.")
-                break
-            offset += limit
-
-        valid_orders = []
-        reasons_for_discard = {'wrong_date': 0, 'test_order': 0}
-
-        for order in all_orders:
-            order_date_obj = pd.to_datetime(order.get("date_created")).tz_convert(brasil_timezone)
-            if order_date_obj.date() != target_date_object:
-                reasons_for_discard['wrong_date'] += 1; continue
-            
-            if "test_order" in order.get("tags", []):
-                reasons_for_discard['test_order'] += 1; continue
-            
-            valid_orders.append(order)
-        
-        logger.info(f"Pedidos válidos para soma (após filtro de data e teste): {len(valid_orders)}.")
-        logger.info(f"Pedidos descartados: {reasons_for_discard}")
-
-        orders_metrics = {}
-        if valid_orders:
-            faturamento = sum(o.get('total_amount', 0) for o in valid_orders)
-            unidades_vendidas = sum(item.get('quantity', 0) for o in valid_orders for item in o.get('order_items', []))
-            orders_metrics = {"faturamento_bruto": faturamento, "unidades_vendidas": unidades_vendidas, "quantidade_vendas": len(valid_orders)}
-        
-        logger.info(f"-- Resumo do dia {date_str} -- Vendas: {orders_metrics.get('quantidade_vendas', 0)}, Unidades: {orders_metrics.get('unidades_vendidas', 0)}, Faturamento: R$ {orders_metrics.get('faturamento_bruto', 0):.2f}")
-        
-        visits_metrics = {}
+    return {
+        "cliente": client_name, "cliente_api": client_name_from_api, "collector": collector, "linha": final_data,
+        "itens": item_sink.result(), "pedidos": business_metrics.get("quantidade_vendas", 0), "duracao_s": time.time() - started,
+        "parciais": partial_metrics(business_metrics, ads_metrics), "horario": hourly_sink,
+    }
+
+def collect_day(date_str, clients_df, spreadsheet, worksheet_consolidado, consolidado_index, get_prepared_client=prepare_client,
+                item_cache=None, deadline=None, run_history=None, max_workers=COLLECTOR_MAX_WORKERS, baseline=None, pacing_curves=None,
+                hourly_output=False):
+    """
+    Coleta o dia para todos os clientes, grava a aba consolidada, a aba Itens e atualiza os rollups.
+    As chamadas ao Mercado Livre rodam num pool de workers, do cliente mais demorado para o mais rápido
+    (pelo histórico de execuções); as escritas no Sheets ficam na thread principal, uma por vez.
+    O enriquecimento dos itens é adiado quando `deadline` se esgota.
+    `get_prepared_client(client_info)` e `item_cache` permitem reaproveitar sessões, tokens e
+    metadados de itens entre ciclos (modo daemon).
+    Com `baseline` (só nas coletas em tempo real), os totais parciais são comparados com a
+    expectativa e os desvios vão para a aba de alertas; com `pacing_curves`, viram a projeção de fim de dia.
+    Com `hourly_output` (só na coleta D-1, com o dia completo), os mesmos pedidos alimentam a saída horária
+    agregada e o perfil horário (ver hourly_output.write_hourly_day): a exportação horária não os baixa de novo.
+    Retorna o índice atualizado da aba consolidada.
+    """
+    item_cache = item_cache if item_cache is not None else ItemMetadataCache()
+    deadline = deadline or RunDeadline()
+    run_history = run_history if run_history is not None else ClientRunHistory()
+    clients_by_name = {client_info["client_name"]: client_info for _, client_info in clients_df.iterrows()}
+    ordered_clients = run_history.order_longest_first(RUN_HISTORY_KIND, list(clients_by_name))
+    touched_keys = set()
+    item_rows, item_days = [], set()
+    alerts = []
+    projections = []
+    if pacing_curves is not None:
         try:
-            visits_data = self._make_request(f"https://api.mercadolibre.com/users/{seller_id}/items_visits", params={"date_from": date_str, "date_to": date_str})
-            if visits_data: visits_metrics = {"visitas": visits_data.get("total_visits", 0)}
+            refresh_curves_from_sheet(pacing_curves, spreadsheet)
         except Exception as e:
-            logger.error(f"Falha ao buscar visitas para o dia {date_str}: {e}")
+            logger.error(f"Falha ao reconstruir as curvas de ritmo. Usando as curvas em cache, se houver: {e}")
+    if hourly_output:
+        catalog = PartitionCatalog(spreadsheet)
+        profile_merge_log = ProfileMergeLog(spreadsheet)
 
-        return {**orders_metrics, **visits_metrics}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(collect_client_day, clients_by_name[name], date_str, get_prepared_client, hourly_output) for name in ordered_clients]
+        for future in as_completed(futures):
+            result = future.result()
+            if not result: continue
+            client_name, client_name_from_api, collector = result["cliente"], result["cliente_api"], result["collector"]
+            run_history.record(RUN_HISTORY_KIND, client_name, result["duracao_s"], result["pedidos"])
 
-    def get_ads_summary_metrics(self, advertiser_id, date_str):
-        params = {"date_from": date_str, "date_to": date_str, "metrics_summary": "true", "metrics": "cost,acos,direct_amount,indirect_amount,total_amount,clicks,prints"}
-        try:
-            data = self._make_request(f"{self.base_url}/advertising/advertisers/{advertiser_id}/product_ads/campaigns", params=params, headers={"Api-Version": "2"})
-            return data.get("metrics_summary", {}) if data else {}
-        except Exception as e:
-            logger.error(f"Falha ao buscar métricas de publicidade para {date_str}: {e}")
-            return {}
-        
-    def get_advertisers(self):
-        try:
-            data = self._make_request(f"{self.base_url}/advertising/advertisers", params={"product_id": "PADS"}, headers={"Api-Version": "1"})
-            return data if data else None
-        except Exception as e:
-            logger.error(f"Falha ao buscar anunciantes: {e}")
-            return None
+            try:
+                final_data = result["linha"]
+                FINAL_COLUMNS_ORDER = consolidado_index.columns
+                if not FINAL_COLUMNS_ORDER:
+                    FINAL_COLUMNS_ORDER = list(final_data.keys())
 
-def update_or_append_rows(df_new, worksheet, df_existing_cache, key_cols):
-    logger.info(f"Iniciando atualização em lote da aba '{worksheet.title}' com {len(df_new)} novas linhas.")
-    for col in key_cols:
-        if col in df_existing_cache.columns: df_existing_cache[col] = df_existing_cache[col].astype(str)
-        if col in df_new.columns: df_new[col] = df_new[col].astype(str)
-    try:
-        header = worksheet.row_values(1)
-        if not header:
-            header = df_new.columns.tolist()
-            worksheet.update([header], value_input_option='USER_ENTERED')
-    except gspread.exceptions.APIError as e:
-        logger.error(f"ERRO DE API ao ler o cabeçalho de '{worksheet.title}'. Pausando por 60s. Erro: {e}")
-        time.sleep(60); raise e
-    updates_to_batch, rows_to_append = [], []
-    for _, new_row in df_new.iterrows():
-        match_index = -1
-        if not df_existing_cache.empty:
-            condition = pd.Series([True] * len(df_existing_cache))
-            for col in key_cols:
-                if col in df_existing_cache: condition &= (df_existing_cache[col] == new_row[col])
-            matched_rows = df_existing_cache[condition]
-            if not matched_rows.empty: match_index = matched_rows.index[0]
-        if match_index != -1:
-            row_to_update_num = match_index + 2
-            existing_row_dict = df_existing_cache.iloc[match_index].to_dict()
-            for col, value in new_row.items():
-                if pd.notna(value) and str(value).strip() not in ["", "N/A"]: existing_row_dict[col] = value
-            final_row_values = [existing_row_dict.get(col, "") for col in header]
-            updates_to_batch.append({'range': f'A{row_to_update_num}', 'values': [final_row_values]})
-            for col, value in new_row.items():
-                if col in df_existing_cache: df_existing_cache.loc[match_index, col] = value
-        else:
-            df_aligned = pd.DataFrame([new_row]).reindex(columns=header)
-            rows_to_append.extend(df_aligned.fillna("").values.tolist())
-            df_existing_cache = pd.concat([df_existing_cache, df_aligned], ignore_index=True)
-    try:
-        if updates_to_batch:
-            worksheet.batch_update(updates_to_batch, value_input_option='USER_ENTERED')
-            logger.info(f"SUCESSO: {len(updates_to_batch)} linhas atualizadas em lote.")
-        if rows_to_append:
-            worksheet.append_rows(rows_to_append, value_input_option='USER_ENTERED')
-            logger.info(f"SUCESSO: {len(rows_to_append)} novas linhas adicionadas.")
-    except gspread.exceptions.APIError as e:
-        logger.error(f"ERRO DE API ao escrever em lote. Pausando por 60s. Erro: {e}")
-        time.sleep(60); raise e
+                df_final = pd.DataFrame([final_data]).reindex(columns=FINAL_COLUMNS_ORDER)
+                consolidado_index = update_or_append_rows(df_final, worksheet_consolidado, consolidado_index)
+                touched_keys.add((client_name_from_api, date_str))
+
+                # Preço e estoque atuais são baixa prioridade: sem prazo, as linhas saem só com o título do pedido
+                item_sales = result["itens"]
+                if deadline.allows("metadados_itens"):
+                    fetch_item_metadata(lambda url, params: collector._make_request(url, params=params), item_sales.keys(), item_cache)
+                item_rows.extend(build_item_rows(item_sales, item_cache, date_str, client_name_from_api))
+                item_days.add((client_name_from_api, date_str))
+
+                hourly_sink = result["horario"]
+                if hourly_sink is not None:
+                    write_hourly_day(spreadsheet, catalog, client_name, date_str, hourly_sink.result(), hourly_sink.hourly_profile, profile_merge_log)
 
+                if baseline is not None:
+                    moment = datetime.now(ZoneInfo("America/Sao_Paulo"))
+                    for alert in baseline.observe(client_name, moment, result["parciais"]):
+                        logger.warning(f"ALERTA {client_name_from_api}: {alert['metrica']} em {alert['direcao']} "
+                                       f"({alert['valor_atual']} vs. esperado {alert['esperado']}, z={alert['z_score']}).")
+                        alerts.append({"data_geracao": moment.strftime('%Y-%m-%d %H:%M:%S'), "cliente": client_name_from_api, **alert})
+                if pacing_curves is not None:
+                    projection_row = build_projection_row(pacing_curves, client_name, client_name_from_api, date_str,
+                                                          datetime.now(ZoneInfo("America/Sao_Paulo")), result["parciais"])
+                    if projection_row: projections.append(projection_row)
+
+            except Exception as e:
+                logger.error(f"ERRO IRRECUPERÁVEL ao gravar o dia {date_str} para {client_name}. O script continuará para o próximo cliente. Erro: {e}", exc_info=True)
+                continue # Continua para o próximo cliente em caso de erro
+
+    run_history.save()
+    deadline.log_summary()
+    if baseline is not None:
+        # Alertas antes da base: se a execução cair entre os dois, a reexecução repete os alertas e write_alerts os filtra
+        write_alerts(spreadsheet, alerts)
+        baseline.save()
+    write_projections(spreadsheet, projections)
+
+    # Propaga as linhas escritas para as tabelas de rollup lidas pelo dashboard
+    if touched_keys:
+        refresh_rollups(spreadsheet, consolidado_index.frame_for_clients({client for client, _ in touched_keys}), touched_keys)
+    write_item_rows(spreadsheet, item_rows, item_days)
+    return consolidado_index
+
+# --- Modo Daemon ---
+
+class CollectorDaemon:
+    """
+    Processo de longa duração que substitui as execuções do cron: mantém a conexão com o Sheets,
+    o índice da aba consolidada, as sessões HTTP, os tokens e os ids de cada cliente entre os ciclos.
+    Agenda internamente a coleta em tempo real (a cada REALTIME_INTERVAL_HOURS, em horas UTC
+    múltiplas do intervalo) e a D-1 (diariamente às D1_HOUR_UTC), e coalesce execuções sobrepostas.
+    """
+    def __init__(self, realtime_interval_hours=REALTIME_INTERVAL_HOURS, d1_hour_utc=D1_HOUR_UTC, deadline_minutes=REALTIME_DEADLINE_MINUTES):
+        self.realtime_interval_hours = realtime_interval_hours
+        self.d1_hour_utc = d1_hour_utc
+        self.deadline_minutes = deadline_minutes
+        self.timezone = ZoneInfo("America/Sao_Paulo")
+        self.stop_event = threading.Event()
+        self.prepared_clients = {}
+        self.dead_clients = {}
+        self.id_cache = ClientIdCache()
+        self.item_cache = ItemMetadataCache()
+        self.run_history = ClientRunHistory()
+        self.baseline = RealtimeBaseline()
+        self.pacing_curves = PacingCurves()
+        self.sheet_loaded_at = 0
+        self.reload_sheet()
+
+    def reload_sheet(self):
+        """
+        (Re)carrega credenciais, clientes e o índice da aba e revalida as credenciais de todos os clientes;
+        feito na partida e a cada SHEET_CACHE_MAX_AGE_SECONDS.
+        """
+        self.google_creds, self.clients_df = load_clients_and_credentials()
+        self.prepared_clients, self.dead_clients = prepare_all_clients(self.clients_df, self.id_cache)
+        self.spreadsheet, self.worksheet_consolidado, self.consolidado_index = open_consolidated_sheet(self.google_creds)
+        self.sheet_loaded_at = time.time()
+        logger.info(f"Índice da aba consolidada carregado: {len(self.consolidado_index)} chaves, {len(self.clients_df)} clientes.")
+
+    def get_prepared_client(self, client_info):
+        """Reaproveita sessão, user_id e anunciante; só renova o access token quando ele está perto de expirar."""
+        return get_fresh_client(self.prepared_clients, client_info, get_new_access_token, MercadoLivreAdsCollector, self.id_cache)
+
+    def run_job(self, date_str):
+        if time.time() - self.sheet_loaded_at > SHEET_CACHE_MAX_AGE_SECONDS:
+            # Outros processos (histórico, realtime_update) também escrevem na aba
+            self.reload_sheet()
+        telemetry.start_run("daily_collector_daemon")
+        logger.info(f"Iniciando ciclo do daemon para a data {date_str}.")
+        live_clients_df = self.clients_df[~self.clients_df['client_name'].isin(list(self.dead_clients))]
+        # Cada ciclo precisa terminar antes do próximo disparo em tempo real
+        deadline = RunDeadline(self.deadline_minutes * 60 if self.deadline_minutes else None)
+        # Só a coleta do dia corrente tem totais parciais para comparar com a expectativa
+        realtime = date_str == datetime.now(self.timezone).strftime('%Y-%m-%d')
+        self.consolidado_index = collect_day(date_str, live_clients_df, self.spreadsheet, self.worksheet_consolidado,
+                                                self.consolidado_index, self.get_prepared_client, self.item_cache,
+                                                deadline, self.run_history, baseline=self.baseline if realtime else None,
+                                                pacing_curves=self.pacing_curves if realtime else None, hourly_output=not realtime)
+        telemetry.write_summary()
+
+    def _next_realtime(self, after):
+        hour = (after.hour // self.realtime_interval_hours + 1) * self.realtime_interval_hours
+        return after.replace(minute=0, second=0, microsecond=0) + timedelta(hours=hour - after.hour)
+
+    def _next_d1(self, after):
+        candidate = after.replace(hour=self.d1_hour_utc, minute=0, second=0, microsecond=0)
+        return candidate if candidate > after else candidate + timedelta(days=1)
+
+    def due_jobs(self, now_utc, next_runs):
+        """
+        Datas a coletar neste instante. Disparos atrasados do mesmo tipo viram um só,
+        e tipos diferentes que caem na mesma data alvo também (coalescência).
+        """
+        dates = []
+        if now_utc >= next_runs["d1"]:
+            dates.append((now_utc.astimezone(self.timezone) - timedelta(days=1)).strftime('%Y-%m-%d'))
+            next_runs["d1"] = self._next_d1(now_utc)
+        if now_utc >= next_runs["realtime"]:
+            dates.append(now_utc.astimezone(self.timezone).strftime('%Y-%m-%d'))
+            next_runs["realtime"] = self._next_realtime(now_utc)
+        return list(dict.fromkeys(dates))
+
+    def run_forever(self, run_now=True):
+        now_utc = datetime.now(ZoneInfo("UTC"))
+        next_runs = {"realtime": now_utc if run_now else self._next_realtime(now_utc), "d1": self._next_d1(now_utc)}
+        logger.info(f"Daemon iniciado. Próximos ciclos: tempo real {next_runs['realtime']:%Y-%m-%d %H:%M} UTC, D-1 {next_runs['d1']:%Y-%m-%d %H:%M} UTC.")
+        while not self.stop_event.is_set():
+            now_utc = datetime.now(ZoneInfo("UTC"))
+            for date_str in self.due_jobs(now_utc, next_runs):
+                if self.stop_event.is_set():
+                    break
+                try:
+                    self.run_job(date_str)
+                except Exception as e:
+                    logger.error(f"ERRO no ciclo do daemon para {date_str}: {e}", exc_info=True)
+            wait_seconds = (min(next_runs.values()) - datetime.now(ZoneInfo("UTC"))).total_seconds()
+            self.stop_event.wait(max(wait_seconds, 1))
+        logger.info("Daemon finalizado.")
+
+    def stop(self, *args):
+        logger.info("Sinal de parada recebido. O daemon encerra ao fim do ciclo atual.")
+        self.stop_event.set()
 
 def main():
     # <-- 2. Lógica para determinar a data alvo ---
     parser = argparse.ArgumentParser(description="Coletor de dados do Mercado Livre Ads.")
     parser.add_argument('--dia-anterior', action='store_true', help='Se definido, executa a coleta para o dia anterior (D-1).')
+    parser.add_argument('--daemon', action='store_true', help='Executa continuamente, agendando internamente as coletas em tempo real e D-1.')
+    parser.add_argument('--intervalo-horas', type=int, default=REALTIME_INTERVAL_HOURS, help='Intervalo da coleta em tempo real no modo daemon.')
+    parser.add_argument('--hora-d1-utc', type=int, default=D1_HOUR_UTC, help='Hora (UTC) da coleta D-1 no modo daemon.')
+    parser.add_argument('--prazo-minutos', type=int, default=None, help=f'Orçamento da execução; esgotado, o trabalho de baixa prioridade é adiado. Padrão: {REALTIME_DEADLINE_MINUTES} em tempo real, sem prazo na D-1; 0 desativa.')
     args = parser.parse_args()
+
+    if args.daemon:
+        try:
+            daemon = CollectorDaemon(args.intervalo_horas, args.hora_d1_utc, REALTIME_DEADLINE_MINUTES if args.prazo_minutos is None else args.prazo_minutos)
+        except Exception as e:
+            logger.critical(f"ERRO CRÍTICO ao iniciar o daemon: {e}")
+            return
+        signal.signal(signal.SIGTERM, daemon.stop)
+        signal.signal(signal.SIGINT, daemon.stop)
+        daemon.run_forever()
+        return
     
     brasil_timezone = ZoneInfo("America/Sao_Paulo")
     
@@ -211,117 +297,39 @@ def main():
 
     date_str = target_date.strftime('%Y-%m-%d')
     logger.info(f"Data alvo para a coleta: {date_str}")
+    telemetry.start_run("daily_collector")
     # --- Fim da lógica da data ---
 
     try:
-        if os.path.exists('.streamlit/secrets.toml'):
-            secrets = toml.load('.streamlit/secrets.toml'); google_creds = secrets['google_credentials']
-            # Para execução local, você pode querer criar um 'clients.csv'
-            with open('clients.csv', 'r') as f: clients_csv_data = f.read()
-        else:
-            google_creds_str = os.environ['GOOGLE_CREDENTIALS']; clients_csv_data = os.environ['MELI_CLIENTS_CSV']; google_creds = toml.loads(google_creds_str)['google_credentials']
-        clients_df = pd.read_csv(StringIO(clients_csv_data))
-        clients_df['client_name'] = clients_df['client_name'].str.strip()
+        google_creds, clients_df = load_clients_and_credentials()
     except Exception as e:
         logger.critical(f"ERRO CRÍTICO ao carregar as credenciais ou o arquivo CSV: {e}")
         return
 
     try:
-        scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-        creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
-        client_gspread = gspread.authorize(creds)
-        spreadsheet = client_gspread.open("Histórico de Vendas Meli - 2024")
-        worksheet_consolidado = spreadsheet.worksheet("Dados Consolidados v2")
-        df_consolidado_cache = pd.DataFrame(worksheet_consolidado.get_all_records())
+        spreadsheet, worksheet_consolidado, consolidado_index = open_consolidated_sheet(google_creds)
     except Exception as e:
         logger.critical(f"ERRO CRÍTICO ao conectar-se com o Google Sheets: {e}")
         return
 
-    for _, client_info in clients_df.iterrows():
-        client_name = client_info["client_name"]
-        logger.info(f"\n{'='*50}\n--- Processando cliente: {client_name} para a data {date_str} ---\n{'='*50}")
+    # Credenciais validadas em paralelo: clientes inativos ficam fora da coleta e os ids resolvidos são reaproveitados
+    id_cache = ClientIdCache()
+    prepared_clients, _ = prepare_all_clients(clients_df, id_cache)
+    live_clients_df = clients_df[clients_df['client_name'].isin(list(prepared_clients))]
 
-        # <-- 3. Lógica de data simplificada ---
-        # A lógica de state, last_processed_date, date_range foi removida.
-        # O script agora processa apenas a 'target_date' definida no início.
-        
-        access_token = get_new_access_token(client_info)
-        if not access_token: continue
-
-        collector = MercadoLivreAdsCollector(access_token)
-        
-        user_id = collector.get_user_id()
-        if not user_id:
-            logger.error(f"Não foi possível obter o user_id para {client_name}. Pulando para o próximo cliente.")
-            continue
-
-        advertisers_data = collector.get_advertisers()
-        advertiser_id, client_name_from_api = None, client_name
-        if advertisers_data and advertisers_data.get('advertisers'):
-            advertiser = advertisers_data['advertisers'][0]
-            advertiser_id = advertiser['advertiser_id']
-            client_name_from_api = advertiser.get('advertiser_name', client_name)
-        else:
-            logger.warning(f"Nenhum anunciante encontrado para {client_name}. Métricas de Ads não serão coletadas.")
-        
-        try:
-            # O loop de datas foi removido, o código agora executa uma única vez por cliente.
-            business_metrics = collector.get_business_metrics(seller_id=user_id, date_str=date_str)
-            ads_metrics = collector.get_ads_summary_metrics(advertiser_id, date_str) if advertiser_id else {}
-            
-            faturamento = pd.to_numeric(business_metrics.get("faturamento_bruto"), errors='coerce')
-            qtde_vendas = pd.to_numeric(business_metrics.get("quantidade_vendas"), errors='coerce')
-            visitas = pd.to_numeric(business_metrics.get("visitas"), errors='coerce')
-            unidades_vendidas = pd.to_numeric(business_metrics.get("unidades_vendidas"), errors='coerce')
-            investimento_ads = pd.to_numeric(ads_metrics.get("cost"), errors='coerce')
-            vendas_ads = pd.to_numeric(ads_metrics.get("total_amount"), errors='coerce')
-            impressoes = pd.to_numeric(ads_metrics.get("prints"), errors='coerce')
-            cliques = pd.to_numeric(ads_metrics.get("clicks"), errors='coerce')
-            acos_percent = pd.to_numeric(ads_metrics.get("acos"), errors='coerce')
-
-            taxa_conversao = (qtde_vendas / visitas * 100) if pd.notna(qtde_vendas) and pd.notna(visitas) and visitas > 0 else 0
-            tacos = (investimento_ads / faturamento * 100) if pd.notna(investimento_ads) and pd.notna(faturamento) and faturamento > 0 else 0
-            roas = (vendas_ads / investimento_ads) if pd.notna(vendas_ads) and pd.notna(investimento_ads) and investimento_ads > 0 else 0
-            vendas_sem_ads = (faturamento - vendas_ads) if pd.notna(faturamento) and pd.notna(vendas_ads) else faturamento
-            cpc = (investimento_ads / cliques) if pd.notna(investimento_ads) and pd.notna(cliques) and cliques > 0 else 0
-            ctr = (cliques / impressoes * 100) if pd.notna(cliques) and pd.notna(impressoes) and impressoes > 0 else 0
-
-            final_data = {
-                "data_geracao": datetime.now(brasil_timezone).strftime('%Y-%m-%d %H:%M:%S'),
-                "periodo_consulta": date_str,
-                "cliente": client_name_from_api,
-                "Faturamento": f"R$ {faturamento:,.2f}" if pd.notna(faturamento) else "R$ 0,00",
-                "Investimento": f"R$ {investimento_ads:,.2f}" if pd.notna(investimento_ads) else None,
-                "Quantidade de Vendas": int(qtde_vendas) if pd.notna(qtde_vendas) else 0,
-                "Unidades Vendidas": int(unidades_vendidas) if pd.notna(unidades_vendidas) else 0,
-                "Visitas": int(visitas) if pd.notna(visitas) else 0,
-                "Taxa de Conversão Média": f"{taxa_conversao:.2f}%" if taxa_conversao > 0 else None,
-                "ACOS": f"{acos_percent:.2f}%" if pd.notna(acos_percent) else None,
-                "TACOS": f"{tacos:.2f}%" if tacos > 0 else None,
-                "ROAS": f"{roas:.2f}" if roas > 0 else None,
-                "ROI Média": f"{roas:.2f}" if roas > 0 else None,
-                "Vendas por Ads": f"R$ {vendas_ads:,.2f}" if pd.notna(vendas_ads) else None,
-                "Vendas sem Ads": f"R$ {vendas_sem_ads:,.2f}" if pd.notna(vendas_sem_ads) else None,
-                "Cliques": int(cliques) if pd.notna(cliques) else None,
-                "CPC": f"R$ {cpc:,.2f}" if cpc > 0 else None,
-                "CTR": f"{ctr:.2f}%" if ctr > 0 else None,
-                "Impressões": int(impressoes) if pd.notna(impressoes) else None,
-            }
-
-            FINAL_COLUMNS_ORDER = list(df_consolidado_cache.columns)
-            if not FINAL_COLUMNS_ORDER:
-                FINAL_COLUMNS_ORDER = list(final_data.keys())
-
-            df_final = pd.DataFrame([final_data]).reindex(columns=FINAL_COLUMNS_ORDER)
-            update_or_append_rows(df_final, worksheet_consolidado, df_consolidado_cache, ['periodo_consulta', 'cliente'])
-            
-            # A chamada para save_state() foi removida daqui
-            time.sleep(1.5)
+    def get_prepared_client(client_info):
+        return get_fresh_client(prepared_clients, client_info, get_new_access_token, MercadoLivreAdsCollector, id_cache)
 
-        except Exception as e:
-            logger.error(f"ERRO IRRECUPERÁVEL ao processar o dia {date_str} para {client_name}. O script continuará para o próximo cliente. Erro: {e}", exc_info=True)
-            continue # Continua para o próximo cliente em caso de erro
+    deadline_minutes = args.prazo_minutos if args.prazo_minutos is not None else (None if args.dia_anterior else REALTIME_DEADLINE_MINUTES)
+    deadline = RunDeadline(deadline_minutes * 60 if deadline_minutes else None)
+    # Execução em tempo real: totais parciais comparados com a expectativa e projetados para o fim do dia
+    # (estado persistido entre execuções)
+    realtime = not args.dia_anterior
+    collect_day(date_str, live_clients_df, spreadsheet, worksheet_consolidado, consolidado_index, get_prepared_client,
+                deadline=deadline, baseline=RealtimeBaseline() if realtime else None,
+                pacing_curves=PacingCurves() if realtime else None, hourly_output=not realtime)
 
+    telemetry.write_summary()
     logger.info("\nExecução finalizada.")
 
 if __name__ == "__main__":
@@ -6,10 +6,20 @@ from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 import logging
 from google.oauth2.service_account import Credentials
-import os
 from io import StringIO
 import toml
 import json
+import argparse
+from hourly_profile import HourlyProfile, ProfileMergeLog, merge_profile_into_sheet, replace_profile_sheet
+from ledger import CompletionLedger, STATUS_ERROR
+from telemetry import telemetry
+from order_pipeline import fetch_orders, run_order_pipeline, json_loads, HourlyRowsSink
+from preflight import ClientIdCache, run_preflight, get_fresh_client
+from meli_collector import get_new_access_token, MercadoLivreAdsCollector
+from partitions import PartitionCatalog, read_partitioned_frame
+from hourly_output import (
+    TARGET_WORKSHEET_NAME, LEDGER_SOURCE, BUCKET_WORKSHEET_NAME, BUCKET_LEDGER_SOURCE, BUCKET_COLUMNS, aggregate_hourly_rows,
+)
 
 # --- Configuração ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,40 +27,21 @@ logger = logging.getLogger(__name__)
 
 # --- Constantes do Script ---
 TARGET_SPREADSHEET_NAME = "Histórico de Vendas Meli - 2024" # Verifique se este é o nome exato da sua planilha
-TARGET_WORKSHEET_NAME = "Dados_Horarios"
-STATE_FILE = "hourly_run_state.json" # Arquivo de estado para este script
-
-# --- Funções Reutilizadas (Baseadas no daily_collector.py) ---
-
-def get_new_access_token(client_info):
-    """Renova o access token do Mercado Livre."""
-    url = "https://api.mercadolibre.com/oauth/token"
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    data = {
-        "grant_type": "refresh_token",
-        "client_id": client_info["app_id"],
-        "client_secret": client_info["client_secret"],
-        "refresh_token": client_info["refresh_token"]
-    }
-    try:
-        response = requests.post(url, headers=headers, data=data)
-        response.raise_for_status()
-        return response.json()["access_token"]
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao renovar o Access Token: {e.response.json() if e.response else e}")
-        return None
+LEGACY_STATE_FILE = "hourly_run_state.json" # Arquivo de estado antigo, importado para o ledger
+
+# --- Gravação no Google Sheets ---
 
 def export_to_gsheets_append_only(df, worksheet_name, google_creds):
     """Função simplificada para apenas adicionar novas linhas a uma aba."""
     if df.empty:
         logger.info("Nenhum dado novo para exportar.")
-        return
+        return True
 
     logger.info(f"Exportando {len(df)} linhas para a aba '{worksheet_name}'...")
     try:
         scopes = ["https://www.googleapis.com/auth/spreadsheets"]
         creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
-        client = gspread.authorize(creds)
+        client = telemetry.instrument_gspread(gspread.authorize(creds))
         spreadsheet = client.open(TARGET_SPREADSHEET_NAME)
         
         try:
@@ -65,54 +56,100 @@ def export_to_gsheets_append_only(df, worksheet_name, google_creds):
 
         worksheet.append_rows(df.values.tolist(), value_input_option='USER_ENTERED')
         logger.info(f"SUCESSO: {len(df)} linhas adicionadas à aba '{worksheet_name}'.")
+        return True
 
     except Exception as e:
         logger.error(f"ERRO AO EXPORTAR PARA '{worksheet_name}': {e}", exc_info=True)
+        return False
 
 # --- Funções de Lógica Principal ---
 
-def load_state():
-    """Carrega o último dia processado de um arquivo de estado."""
-    if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_state(state):
-    """Salva o estado atual da execução."""
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f, indent=4)
-
-def get_all_orders_for_day(access_token, seller_id, date_str):
-    """Busca todos os pedidos de um dia específico, lidando com paginação."""
-    all_orders = []
-    offset = 0
-    limit = 50
+def compact_existing_history(spreadsheet, google_creds, ledger, catalog):
+    """
+    Converte o histórico por pedido da aba Dados_Horarios em linhas por hora na aba agregada.
+    Só entram os dias ainda não concluídos na saída por hora; cada dia convertido (e cada dia
+    concluído na saída por pedido, mesmo sem vendas) é marcado no ledger da saída por hora,
+    para que a exportação --saida horaria não baixe nem grave esses dias de novo.
+    Com a aba agregada particionada, cada dia vai para a partição do seu período.
+    """
+    logger.info(f"Lendo o histórico por pedido da aba '{TARGET_WORKSHEET_NAME}'...")
+    df_orders = read_partitioned_frame(spreadsheet, TARGET_WORKSHEET_NAME, catalog)
+    df_buckets = aggregate_hourly_rows(df_orders)
+    df_buckets['dia'] = df_buckets['data_hora'].str[:10]
+
+    clients = set(df_buckets['cliente'].astype(str)) | {c for c, _, s in ledger.status if s == LEDGER_SOURCE}
+    converted_days = {}
+    for client_name in sorted(clients):
+        days = ledger.done_days(client_name, LEDGER_SOURCE) | set(df_buckets.loc[df_buckets['cliente'].astype(str) == client_name, 'dia'])
+        converted_days[client_name] = sorted(days - ledger.done_days(client_name, BUCKET_LEDGER_SOURCE))
+    # Dias que já estão na aba agregada (ex.: compactações anteriores, que não usavam o ledger) só são marcados
+    df_existing = read_partitioned_frame(spreadsheet, BUCKET_WORKSHEET_NAME, catalog)
+    existing_keys = set()
+    if not df_existing.empty and {'cliente', 'data_hora'}.issubset(df_existing.columns):
+        existing_keys = set(zip(df_existing['cliente'].astype(str), df_existing['data_hora'].astype(str).str[:10]))
+    pending_keys = {(c, d) for c, days in converted_days.items() for d in days} - existing_keys
+    pending = df_buckets[[(str(c), d) in pending_keys for c, d in zip(df_buckets['cliente'], df_buckets['dia'])]]
+
+    # Uma escrita por aba de destino; os dias de uma aba que falhou ficam pendentes para a próxima execução
+    targets = {day: catalog.route(BUCKET_WORKSHEET_NAME, day, BUCKET_COLUMNS) for day in {d for _, d in pending_keys}}
+    failed_targets = set()
+    for target_worksheet, df_target in pending.groupby(pending['dia'].map(targets), sort=False):
+        if not export_to_gsheets_append_only(df_target[BUCKET_COLUMNS], target_worksheet, google_creds):
+            failed_targets.add(target_worksheet)
+    for client_name, days in converted_days.items():
+        ledger.record_many(client_name, [d for d in days if d not in targets or targets[d] not in failed_targets], BUCKET_LEDGER_SOURCE, detail="compactado de Dados_Horarios")
+
+    reducao = len(df_orders) / len(df_buckets) if len(df_buckets) else 0
+    logger.info(f"SUCESSO: {len(df_orders)} linhas por pedido compactadas em {len(df_buckets)} linhas horárias ({reducao:.1f}x); {len(pending)} linhas gravadas.")
+
+def rebuild_profile_from_history(spreadsheet, catalog):
+    """
+    Recalcula o perfil horário a partir de todo o histórico já exportado (Dados_Horarios e
+    Dados_Horarios_Agregados) e substitui a aba de perfil e a de controle. Quando o dia está nas
+    duas abas (compactação), vale a agregada. Idempotente: também corrige dias somados em dobro
+    antes da aba de controle existir.
+    """
+    df_from_orders = aggregate_hourly_rows(read_partitioned_frame(spreadsheet, TARGET_WORKSHEET_NAME, catalog))
+    df_from_buckets = aggregate_hourly_rows(read_partitioned_frame(spreadsheet, BUCKET_WORKSHEET_NAME, catalog))
+    bucket_days = set(zip(df_from_buckets['cliente'].astype(str), df_from_buckets['data_hora'].str[:10]))
+    df_from_orders = df_from_orders[[(str(c), d[:10]) not in bucket_days for c, d in zip(df_from_orders['cliente'], df_from_orders['data_hora'])]]
+    df_history = pd.concat([df_from_buckets, df_from_orders], ignore_index=True)
+
+    hourly_profile = HourlyProfile(ZoneInfo("America/Sao_Paulo"))
+    days_by_client = {}
+    # data_hora já está no horário local do pedido
+    for client_name, data_hora, pedidos, unidades, faturamento in zip(df_history['cliente'].astype(str), pd.to_datetime(df_history['data_hora']),
+                                                                      df_history['pedidos'], df_history['quantidade_vendas'], df_history['faturamento']):
+        hourly_profile.add_bucket(client_name, data_hora, pedidos, unidades, faturamento)
+        days_by_client.setdefault(client_name, set()).add(data_hora.strftime('%Y-%m-%d'))
+    replace_profile_sheet(hourly_profile, spreadsheet, days_by_client)
+
+def collect_orders_for_day(access_token, seller_id, date_str, sinks):
+    """Busca os pedidos do dia uma única vez e os entrega aos sinks. Retorna False se a busca falhar."""
     headers = {"Authorization": f"Bearer {access_token}"}
-    date_from = f"{date_str}T00:00:00.000-03:00"
-    date_to = f"{date_str}T23:59:59.999-03:00"
+
+    def request_json(url, params):
+        response = requests.get(url, params=params, headers=headers, timeout=30, hooks=telemetry.hooks())
+        response.raise_for_status()
+        telemetry.sleep(0.3, "pausa_paginacao")
+        return json_loads(response.content)
 
     logger.info(f"Buscando pedidos para o dia {date_str}...")
-    while True:
-        params = {"seller": seller_id, "order.date_created.from": date_from, "order.date_created.to": date_to, "sort": "date_asc", "limit": limit, "offset": offset}
-        try:
-            response = requests.get("https://api.mercadolibre.com/orders/search", params=params, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            results = data.get('results', [])
-            if not results: break
-            all_orders.extend(results)
-            offset += limit
-            if offset >= data.get('paging', {}).get('total', 0): break
-            time.sleep(0.3)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro na API do Meli ao buscar pedidos: {e}"); break
-            
-    logger.info(f"Encontrados {len(all_orders)} pedidos para {date_str}.")
-    return all_orders
+    try:
+        run_order_pipeline(fetch_orders(request_json, seller_id, date_str), sinks)
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Erro na API do Meli ao buscar pedidos: {e}")
+        return False
 
 def main():
-    logger.info(f"Iniciando script de exportação de dados horários.")
+    parser = argparse.ArgumentParser(description="Exportação do histórico horário de pedidos do Mercado Livre.")
+    parser.add_argument('--saida', choices=['pedido', 'horaria'], default='pedido', help="'pedido' grava uma linha por pedido; 'horaria' grava uma linha por (cliente, data, hora).")
+    parser.add_argument('--compactar', action='store_true', help=f"Converte o histórico por pedido de '{TARGET_WORKSHEET_NAME}' para '{BUCKET_WORKSHEET_NAME}' e encerra.")
+    parser.add_argument('--reconstruir-perfil', action='store_true', help="Recalcula o perfil horário a partir do histórico já exportado e encerra.")
+    args = parser.parse_args()
+
+    logger.info(f"Iniciando script de exportação de dados horários (saída: {args.saida}).")
     
     # Carregamento de credenciais e clientes
     try:
@@ -123,66 +160,92 @@ def main():
         logger.error(f"ERRO CRÍTICO: Não foi possível carregar 'secrets.toml' ou 'clients.csv'. Verifique os arquivos. Erro: {e}")
         return
 
-    state = load_state()
+    try:
+        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+        creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
+        spreadsheet = telemetry.instrument_gspread(gspread.authorize(creds)).open(TARGET_SPREADSHEET_NAME)
+    except Exception as e:
+        logger.error(f"ERRO CRÍTICO ao conectar-se com o Google Sheets: {e}")
+        return
+
+    ledger = CompletionLedger()
+    ledger.import_legacy_state(LEGACY_STATE_FILE, LEDGER_SOURCE)
+    # Com a aba de destino particionada, cada dia vai para a aba do seu período
+    catalog = PartitionCatalog(spreadsheet)
+
+    if args.compactar:
+        compact_existing_history(spreadsheet, google_creds, ledger, catalog)
+        return
+    if args.reconstruir_perfil:
+        rebuild_profile_from_history(spreadsheet, catalog)
+        return
+
+    if args.saida == 'horaria':
+        worksheet_name, ledger_source = BUCKET_WORKSHEET_NAME, BUCKET_LEDGER_SOURCE
+    else:
+        worksheet_name, ledger_source = TARGET_WORKSHEET_NAME, LEDGER_SOURCE
+
+    telemetry.start_run(f"export_hourly_history_{args.saida}")
     brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    hourly_profile = HourlyProfile(brasil_timezone)
+    # Dias já somados ao perfil (por qualquer modo): trocar de modo não soma o mesmo dia duas vezes
+    profile_merge_log = ProfileMergeLog(spreadsheet)
     limit_date_past = datetime(2024, 1, 1, tzinfo=brasil_timezone)
 
-    for _, client_row in clients_df.iterrows():
-        client_name = client_row["client_name"]
-        logger.info(f"\n--- Processando cliente: {client_name} ---")
-
-        access_token = get_new_access_token(client_row)
-        if not access_token: continue
+    # Só a exportação precisa do seller_id: a pré-validação concorrente não consulta anunciantes
+    id_cache = ClientIdCache()
+    prepared_clients, _ = run_preflight(clients_df, get_new_access_token, MercadoLivreAdsCollector, id_cache, resolve_advertiser=False)
 
-        try:
-            response_user = requests.get("https://api.mercadolibre.com/users/me", headers={"Authorization": f"Bearer {access_token}"})
-            response_user.raise_for_status()
-            seller_id = response_user.json().get('id')
-            if not seller_id: logger.error(f"Não foi possível obter seller_id para {client_name}."); continue
-        except Exception as e:
-            logger.error(f"Erro ao buscar seller_id para {client_name}: {e}"); continue
-        
-        last_processed_date_str = state.get(client_name)
-        start_date = datetime.now(brasil_timezone) if not last_processed_date_str else datetime.strptime(last_processed_date_str, '%Y-%m-%d').replace(tzinfo=brasil_timezone) - timedelta(days=1)
+    for _, client_row in clients_df[clients_df['client_name'].isin(list(prepared_clients))].iterrows():
+        client_name = client_row["client_name"]
+        with telemetry.client_timer(client_name):
+            logger.info(f"\n--- Processando cliente: {client_name} ---")
         
-        if start_date.date() < limit_date_past.date():
-            logger.info(f"Cliente {client_name} já possui todo o histórico. Pulando."); continue
-            
-        date_range = pd.date_range(start=limit_date_past, end=start_date, tz=brasil_timezone)
+            pending_days = ledger.plan(client_name, ledger_source, limit_date_past.date(), datetime.now(brasil_timezone).date())
+            if not pending_days:
+                logger.info(f"Cliente {client_name} já possui todo o histórico. Pulando."); continue
         
-        for single_date in sorted(date_range, reverse=True):
-            date_str = single_date.strftime('%Y-%m-%d')
-            logger.info(f"Processando data: {date_str}")
+            for date_str in pending_days:
+                logger.info(f"Processando data: {date_str}")
+                if args.saida == 'horaria' and profile_merge_log.contains(client_name, date_str):
+                    # Dia já exportado: pela coleta D-1, na mesma passada dos pedidos, ou pela saída por pedido (ver --compactar)
+                    ledger.record(client_name, date_str, ledger_source, detail="já na aba de controle do perfil horário")
+                    continue
+
+                # A exportação pode durar horas: o token é renovado se expirou desde a pré-validação
+                prepared_client = get_fresh_client(prepared_clients, client_row, get_new_access_token, MercadoLivreAdsCollector, id_cache, resolve_advertiser=False)
+                if not prepared_client: break
+                collector, seller_id, _, _ = prepared_client
             
-            orders = get_all_orders_for_day(access_token, seller_id, date_str)
-            if not orders:
-                state[client_name] = date_str
-                save_state(state)
-                continue
-
-            hourly_rows = []
-            for order in orders:
-                if order.get('status') not in ['paid', 'shipped', 'delivered']: continue
-                
-                dt_object = pd.to_datetime(order['date_created'])
-                
-                row_data = {
-                    "data_hora": dt_object.strftime('%Y-%m-%d %H:%M:%S'),
-                    "quantidade_vendas": sum(item.get('quantity', 0) for item in order.get('order_items', [])),
-                    "faturamento": order.get('total_amount', 0),
-                    "cliente": client_name
-                }
-                hourly_rows.append(row_data)
-
-            if hourly_rows:
-                df_to_export = pd.DataFrame(hourly_rows)
-                export_to_gsheets_append_only(df_to_export, TARGET_WORKSHEET_NAME, google_creds)
-
-            state[client_name] = date_str
-            save_state(state)
-            logger.info(f"Progresso para {client_name} salvo. Último dia processado: {date_str}")
-            time.sleep(1) # Pausa entre os dias
-
+                hourly_sink = HourlyRowsSink(client_name, hourly_profile)
+                if not collect_orders_for_day(collector.access_token, seller_id, date_str, [hourly_sink]):
+                    # O dia fica com erro no ledger e será refeito na próxima execução
+                    hourly_profile.clear(client_name)
+                    ledger.record(client_name, date_str, ledger_source, STATUS_ERROR)
+                    break
+                hourly_rows = hourly_sink.result()
+                logger.info(f"Encontrados {len(hourly_rows)} pedidos pagos para {date_str}.")
+
+                if hourly_rows:
+                    df_to_export = pd.DataFrame(hourly_rows)
+                    if args.saida == 'horaria':
+                        df_to_export = aggregate_hourly_rows(df_to_export)
+                    target_worksheet = catalog.route(worksheet_name, date_str, df_to_export.columns.tolist())
+                    if not export_to_gsheets_append_only(df_to_export, target_worksheet, google_creds):
+                        hourly_profile.clear(client_name)
+                        ledger.record(client_name, date_str, ledger_source, STATUS_ERROR)
+                        continue
+                    # O perfil 24x7 e a marcação do dia na aba de controle são gravados juntos: refazer o dia não o soma de novo
+                    try:
+                        merge_profile_into_sheet(hourly_profile, client_name, spreadsheet, date_str, profile_merge_log)
+                    except gspread.exceptions.APIError as e:
+                        logger.error(f"ERRO DE API ao atualizar o perfil horário de {client_name}: {e}")
+
+                ledger.record(client_name, date_str, ledger_source)
+                logger.info(f"Dia {date_str} de {client_name} registrado no ledger.")
+                telemetry.sleep(1, "pausa_entre_dias") # Pausa entre os dias
+
+    telemetry.write_summary()
     logger.info("\nExecução finalizada.")
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import pandas as pd
+import gspread
+import logging
+
+from hourly_profile import merge_profile_into_sheet
+
+logger = logging.getLogger(__name__)
+
+# Saídas horárias compartilhadas pela coleta D-1 (daily_collector) e pela exportação do histórico
+# (export_hourly_history): os pedidos do dia são baixados uma vez e entregues ao HourlyRowsSink.
+
+# --- Constantes ---
+TARGET_WORKSHEET_NAME = "Dados_Horarios"
+LEDGER_SOURCE = "horario_pedido"
+# Saída agregada por (cliente, data, hora): uma linha por hora com vendas em vez de uma por pedido
+BUCKET_WORKSHEET_NAME = "Dados_Horarios_Agregados"
+BUCKET_LEDGER_SOURCE = "horario_agregado"
+BUCKET_COLUMNS = ["data_hora", "pedidos", "quantidade_vendas", "faturamento", "cliente"]
+
+# --- Agregação por Hora ---
+
+def aggregate_hourly_rows(df_orders):
+    """
+    Reduz linhas por pedido (data_hora, quantidade_vendas, faturamento, cliente)
+    a uma linha por (cliente, data, hora) com pedidos, unidades e faturamento.
+    Aceita também linhas já agregadas (com a coluna 'pedidos'), somando-as.
+    """
+    if df_orders.empty:
+        return pd.DataFrame(columns=BUCKET_COLUMNS)
+
+    df = df_orders.copy()
+    df['data_hora'] = pd.to_datetime(df['data_hora'], errors='coerce').dt.floor('h')
+    df = df.dropna(subset=['data_hora'])
+    for col in ['quantidade_vendas', 'faturamento']:
+        df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '.'), errors='coerce').fillna(0)
+    df['pedidos'] = pd.to_numeric(df['pedidos'], errors='coerce').fillna(0) if 'pedidos' in df.columns else 1
+
+    df_buckets = df.groupby(['cliente', 'data_hora'], as_index=False)[['pedidos', 'quantidade_vendas', 'faturamento']].sum()
+    df_buckets['data_hora'] = df_buckets['data_hora'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df_buckets['pedidos'] = df_buckets['pedidos'].astype(int)
+    return df_buckets.sort_values(['cliente', 'data_hora'])[BUCKET_COLUMNS]
+
+# --- Gravação no Google Sheets ---
+
+def append_rows_to_sheet(spreadsheet, worksheet_name, df):
+    """Adiciona as linhas do DataFrame ao fim da aba (criada com o cabeçalho se não existir)."""
+    if df.empty:
+        return
+    try:
+        worksheet = spreadsheet.worksheet(worksheet_name)
+    except gspread.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows="1", cols=len(df.columns))
+        logger.info(f"Aba '{worksheet_name}' criada com sucesso.")
+    if not worksheet.row_values(1):  # Garante que o cabeçalho exista
+        worksheet.update([df.columns.tolist()], value_input_option='USER_ENTERED')
+    worksheet.append_rows(df.values.tolist(), value_input_option='USER_ENTERED')
+    logger.info(f"SUCESSO: {len(df)} linhas adicionadas à aba '{worksheet_name}'.")
+
+def write_hourly_day(spreadsheet, catalog, client_name, date_str, hourly_rows, hourly_profile, merge_log):
+    """
+    Grava o dia completo do cliente na saída agregada e soma-o ao perfil horário.
+    A aba de controle do perfil marca os dias já gravados: um dia marcado (por esta coleta ou pela
+    exportação do histórico) não é gravado de novo. Retorna False se a escrita falhar.
+    """
+    if merge_log.contains(client_name, date_str):
+        hourly_profile.clear(client_name)
+        logger.info(f"Dia {date_str} de '{client_name}' já está na saída horária. Nada a gravar.")
+        return True
+    df_buckets = aggregate_hourly_rows(pd.DataFrame(hourly_rows))
+    try:
+        append_rows_to_sheet(spreadsheet, catalog.route(BUCKET_WORKSHEET_NAME, date_str, BUCKET_COLUMNS), df_buckets)
+        # O perfil 24x7 e a marcação do dia na aba de controle são gravados juntos
+        merge_profile_into_sheet(hourly_profile, client_name, spreadsheet, date_str, merge_log)
+    except gspread.exceptions.APIError as e:
+        hourly_profile.clear(client_name)
+        logger.error(f"ERRO DE API ao gravar a saída horária de {client_name} em {date_str}: {e}")
+        return False
+    return True
@@ -0,0 +1,159 @@
+import pandas as pd
+import numpy as np
+import gspread
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+PROFILE_WORKSHEET_NAME = "Perfil_Horario"
+PROFILE_COLUMNS = ["cliente", "dia_semana", "hora", "pedidos", "unidades", "faturamento"]
+PROFILE_METRICS = ["pedidos", "unidades", "faturamento"]
+# Dias (cliente, dia) já somados ao perfil, em qualquer modo de exportação
+PROFILE_DAYS_WORKSHEET_NAME = "Perfil_Horario_Dias"
+PROFILE_DAYS_COLUMNS = ["cliente", "dia"]
+
+# --- Acumulador 24x7 ---
+
+class HourlyProfile:
+    """
+    Acumula, por cliente, pedidos, unidades e faturamento numa grade 7x24
+    (dia da semana x hora, no fuso de São Paulo). Só guarda os incrementos
+    ainda não gravados na planilha.
+    """
+    def __init__(self, timezone):
+        self.timezone = timezone
+        self.deltas = {}
+
+    def _grid(self, client_name):
+        if client_name not in self.deltas:
+            self.deltas[client_name] = {metric: np.zeros((7, 24)) for metric in PROFILE_METRICS}
+        return self.deltas[client_name]
+
+    def add_order(self, client_name, date_created, units, revenue):
+        """Soma um pedido na célula (dia da semana, hora) correspondente."""
+        local_dt = pd.to_datetime(date_created).tz_convert(self.timezone)
+        grid = self._grid(client_name)
+        weekday, hour = local_dt.dayofweek, local_dt.hour
+        grid["pedidos"][weekday, hour] += 1
+        grid["unidades"][weekday, hour] += units
+        grid["faturamento"][weekday, hour] += revenue
+
+    def add_bucket(self, client_name, local_hour, orders, units, revenue):
+        """Soma uma hora já agregada (ex.: linhas de Dados_Horarios_Agregados), com horário já no fuso local."""
+        grid = self._grid(client_name)
+        weekday, hour = local_hour.dayofweek, local_hour.hour
+        grid["pedidos"][weekday, hour] += orders
+        grid["unidades"][weekday, hour] += units
+        grid["faturamento"][weekday, hour] += revenue
+
+    def to_rows(self, client_name):
+        """Linhas (cliente, dia_semana, hora, métricas) das células com incremento pendente."""
+        grid = self.deltas.get(client_name)
+        if grid is None:
+            return []
+        rows = []
+        for weekday, hour in zip(*np.nonzero(grid["pedidos"])):
+            rows.append([client_name, int(weekday), int(hour)] + [float(grid[m][weekday, hour]) for m in PROFILE_METRICS])
+        return rows
+
+    def clear(self, client_name):
+        self.deltas.pop(client_name, None)
+
+# --- Gravação Incremental no Google Sheets ---
+
+def _open_or_create(spreadsheet, title, columns):
+    try:
+        return spreadsheet.worksheet(title)
+    except gspread.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title=title, rows="1", cols=len(columns))
+        worksheet.update([columns], value_input_option='RAW')
+        logger.info(f"Aba '{title}' criada com sucesso.")
+        return worksheet
+
+def _ensure_rows(worksheet, last_row):
+    """Garante que a grade da aba tenha ao menos `last_row` linhas antes de uma escrita por intervalo."""
+    if worksheet.row_count < last_row:
+        worksheet.add_rows(last_row - worksheet.row_count)
+
+class ProfileMergeLog:
+    """
+    Dias (cliente, dia) já somados ao perfil horário, na aba de controle.
+    As saídas por pedido e por hora do mesmo dia alimentam o mesmo perfil: o dia só é somado uma vez.
+    A marcação é gravada na mesma requisição que soma o dia ao perfil (ver merge_profile_into_sheet).
+    """
+    def __init__(self, spreadsheet):
+        self.worksheet = _open_or_create(spreadsheet, PROFILE_DAYS_WORKSHEET_NAME, PROFILE_DAYS_COLUMNS)
+        self.load()
+
+    def load(self):
+        """(Re)lê a aba de controle; retorna o número de linhas ocupadas (com o cabeçalho)."""
+        values = self.worksheet.get_all_values()
+        self.days = {(str(row[0]), str(row[1])) for row in values[1:] if len(row) >= 2 and row[0]}
+        return max(len(values), 1)
+
+    def contains(self, client_name, day_str):
+        return (str(client_name), str(day_str)) in self.days
+
+def merge_profile_into_sheet(profile, client_name, spreadsheet, day_str, merge_log):
+    """
+    Soma os incrementos pendentes do cliente às células já gravadas na aba de perfil e marca o dia na
+    aba de controle numa única escrita (values batchUpdate, tudo ou nada): uma falha no meio não deixa
+    o perfil somado sem a marcação, e o dia nunca é somado duas vezes.
+    """
+    log_rows = merge_log.load()  # outro processo pode ter somado o dia desde o início desta execução
+    if merge_log.contains(client_name, day_str):
+        profile.clear(client_name)
+        logger.info(f"Dia {day_str} de '{client_name}' já está no perfil horário. Incrementos descartados.")
+        return
+    delta_rows = profile.to_rows(client_name)
+    if not delta_rows:
+        return
+
+    worksheet = _open_or_create(spreadsheet, PROFILE_WORKSHEET_NAME, PROFILE_COLUMNS)
+    values = worksheet.get_all_values(value_render_option='UNFORMATTED_VALUE')
+    if not values or not values[0]:
+        values = [PROFILE_COLUMNS]
+
+    existing = {}
+    for row_number, row in enumerate(values[1:], start=2):
+        if len(row) >= len(PROFILE_COLUMNS) and str(row[0]) == client_name:
+            existing[(int(row[1]), int(row[2]))] = (row_number, [float(v or 0) for v in row[3:6]])
+
+    updates, rows_to_append = [], []
+    for client, weekday, hour, *metrics in delta_rows:
+        if (weekday, hour) in existing:
+            row_number, current = existing[(weekday, hour)]
+            merged = [a + b for a, b in zip(current, metrics)]
+            updates.append({'range': f"'{PROFILE_WORKSHEET_NAME}'!A{row_number}", 'values': [[client, weekday, hour] + merged]})
+        else:
+            rows_to_append.append([client, weekday, hour] + metrics)
+    data = [{'range': f"'{PROFILE_WORKSHEET_NAME}'!A1", 'values': [PROFILE_COLUMNS]}] + updates
+    if rows_to_append:
+        _ensure_rows(worksheet, len(values) + len(rows_to_append))
+        data.append({'range': f"'{PROFILE_WORKSHEET_NAME}'!A{len(values) + 1}", 'values': rows_to_append})
+    _ensure_rows(merge_log.worksheet, log_rows + 1)
+    data.append({'range': f"'{PROFILE_DAYS_WORKSHEET_NAME}'!A{log_rows + 1}", 'values': [[client_name, day_str]]})
+
+    spreadsheet.values_batch_update({'valueInputOption': 'RAW', 'data': data})
+    merge_log.days.add((str(client_name), str(day_str)))
+    profile.clear(client_name)
+    logger.info(f"Perfil horário de '{client_name}': {len(updates)} células atualizadas, {len(rows_to_append)} adicionadas.")
+
+def replace_profile_sheet(profile, spreadsheet, days_by_client):
+    """
+    Substitui a aba de perfil e a aba de controle pelo perfil recalculado (`profile`) e pelos dias
+    que o compõem. Usado na reconstrução a partir do histórico; pode ser repetido sem somar nada duas vezes.
+    """
+    profile_rows = [row for client_name in sorted(profile.deltas) for row in profile.to_rows(client_name)]
+    day_rows = [[client_name, day_str] for client_name in sorted(days_by_client) for day_str in sorted(days_by_client[client_name])]
+    worksheet = _open_or_create(spreadsheet, PROFILE_WORKSHEET_NAME, PROFILE_COLUMNS)
+    log_worksheet = _open_or_create(spreadsheet, PROFILE_DAYS_WORKSHEET_NAME, PROFILE_DAYS_COLUMNS)
+    _ensure_rows(worksheet, len(profile_rows) + 1)
+    _ensure_rows(log_worksheet, len(day_rows) + 1)
+    spreadsheet.values_batch_clear(body={'ranges': [f"'{PROFILE_WORKSHEET_NAME}'", f"'{PROFILE_DAYS_WORKSHEET_NAME}'"]})
+    spreadsheet.values_batch_update({'valueInputOption': 'RAW', 'data': [
+        {'range': f"'{PROFILE_WORKSHEET_NAME}'!A1", 'values': [PROFILE_COLUMNS] + profile_rows},
+        {'range': f"'{PROFILE_DAYS_WORKSHEET_NAME}'!A1", 'values': [PROFILE_DAYS_COLUMNS] + day_rows},
+    ]})
+    logger.info(f"Perfil horário reconstruído: {len(profile_rows)} células de {len(days_by_client)} clientes, {len(day_rows)} dias.")
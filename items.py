@@ -0,0 +1,165 @@
+import pandas as pd
+import gspread
+import time
+import json
+import os
+import logging
+
+from order_pipeline import MELI_API_BASE_URL
+from partitions import PartitionCatalog
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+ITEMS_WORKSHEET_NAME = "Itens"
+ITEM_COLUMNS = ["data", "cliente", "item_id", "titulo", "pedidos", "unidades", "faturamento", "preco_atual", "estoque"]
+ITEM_KEYS = ["cliente", "data", "item_id"]
+ITEMS_MULTIGET_URL = f"{MELI_API_BASE_URL}/items"
+ITEMS_BATCH_SIZE = 20  # limite de ids por chamada do multiget /items?ids=
+ITEM_ATTRIBUTES = "id,title,price,available_quantity"
+ITEM_CACHE_FILE = "item_metadata_cache.json"
+ITEM_CACHE_TTL_SECONDS = 24 * 60 * 60  # preço e estoque mudam; o título quase nunca
+
+# --- Cache Local de Metadados ---
+
+class ItemMetadataCache:
+    """Metadados por MLB (título, preço, estoque) com data de atualização, persistidos em JSON."""
+    def __init__(self, path=ITEM_CACHE_FILE, ttl_seconds=ITEM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.items = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.items = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Cache de itens '{path}' inválido. Começando vazio.")
+
+    def get(self, item_id):
+        return self.items.get(item_id)
+
+    def missing(self, item_ids):
+        """Ids ausentes do cache ou com metadados mais velhos que o TTL."""
+        now = time.time()
+        return [i for i in item_ids if i not in self.items or now - self.items[i].get("atualizado_em", 0) > self.ttl_seconds]
+
+    def update(self, item_id, metadata):
+        self.items[item_id] = {**metadata, "atualizado_em": time.time()}
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.items, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+def fetch_item_metadata(request_json, item_ids, cache):
+    """
+    Enriquece os itens pelo multiget /items?ids=, em lotes de ITEMS_BATCH_SIZE,
+    buscando apenas os ids que não estão (ou expiraram) no cache.
+    `request_json(url, params)` deve retornar o JSON da resposta ou levantar exceção.
+    """
+    missing = cache.missing(sorted(set(item_ids)))
+    for start in range(0, len(missing), ITEMS_BATCH_SIZE):
+        batch = missing[start:start + ITEMS_BATCH_SIZE]
+        try:
+            data = request_json(ITEMS_MULTIGET_URL, {"ids": ",".join(batch), "attributes": ITEM_ATTRIBUTES}) or []
+        except Exception as e:
+            logger.error(f"Falha no multiget de {len(batch)} itens: {e}")
+            continue
+        for entry in data:
+            body = entry.get("body") or {}
+            if entry.get("code") == 200 and body.get("id"):
+                cache.update(body["id"], {"titulo": body.get("title"), "preco": body.get("price"), "estoque": body.get("available_quantity")})
+    if missing:
+        logger.info(f"Metadados de itens: {len(missing)} buscados em {-(-len(missing) // ITEMS_BATCH_SIZE)} chamadas, {len(set(item_ids)) - len(missing)} do cache.")
+        cache.save()
+
+# --- Linhas da Aba Itens ---
+
+def build_item_rows(item_sales, cache, date_str, client_name):
+    """Combina o agregado do dia (ItemSalesSink) com os metadados do cache."""
+    rows = []
+    for item_id, sales in item_sales.items():
+        metadata = cache.get(item_id) or {}
+        rows.append({
+            "data": date_str,
+            "cliente": client_name,
+            "item_id": item_id,
+            "titulo": metadata.get("titulo") or sales["titulo"],
+            "pedidos": sales["pedidos"],
+            "unidades": sales["unidades"],
+            "faturamento": round(sales["faturamento"], 2),
+            "preco_atual": metadata.get("preco"),
+            "estoque": metadata.get("estoque"),
+        })
+    return rows
+
+def replace_day_rows(worksheet, rows, days):
+    """
+    Substitui na aba as linhas dos dias (cliente, data) coletados: atualiza os itens já gravados,
+    adiciona os novos e apaga os que saíram do dia (ex.: pedido cancelado). RAW, como os rollups.
+    """
+    values = worksheet.get_all_values()
+    header = values[0] if values and values[0] else []
+    if not header:
+        header = ITEM_COLUMNS
+        worksheet.update([header], value_input_option='RAW')
+        values = [header]
+
+    key_positions = [header.index(col) for col in ITEM_KEYS]
+    day_positions = [header.index(col) for col in ["cliente", "data"]]
+    existing_index = {}
+    for row_number, row in enumerate(values[1:], start=2):
+        if tuple(row[pos] if pos < len(row) else "" for pos in day_positions) in days:
+            existing_index[tuple(row[pos] if pos < len(row) else "" for pos in key_positions)] = row_number
+
+    df_aligned = pd.DataFrame(rows, columns=ITEM_COLUMNS).reindex(columns=header)
+    df_aligned = df_aligned.astype(object).where(pd.notna(df_aligned), "")
+    updates_to_batch, rows_to_append, written_keys = [], [], set()
+    for row in df_aligned.values.tolist():
+        key = tuple(str(row[pos]) for pos in key_positions)
+        written_keys.add(key)
+        if key in existing_index:
+            updates_to_batch.append({'range': f'A{existing_index[key]}', 'values': [row]})
+        else:
+            rows_to_append.append(row)
+    stale_rows = sorted((row_number for key, row_number in existing_index.items() if key not in written_keys), reverse=True)
+
+    if updates_to_batch:
+        worksheet.batch_update(updates_to_batch, value_input_option='RAW')
+    if rows_to_append:
+        worksheet.append_rows(rows_to_append, value_input_option='RAW')
+    if stale_rows:
+        # De baixo para cima, numa única requisição: cada exclusão não desloca as linhas ainda por apagar
+        worksheet.spreadsheet.batch_update({'requests': [
+            {'deleteDimension': {'range': {'sheetId': worksheet.id, 'dimension': 'ROWS', 'startIndex': n - 1, 'endIndex': n}}}
+            for n in stale_rows
+        ]})
+    logger.info(f"Aba '{worksheet.title}': {len(updates_to_batch)} linhas atualizadas, {len(rows_to_append)} adicionadas, {len(stale_rows)} apagadas.")
+
+def write_item_rows(spreadsheet, rows, days):
+    """
+    Grava as linhas (cliente, data, item) dos dias `days` {(cliente, 'YYYY-MM-DD')} coletados nesta execução.
+    A aba Itens é particionada por mês (ver partitions.py): cada escrita lê só a partição do dia.
+    Numa planilha que já tem a aba única, ela continua em uso até `partitions.py --migrar Itens`.
+    """
+    if not days:
+        return
+    try:
+        catalog = PartitionCatalog(spreadsheet)
+        if not catalog.is_partitioned(ITEMS_WORKSHEET_NAME):
+            try:
+                spreadsheet.worksheet(ITEMS_WORKSHEET_NAME)
+                logger.warning(f"Aba '{ITEMS_WORKSHEET_NAME}' ainda não particionada: a escrita lê a aba inteira. Rode 'partitions.py --migrar {ITEMS_WORKSHEET_NAME}'.")
+            except gspread.WorksheetNotFound:
+                catalog.enable(ITEMS_WORKSHEET_NAME)
+        days = {(str(client_name), str(date_str)) for client_name, date_str in days}
+        for date_str in sorted({date_str for _, date_str in days}):
+            if catalog.is_partitioned(ITEMS_WORKSHEET_NAME):
+                worksheet = catalog.worksheet_for(ITEMS_WORKSHEET_NAME, date_str, ITEM_COLUMNS)
+            else:
+                worksheet = spreadsheet.worksheet(ITEMS_WORKSHEET_NAME)
+            replace_day_rows(worksheet, [row for row in rows if str(row["data"]) == date_str],
+                             {day for day in days if day[1] == date_str})
+    except gspread.exceptions.APIError as e:
+        logger.error(f"ERRO DE API ao gravar a aba '{ITEMS_WORKSHEET_NAME}': {e}")
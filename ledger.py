@@ -0,0 +1,139 @@
+import pandas as pd
+from datetime import datetime
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+LEDGER_FILE = "backfill_ledger.jsonl"
+STATUS_OK = "ok"
+STATUS_ERROR = "erro"
+
+# --- Ledger de Conclusão por (cliente, dia, fonte) ---
+
+class CompletionLedger:
+    """
+    Registro append-only de cada unidade (cliente, dia, fonte) processada.
+    Cada linha é gravada com fsync; a última linha de um arquivo interrompido no
+    meio da escrita é ignorada na leitura. O status mais recente de cada unidade prevalece.
+    """
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.status = {}
+        self.legacy_marks = {}  # (cliente, fonte) -> (último dia do estado legado, dia da importação)
+        self._offset = 0  # bytes já lidos do arquivo
+        self.refresh()
+
+    def refresh(self):
+        """
+        Lê as linhas acrescentadas desde a última leitura (por este ou por outros processos).
+        Uma última linha sem quebra de linha ainda está sendo gravada: fica para a próxima leitura.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.decode('utf-8').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Linha do ledger '{self.path}' ignorada (escrita incompleta).")
+                continue
+            self._index(entry)
+        self._offset += len(complete)
+
+    def _index(self, entry):
+        self.status[(entry['cliente'], entry['dia'], entry['fonte'])] = entry['status']
+        if entry.get('legado'):
+            self.legacy_marks[(entry['cliente'], entry['fonte'])] = (entry['dia'], entry['registrado_em'][:10])
+
+    def _append(self, entries):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            self._index(entry)
+
+    @staticmethod
+    def _entry(client_name, day, source, status, detail):
+        entry = {"cliente": client_name, "dia": day if isinstance(day, str) else day.strftime('%Y-%m-%d'),
+                 "fonte": source, "status": status, "registrado_em": datetime.now().isoformat(timespec='seconds')}
+        if detail:
+            entry["detalhe"] = str(detail)[:500]
+        return entry
+
+    def record(self, client_name, day, source, status=STATUS_OK, detail=None):
+        """Acrescenta o resultado de uma unidade ao ledger de forma durável."""
+        self._append([self._entry(client_name, day, source, status, detail)])
+
+    def record_many(self, client_name, days, source, status=STATUS_OK, detail=None):
+        """Acrescenta vários dias do cliente de uma só vez (um único fsync)."""
+        entries = [self._entry(client_name, day, source, status, detail) for day in days]
+        if entries:
+            self._append(entries)
+
+    def done_days(self, client_name, source):
+        """Dias ('YYYY-MM-DD') concluídos do cliente na fonte, incluindo os cobertos pelo estado legado."""
+        days = {d for (c, d, s), status in self.status.items() if c == client_name and s == source and status == STATUS_OK}
+        mark = self.legacy_marks.get((client_name, source))
+        if mark is not None and mark[0] <= mark[1]:
+            days |= {d.strftime('%Y-%m-%d') for d in pd.date_range(start=mark[0], end=mark[1], freq='D')}
+        return days
+
+    def is_done(self, client_name, day_str, source):
+        if self.status.get((client_name, day_str, source)) == STATUS_OK:
+            return True
+        # Dias cobertos pelo estado legado: do último dia registrado até a data da importação
+        mark = self.legacy_marks.get((client_name, source))
+        return mark is not None and mark[0] <= day_str <= mark[1]
+
+    def has_entries(self, client_name, source):
+        return any(c == client_name and s == source for c, _, s in self.status)
+
+    def plan(self, client_name, source, start_date, end_date):
+        """Dias do intervalo ainda não concluídos (ausentes ou com erro), do mais recente ao mais antigo."""
+        days = pd.date_range(start=start_date, end=end_date, freq='D')
+        pending = [d.strftime('%Y-%m-%d') for d in days if not self.is_done(client_name, d.strftime('%Y-%m-%d'), source)]
+        return sorted(pending, reverse=True)
+
+    def summary(self, client_name, source, start_date, end_date):
+        """Contagem de dias concluídos, com erro e nunca tentados no intervalo."""
+        counts = {STATUS_OK: 0, STATUS_ERROR: 0, "ausente": 0}
+        for d in pd.date_range(start=start_date, end=end_date, freq='D'):
+            day_str = d.strftime('%Y-%m-%d')
+            counts[STATUS_OK if self.is_done(client_name, day_str, source) else self.status.get((client_name, day_str, source), "ausente")] += 1
+        return counts
+
+    def import_legacy_state(self, state_file, source):
+        """
+        Importa um arquivo de estado antigo ({cliente: último dia processado}) como uma marca por cliente.
+        Só o dia registrado é gravado no ledger; como os scripts antigos processavam de hoje para trás
+        e retomavam abaixo desse dia, o planejador trata os dias entre ele e a data da importação
+        (gravada na própria marca, não a data de modificação do arquivo) como já cobertos.
+        Clientes que já têm registros para a fonte não são reimportados.
+        """
+        if not os.path.exists(state_file):
+            return
+        try:
+            with open(state_file, 'r') as f:
+                legacy_state = json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Arquivo de estado '{state_file}' inválido. Ignorando importação.")
+            return
+
+        for client_name, last_day in legacy_state.items():
+            if self.has_entries(client_name, source):
+                continue
+            entry = self._entry(client_name, last_day, source, STATUS_OK, f"importado de {state_file}")
+            entry["legado"] = True
+            self._append([entry])
+            logger.info(f"Estado legado de '{client_name}' importado: retomada abaixo de {last_day} ({source}).")
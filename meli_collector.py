@@ -0,0 +1,198 @@
+import pandas as pd
+import requests
+import gspread
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import logging
+from google.oauth2.service_account import Credentials
+import os
+from io import StringIO
+import toml
+from order_pipeline import fetch_orders, run_order_pipeline, json_loads, DailyConsolidatedSink
+from consolidated_index import open_sheet_index
+from telemetry import telemetry
+from preflight import describe_request_error, resolve_client, run_preflight
+
+logger = logging.getLogger(__name__)
+
+# Coleta diária compartilhada pelos coletores (daily_collector, historical_data_run_v2, backfill_queue,
+# reconcile_orders) e pela exportação horária: token, cliente HTTP e a linha da aba consolidada.
+
+# --- Constantes ---
+MELI_API_BASE_URL = os.environ.get("MELI_API_BASE_URL", "https://api.mercadolibre.com")
+API_TIMEOUT = 60
+MAX_RETRIES = 3
+
+# --- Autenticação ---
+
+def get_new_access_token(client_info):
+    url = f"{MELI_API_BASE_URL}/oauth/token"
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    data = {
+        "grant_type": "refresh_token", "client_id": client_info["app_id"],
+        "client_secret": client_info["client_secret"], "refresh_token": client_info["refresh_token"]
+    }
+    try:
+        response = requests.post(url, headers=headers, data=data, timeout=API_TIMEOUT, hooks=telemetry.hooks())
+        response.raise_for_status()
+        logger.info("Access Token renovado com sucesso.")
+        return response.json()["access_token"]
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Erro ao renovar o Access Token de {client_info['client_name']}: {describe_request_error(e)}")
+        return None
+
+# --- Cliente da API do Mercado Livre ---
+
+class MercadoLivreAdsCollector:
+    def __init__(self, access_token):
+        self.access_token = access_token
+        self.base_url = MELI_API_BASE_URL
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {self.access_token}"})
+        telemetry.instrument_session(self.session)
+
+    def _make_request(self, url, params=None, headers=None):
+        for attempt in range(MAX_RETRIES):
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=API_TIMEOUT)
+                response.raise_for_status()
+                return json_loads(response.content)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # ValueError: corpo que não é JSON válido (decodificado por json_loads)
+                logger.warning(f"Tentativa {attempt + 1}/{MAX_RETRIES} falhou para {url}. Erro: {e}")
+                if isinstance(e, requests.exceptions.RequestException) and e.response is None:
+                    telemetry.record_failure("GET", url)
+                if attempt + 1 == MAX_RETRIES:
+                    logger.error("Número máximo de retentativas atingido.")
+                    raise
+                telemetry.record_retry("GET", url)
+                telemetry.sleep(5 * (attempt + 1), "backoff_meli")
+        return None
+
+    def get_user_id(self):
+        try:
+            data = self._make_request(f"{self.base_url}/users/me")
+            return data.get('id') if data else None
+        except Exception as e:
+            logger.error(f"Não foi possível obter o ID do usuário: {e}")
+            return None
+
+    def get_business_metrics(self, seller_id, date_str, extra_sinks=None):
+        """
+        Métricas de pedidos e visitas do dia. Os pedidos são baixados uma única vez e
+        entregues ao agregado diário e aos sinks adicionais da coleta (hoje, vendas por item).
+        """
+        logger.info(f"Iniciando coleta de métricas para {date_str}...")
+        brasil_timezone = ZoneInfo("America/Sao_Paulo")
+        daily_sink = DailyConsolidatedSink(date_str, brasil_timezone)
+        sinks = [daily_sink] + list(extra_sinks or [])
+
+        orders = fetch_orders(lambda url, params: self._make_request(url, params=params), seller_id, date_str)
+        results = run_order_pipeline(orders, sinks)
+        orders_metrics = results[daily_sink.name]
+        
+        logger.info(f"-- Resumo do dia {date_str} -- Vendas: {orders_metrics.get('quantidade_vendas', 0)}, Unidades: {orders_metrics.get('unidades_vendidas', 0)}, Faturamento: R$ {orders_metrics.get('faturamento_bruto', 0):.2f}")
+        
+        visits_metrics = {}
+        try:
+            visits_data = self._make_request(f"{self.base_url}/users/{seller_id}/items_visits", params={"date_from": date_str, "date_to": date_str})
+            if visits_data: visits_metrics = {"visitas": visits_data.get("total_visits", 0)}
+        except Exception as e:
+            logger.error(f"Falha ao buscar visitas para o dia {date_str}: {e}")
+
+        return {**orders_metrics, **visits_metrics}
+
+    def get_ads_summary_metrics(self, advertiser_id, date_str):
+        params = {"date_from": date_str, "date_to": date_str, "metrics_summary": "true", "metrics": "cost,acos,direct_amount,indirect_amount,total_amount,clicks,prints"}
+        try:
+            data = self._make_request(f"{self.base_url}/advertising/advertisers/{advertiser_id}/product_ads/campaigns", params=params, headers={"Api-Version": "2"})
+            return data.get("metrics_summary", {}) if data else {}
+        except Exception as e:
+            logger.error(f"Falha ao buscar métricas de publicidade para {date_str}: {e}")
+            return {}
+        
+    def get_advertisers(self):
+        try:
+            data = self._make_request(f"{self.base_url}/advertising/advertisers", params={"product_id": "PADS"}, headers={"Api-Version": "1"})
+            return data if data else None
+        except Exception as e:
+            logger.error(f"Falha ao buscar anunciantes: {e}")
+            return None
+
+# --- Clientes, Planilha e Linha Consolidada ---
+
+def load_clients_and_credentials():
+    """Carrega as credenciais do Google e o CSV de clientes (arquivo local ou variáveis de ambiente)."""
+    if os.path.exists('.streamlit/secrets.toml'):
+        secrets = toml.load('.streamlit/secrets.toml'); google_creds = secrets['google_credentials']
+        # Para execução local, você pode querer criar um 'clients.csv'
+        with open('clients.csv', 'r') as f: clients_csv_data = f.read()
+    else:
+        google_creds_str = os.environ['GOOGLE_CREDENTIALS']; clients_csv_data = os.environ['MELI_CLIENTS_CSV']; google_creds = toml.loads(google_creds_str)['google_credentials']
+    clients_df = pd.read_csv(StringIO(clients_csv_data))
+    clients_df['client_name'] = clients_df['client_name'].str.strip()
+    return google_creds, clients_df
+
+def open_consolidated_sheet(google_creds):
+    """Abre a planilha e retorna (spreadsheet, aba consolidada, índice das chaves da aba)."""
+    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+    creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
+    client_gspread = telemetry.instrument_gspread(gspread.authorize(creds))
+    spreadsheet = client_gspread.open("Histórico de Vendas Meli - 2024")
+    worksheet_consolidado = spreadsheet.worksheet("Dados Consolidados v2")
+    # Só cabeçalho e colunas-chave (das partições tocadas, se a aba for particionada):
+    # linhas completas são baixadas sob demanda no upsert e nos rollups
+    consolidado_index = open_sheet_index(spreadsheet, worksheet_consolidado)
+    return spreadsheet, worksheet_consolidado, consolidado_index
+
+def prepare_client(client_info, id_cache=None):
+    """Renova o token e resolve user_id e anunciante. Retorna (collector, user_id, advertiser_id, nome) ou None."""
+    prepared_client, reason = resolve_client(client_info, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+    if not prepared_client:
+        logger.error(f"Cliente {client_info['client_name']} não pôde ser preparado: {reason}. Pulando para o próximo cliente.")
+    return prepared_client
+
+def prepare_all_clients(clients_df, id_cache):
+    """Pré-validação concorrente das credenciais. Retorna (preparados, inativos); ver preflight.run_preflight."""
+    return run_preflight(clients_df, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+
+def build_consolidated_row(business_metrics, ads_metrics, date_str, client_name_from_api, timezone):
+    """Monta a linha formatada da aba 'Dados Consolidados v2'."""
+    faturamento = pd.to_numeric(business_metrics.get("faturamento_bruto"), errors='coerce')
+    qtde_vendas = pd.to_numeric(business_metrics.get("quantidade_vendas"), errors='coerce')
+    visitas = pd.to_numeric(business_metrics.get("visitas"), errors='coerce')
+    unidades_vendidas = pd.to_numeric(business_metrics.get("unidades_vendidas"), errors='coerce')
+    investimento_ads = pd.to_numeric(ads_metrics.get("cost"), errors='coerce')
+    vendas_ads = pd.to_numeric(ads_metrics.get("total_amount"), errors='coerce')
+    impressoes = pd.to_numeric(ads_metrics.get("prints"), errors='coerce')
+    cliques = pd.to_numeric(ads_metrics.get("clicks"), errors='coerce')
+    acos_percent = pd.to_numeric(ads_metrics.get("acos"), errors='coerce')
+
+    taxa_conversao = (qtde_vendas / visitas * 100) if pd.notna(qtde_vendas) and pd.notna(visitas) and visitas > 0 else 0
+    tacos = (investimento_ads / faturamento * 100) if pd.notna(investimento_ads) and pd.notna(faturamento) and faturamento > 0 else 0
+    roas = (vendas_ads / investimento_ads) if pd.notna(vendas_ads) and pd.notna(investimento_ads) and investimento_ads > 0 else 0
+    vendas_sem_ads = (faturamento - vendas_ads) if pd.notna(faturamento) and pd.notna(vendas_ads) else faturamento
+    cpc = (investimento_ads / cliques) if pd.notna(investimento_ads) and pd.notna(cliques) and cliques > 0 else 0
+    ctr = (cliques / impressoes * 100) if pd.notna(cliques) and pd.notna(impressoes) and impressoes > 0 else 0
+
+    return {
+        "data_geracao": datetime.now(timezone).strftime('%Y-%m-%d %H:%M:%S'),
+        "periodo_consulta": date_str,
+        "cliente": client_name_from_api,
+        "Faturamento": f"R$ {faturamento:,.2f}" if pd.notna(faturamento) else "R$ 0,00",
+        "Investimento": f"R$ {investimento_ads:,.2f}" if pd.notna(investimento_ads) else None,
+        "Quantidade de Vendas": int(qtde_vendas) if pd.notna(qtde_vendas) else 0,
+        "Unidades Vendidas": int(unidades_vendidas) if pd.notna(unidades_vendidas) else 0,
+        "Visitas": int(visitas) if pd.notna(visitas) else 0,
+        "Taxa de Conversão Média": f"{taxa_conversao:.2f}%" if taxa_conversao > 0 else None,
+        "ACOS": f"{acos_percent:.2f}%" if pd.notna(acos_percent) else None,
+        "TACOS": f"{tacos:.2f}%" if tacos > 0 else None,
+        "ROAS": f"{roas:.2f}" if roas > 0 else None,
+        "ROI Média": f"{roas:.2f}" if roas > 0 else None,
+        "Vendas por Ads": f"R$ {vendas_ads:,.2f}" if pd.notna(vendas_ads) else None,
+        "Vendas sem Ads": f"R$ {vendas_sem_ads:,.2f}" if pd.notna(vendas_sem_ads) else None,
+        "Cliques": int(cliques) if pd.notna(cliques) else None,
+        "CPC": f"R$ {cpc:,.2f}" if cpc > 0 else None,
+        "CTR": f"{ctr:.2f}%" if ctr > 0 else None,
+        "Impressões": int(impressoes) if pd.notna(impressoes) else None,
+    }
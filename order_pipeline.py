@@ -0,0 +1,245 @@
+import pandas as pd
+from abc import ABC, abstractmethod
+from datetime import datetime
+import logging
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+MELI_API_BASE_URL = os.environ.get("MELI_API_BASE_URL", "https://api.mercadolibre.com")
+ORDERS_SEARCH_URL = f"{MELI_API_BASE_URL}/orders/search"
+ORDERS_PAGE_LIMIT = 50
+PAID_STATUSES = ['paid', 'shipped', 'delivered']
+
+# Projeção de campos: só o que os sinks usam. Compradores, envios e pagamentos não são pedidos à API.
+ORDERS_PROJECTION_ENABLED = os.environ.get("MELI_ORDERS_PROJECTION", "1") != "0"
+ORDER_FIELDS = ["id", "date_created", "last_updated", "total_amount", "status", "tags", "order_items"]
+ORDER_ATTRIBUTES = ",".join(["paging"] + [f"results.{field}" for field in ORDER_FIELDS])
+UPDATED_ORDER_FIELDS = ["id", "date_created", "last_updated", "status", "total_amount"]
+_projection_supported = True
+
+# --- Decodificação ---
+
+def json_loads(content):
+    """Decodifica o corpo da resposta com orjson, se instalado; senão com o json da biblioteca padrão."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def compact_order(order):
+    """Reduz o pedido aos campos usados pelos sinks (libera o restante do documento logo após a decodificação)."""
+    return {
+        "id": order.get("id"),
+        "date_created": order.get("date_created"),
+        "last_updated": order.get("last_updated"),
+        "total_amount": order.get("total_amount", 0),
+        "status": order.get("status"),
+        "tags": order.get("tags", []),
+        "order_items": [
+            {
+                "item": {"id": (order_item.get("item") or {}).get("id"), "title": (order_item.get("item") or {}).get("title")},
+                "quantity": order_item.get("quantity", 0),
+                "unit_price": order_item.get("unit_price"),
+            }
+            for order_item in order.get("order_items", [])
+        ],
+    }
+
+# --- Ingestão de Pedidos ---
+
+def _rejects_projection(error):
+    """True só quando a API recusou explicitamente o parâmetro `attributes` (400 citando o parâmetro)."""
+    response = getattr(error, "response", None)
+    if response is None or response.status_code != 400:
+        return False
+    try:
+        body = response.text or ""
+    except Exception:
+        return False
+    return "attributes" in body.lower()
+
+def _fetch_order_pages(request_json, base_params, limit, fields=ORDER_FIELDS):
+    """
+    Pagina /orders/search com os filtros de `base_params`, gerando os pedidos já compactados.
+    Pede à API apenas `fields`; a projeção só é desligada no processo quando a API recusa o parâmetro
+    ou responde sem os campos pedidos. Outras falhas (rede, 5xx, token) sobem como antes.
+    """
+    global _projection_supported
+    attributes = ",".join(["paging"] + [f"results.{field}" for field in fields])
+    offset, received = 0, 0
+
+    while True:
+        params = {**base_params, "offset": offset, "limit": limit}
+        projected = ORDERS_PROJECTION_ENABLED and _projection_supported
+        if projected:
+            params["attributes"] = attributes
+        logger.info(f"Buscando pedidos... Página com offset {offset}")
+        try:
+            data = request_json(ORDERS_SEARCH_URL, params)
+        except Exception as e:
+            if not projected or not _rejects_projection(e):
+                raise
+            logger.warning(f"A API recusou a projeção de campos de /orders/search ({e}). Seguindo sem projeção.")
+            _projection_supported = False
+            continue
+        if not data:
+            raise Exception(f"Falha irrecuperável ao buscar página de pedidos com offset {offset}")
+        page_orders = data.get('results', [])
+        if projected and page_orders and ("date_created" not in page_orders[0] or "paging" not in data):
+            logger.warning("A API não respeitou a projeção de campos de /orders/search. Seguindo sem projeção.")
+            _projection_supported = False
+            continue
+        received += len(page_orders)
+        yield from (compact_order(order) for order in page_orders)
+
+        paging = data.get('paging', {})
+        if not page_orders or (paging.get('offset', offset) + limit) >= paging.get('total', 0):
+            logger.info(f"Paginação concluída. Total de {received} pedidos recebidos da API.")
+            break
+        offset += limit
+
+def fetch_orders(request_json, seller_id, date_str, limit=ORDERS_PAGE_LIMIT):
+    """
+    Gera os pedidos criados no dia (fuso -03:00), página a página, já compactados.
+    `request_json(url, params)` deve retornar o JSON da resposta ou levantar exceção.
+    """
+    base_params = {
+        "seller": seller_id, "order.date_created.from": f"{date_str}T00:00:00.000-03:00",
+        "order.date_created.to": f"{date_str}T23:59:59.999-03:00", "sort": "date_asc",
+    }
+    yield from _fetch_order_pages(request_json, base_params, limit)
+
+def fetch_updated_orders(request_json, seller_id, updated_from, updated_to, limit=ORDERS_PAGE_LIMIT):
+    """
+    Gera os pedidos alterados (cancelamento, devolução, mediação...) entre dois instantes ISO 8601,
+    pelo filtro de last_updated. Só os campos necessários para localizar o dia de criação são pedidos.
+    """
+    base_params = {
+        "seller": seller_id, "order.last_updated.from": updated_from,
+        "order.last_updated.to": updated_to, "sort": "date_asc",
+    }
+    yield from _fetch_order_pages(request_json, base_params, limit, fields=UPDATED_ORDER_FIELDS)
+
+def run_order_pipeline(orders, sinks):
+    """Percorre os pedidos uma única vez, entregando cada um aos sinks cujo filtro o aceita."""
+    for order in orders:
+        for sink in sinks:
+            if sink.accepts(order):
+                sink.consume(order)
+    return {sink.name: sink.result() for sink in sinks}
+
+# --- Sinks ---
+
+class OrderSink(ABC):
+    """Base dos sinks: cada saída define seu próprio filtro (accepts) e agregação (consume/result)."""
+    name = "base"
+
+    def accepts(self, order):
+        return True
+
+    @abstractmethod
+    def consume(self, order):
+        ...
+
+    @abstractmethod
+    def result(self):
+        ...
+
+class DailyConsolidatedSink(OrderSink):
+    """Agregado diário da aba consolidada: todos os pedidos do dia, exceto os de teste."""
+    name = "diario"
+
+    def __init__(self, date_str, timezone):
+        self.target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        self.timezone = timezone
+        self.faturamento = 0
+        self.unidades_vendidas = 0
+        self.quantidade_vendas = 0
+        self.reasons_for_discard = {'wrong_date': 0, 'test_order': 0}
+
+    def accepts(self, order):
+        order_date_obj = pd.to_datetime(order.get("date_created")).tz_convert(self.timezone)
+        if order_date_obj.date() != self.target_date:
+            self.reasons_for_discard['wrong_date'] += 1
+            return False
+        if "test_order" in order.get("tags", []):
+            self.reasons_for_discard['test_order'] += 1
+            return False
+        return True
+
+    def consume(self, order):
+        self.faturamento += order.get('total_amount', 0)
+        self.unidades_vendidas += sum(item.get('quantity', 0) for item in order.get('order_items', []))
+        self.quantidade_vendas += 1
+
+    def result(self):
+        logger.info(f"Pedidos válidos para soma (após filtro de data e teste): {self.quantidade_vendas}.")
+        logger.info(f"Pedidos descartados: {self.reasons_for_discard}")
+        if not self.quantidade_vendas:
+            return {}
+        return {"faturamento_bruto": self.faturamento, "unidades_vendidas": self.unidades_vendidas, "quantidade_vendas": self.quantidade_vendas}
+
+class HourlyRowsSink(OrderSink):
+    """
+    Linhas por pedido das saídas horárias: apenas pedidos pagos, enviados ou entregues.
+    Entra na mesma passada da coleta D-1 (daily_collector, ver hourly_output) e na exportação do histórico.
+    """
+    name = "horario"
+
+    def __init__(self, client_name, hourly_profile=None):
+        self.client_name = client_name
+        self.hourly_profile = hourly_profile
+        self.rows = []
+
+    def accepts(self, order):
+        return order.get('status') in PAID_STATUSES
+
+    def consume(self, order):
+        row_data = {
+            "data_hora": pd.to_datetime(order['date_created']).strftime('%Y-%m-%d %H:%M:%S'),
+            "quantidade_vendas": sum(item.get('quantity', 0) for item in order.get('order_items', [])),
+            "faturamento": order.get('total_amount', 0),
+            "cliente": self.client_name
+        }
+        self.rows.append(row_data)
+        if self.hourly_profile is not None:
+            self.hourly_profile.add_order(self.client_name, order['date_created'], row_data["quantidade_vendas"], row_data["faturamento"])
+
+    def result(self):
+        return self.rows
+
+class ItemSalesSink(OrderSink):
+    """Agregado do dia por anúncio (MLB): pedidos, unidades e faturamento, com o mesmo filtro da aba consolidada."""
+    name = "itens"
+
+    def __init__(self, date_str, timezone):
+        self.target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        self.timezone = timezone
+        self.items = {}
+
+    def accepts(self, order):
+        order_date_obj = pd.to_datetime(order.get("date_created")).tz_convert(self.timezone)
+        return order_date_obj.date() == self.target_date and "test_order" not in order.get("tags", [])
+
+    def consume(self, order):
+        for order_item in order.get('order_items', []):
+            item = order_item.get('item') or {}
+            item_id = item.get('id')
+            if not item_id:
+                continue
+            sales = self.items.setdefault(item_id, {"titulo": item.get('title'), "pedidos": set(), "unidades": 0, "faturamento": 0.0})
+            quantity = order_item.get('quantity', 0)
+            # Um pedido com o mesmo anúncio em várias linhas (variações) conta uma vez
+            sales["pedidos"].add(order.get('id'))
+            sales["unidades"] += quantity
+            sales["faturamento"] += quantity * (order_item.get('unit_price') or 0)
+
+    def result(self):
+        return {item_id: {**sales, "pedidos": len(sales["pedidos"])} for item_id, sales in self.items.items()}
@@ -0,0 +1,161 @@
+import json
+import os
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+import gspread
+
+from hourly_profile import PROFILE_WORKSHEET_NAME, PROFILE_COLUMNS, PROFILE_METRICS
+from rollups import upsert_rows_by_key
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+PACING_CURVES_FILE = "pacing_curves.json"
+CURVES_MAX_AGE_SECONDS = 24 * 60 * 60  # o perfil horário muda pouco de um dia para o outro
+MIN_DAY_FRACTION = 0.05  # antes disso a projeção é só ruído (madrugada)
+PROJECTION_WORKSHEET = "Projecao_Fim_do_Dia"
+PROJECTION_COLUMNS = [
+    "data_geracao", "periodo_consulta", "cliente", "fracao_do_dia",
+    "Faturamento Projetado", "Quantidade de Vendas Projetada", "Investimento Projetado",
+]
+# Métrica do realtime -> curva do perfil horário usada para projetá-la.
+# Não há investimento por hora: o gasto em Ads segue a curva de pedidos.
+PROJECTED_METRICS = {"faturamento": "faturamento", "quantidade_vendas": "pedidos", "investimento": "pedidos"}
+PROJECTION_KEYS = ["cliente"]  # só a projeção mais recente de cada cliente: a aba não cresce com os dias
+
+# --- Curvas Acumuladas ---
+
+def build_curves(profile_rows):
+    """
+    Curvas acumuladas por cliente a partir das linhas do perfil horário
+    (cliente, dia_semana, hora, pedidos, unidades, faturamento).
+    curva[dia][h] é a fração do dia concluída até o início da hora h (25 pontos, de 0 a 1);
+    a linha 7 é a curva da semana inteira, usada quando o dia da semana não tem histórico.
+    """
+    grids = {}
+    for row in profile_rows:
+        client_name, weekday, hour = str(row[0]), int(row[1]), int(row[2])
+        grid = grids.setdefault(client_name, {metric: np.zeros((8, 24)) for metric in PROFILE_METRICS})
+        for metric, value in zip(PROFILE_METRICS, row[3:3 + len(PROFILE_METRICS)]):
+            grid[metric][weekday, hour] += float(value or 0)
+
+    curves = {}
+    for client_name, grid in grids.items():
+        curves[client_name] = {}
+        for metric, values in grid.items():
+            values[7] = values[:7].sum(axis=0)
+            totals = values.sum(axis=1, keepdims=True)
+            cumulative = np.hstack([np.zeros((8, 1)), np.cumsum(values, axis=1)])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                fractions = np.where(totals > 0, cumulative / totals, np.nan)
+            curves[client_name][metric] = [[None if np.isnan(v) else round(float(v), 6) for v in day] for day in fractions]
+    return curves
+
+class PacingCurves:
+    """
+    Curvas de ritmo do dia por cliente, em JSON. São reconstruídas a partir da aba de perfil horário
+    (já agregada e mantida incrementalmente pela exportação horária) quando passam de um dia;
+    na execução em tempo real a projeção é só uma consulta às curvas.
+    """
+    def __init__(self, path=PACING_CURVES_FILE):
+        self.path = path
+        self.generated_at = 0
+        self.curves = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.generated_at, self.curves = data.get("gerado_em", 0), data.get("curvas", {})
+            except json.JSONDecodeError:
+                logger.warning(f"Curvas de ritmo '{path}' inválidas. Serão reconstruídas.")
+
+    def is_stale(self):
+        return not self.curves or time.time() - self.generated_at > CURVES_MAX_AGE_SECONDS
+
+    def rebuild(self, profile_rows):
+        self.curves = build_curves(profile_rows)
+        self.generated_at = time.time()
+
+    def day_fraction(self, client_name, metric, moment):
+        """Fração do dia normalmente concluída até `moment`, interpolando dentro da hora corrente."""
+        client_curves = self.curves.get(client_name, {}).get(metric)
+        if not client_curves:
+            return None
+        curve = client_curves[moment.weekday()]
+        if curve[24] is None:
+            curve = client_curves[7]
+        if curve[24] is None:
+            return None
+        hour = moment.hour
+        within_hour = (moment.minute * 60 + moment.second) / 3600
+        return curve[hour] + (curve[hour + 1] - curve[hour]) * within_hour
+
+    def project(self, client_name, moment, partials):
+        """
+        Projeção de fim de dia: total parcial / fração do dia concluída, por métrica de PROJECTED_METRICS.
+        Retorna (fração do dia pela curva de faturamento, {métrica: projeção}); métricas sem curva
+        ou cedo demais no dia ficam de fora.
+        """
+        projections, revenue_fraction = {}, None
+        for metric, curve_metric in PROJECTED_METRICS.items():
+            value = partials.get(metric)
+            fraction = self.day_fraction(client_name, curve_metric, moment)
+            if curve_metric == "faturamento":
+                revenue_fraction = fraction
+            if value is None or value != value or fraction is None or fraction < MIN_DAY_FRACTION:
+                continue
+            projections[metric] = float(value) / fraction
+        return revenue_fraction, projections
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"gerado_em": self.generated_at, "curvas": self.curves}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+def refresh_curves_from_sheet(curves, spreadsheet):
+    """Reconstrói as curvas a partir da aba de perfil horário quando estão ausentes ou velhas."""
+    if not curves.is_stale():
+        return
+    try:
+        values = spreadsheet.worksheet(PROFILE_WORKSHEET_NAME).get_all_values(value_render_option='UNFORMATTED_VALUE')
+    except gspread.WorksheetNotFound:
+        logger.warning(f"Aba '{PROFILE_WORKSHEET_NAME}' não encontrada. Projeção de fim de dia indisponível.")
+        return
+    rows = [row for row in values[1:] if len(row) >= len(PROFILE_COLUMNS) and row[0] != ""]
+    curves.rebuild(rows)
+    curves.save()
+    logger.info(f"Curvas de ritmo reconstruídas para {len(curves.curves)} clientes.")
+
+# --- Aba de Projeção ---
+
+def build_projection_row(curves, client_name, client_name_from_api, date_str, moment, partials):
+    """Linha da aba de projeção para o cliente, ou None se nenhuma métrica pôde ser projetada."""
+    fraction, projections = curves.project(client_name, moment, partials)
+    if not projections:
+        return None
+    row = {"data_geracao": moment.strftime('%Y-%m-%d %H:%M:%S'), "periodo_consulta": date_str, "cliente": client_name_from_api,
+           "fracao_do_dia": round(fraction, 4) if fraction is not None else None}
+    if "faturamento" in projections: row["Faturamento Projetado"] = round(projections["faturamento"], 2)
+    if "quantidade_vendas" in projections: row["Quantidade de Vendas Projetada"] = int(round(projections["quantidade_vendas"]))
+    if "investimento" in projections: row["Investimento Projetado"] = round(projections["investimento"], 2)
+    return row
+
+def write_projections(spreadsheet, rows):
+    """Grava as projeções numa linha por cliente, sobrescrita a cada execução (a leitura da aba fica limitada ao número de clientes)."""
+    if not rows:
+        return
+    try:
+        try:
+            worksheet = spreadsheet.worksheet(PROJECTION_WORKSHEET)
+        except gspread.WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title=PROJECTION_WORKSHEET, rows="1", cols=len(PROJECTION_COLUMNS))
+            worksheet.update([PROJECTION_COLUMNS], value_input_option='RAW')
+            logger.info(f"Aba '{PROJECTION_WORKSHEET}' criada com sucesso.")
+        upsert_rows_by_key(worksheet, pd.DataFrame(rows, columns=PROJECTION_COLUMNS), PROJECTION_KEYS)
+        logger.info(f"{len(rows)} projeções de fim de dia gravadas na aba '{PROJECTION_WORKSHEET}'.")
+    except gspread.exceptions.APIError as e:
+        logger.error(f"ERRO DE API ao gravar a aba '{PROJECTION_WORKSHEET}': {e}")
@@ -1,50 +1,78 @@
 # pages/1_Overview_Performance.py
 import streamlit as st
 import pandas as pd
-from utils import load_data, get_sidebar_filters
+from utils import (
+    start_background_refresh, load_rollups, load_dimensions, get_sidebar_selection,
+    previous_period, derived_ratios, render_detail_table,
+)
 
 st.set_page_config(layout="wide")
 st.title("📊 Overview de Performance Geral")
+start_background_refresh()  # no-op se o aquecimento já estiver rodando
 
-# Carrega os dados da aba principal
-df_geral = load_data("Dados_Gerais")
+# Os filtros vêm só de data e cliente; as métricas diárias são baixadas já filtradas pela seleção
+dimensoes = load_dimensions()
 
-if not df_geral.empty:
-    df_filtered = get_sidebar_filters(df_geral)
+if not dimensoes.empty:
+    selection = get_sidebar_selection(dimensoes)
+    df_filtered = pd.DataFrame()
+    if selection is not None:
+        start_date, end_date, selected_clients = selection
+        prev_start, prev_end = previous_period(start_date, end_date)
+        # O período anterior vem junto na mesma fatia para a comparação
+        compara = prev_start >= pd.Timestamp(dimensoes.min_date).date()
+        rollups = load_rollups(prev_start if compara else start_date, end_date, selected_clients, dimensions=dimensoes)
+        indice = rollups["indice"]
+        df_filtered = indice.select(start_date, end_date, selected_clients)
     
     if not df_filtered.empty:
         st.header("KPIs Principais do Período")
+        if compara:
+            st.caption(f"Variação em relação a {prev_start:%d/%m/%Y} – {prev_end:%d/%m/%Y}.")
 
-        # --- Cálculos dos KPIs ---
-        faturamento = df_filtered['faturamento'].sum()
-        investimento = df_filtered['investimento'].sum()
-        qtde_vendas = df_filtered['quantidade_vendas'].sum()
-        unidades_vendidas = df_filtered['unidades_vendidas'].sum()
-        visitas = df_filtered['visitas'].sum()
+        # --- Cálculos dos KPIs (somas acumuladas do índice: duas consultas por cliente e período) ---
+        totais = indice.totals(start_date, end_date, selected_clients)
+        totais.update(derived_ratios(totais))
+        anteriores = None
+        if compara:
+            anteriores = indice.totals(prev_start, prev_end, selected_clients)
+            anteriores.update(derived_ratios(anteriores))
+
+        def variacao(chave):
+            """Variação percentual contra o período anterior (None sem base de comparação)."""
+            if anteriores is None or not anteriores[chave]:
+                return None
+            return f"{totais[chave] / anteriores[chave] - 1:+.1%}"
+
+        faturamento = totais['faturamento']
+        investimento = totais['investimento']
+        qtde_vendas = totais['quantidade_vendas']
+        unidades_vendidas = totais['unidades_vendidas']
+        visitas = totais['visitas']
         
-        taxa_conversao = qtde_vendas / visitas if visitas > 0 else 0
-        acos = df_filtered['acos'].mean() 
-        tacos = df_filtered['tacos'].mean()
-        roas = faturamento / investimento if investimento > 0 else 0
-        roi_media = df_filtered['roi_media'].mean()
+        taxa_conversao = totais['taxa_conversao']
+        acos = totais['acos']
+        tacos = totais['tacos']
+        roas = totais['roas']
+        roi_media = totais['roi_media']
         
         # --- Exibição com st.metric ---
         col1, col2, col3, col4, col5 = st.columns(5)
         with col1:
-            st.metric("Faturamento", f"R$ {faturamento:,.2f}")
-            st.metric("Investimento", f"R$ {investimento:,.2f}")
+            st.metric("Faturamento", f"R$ {faturamento:,.2f}", variacao('faturamento'))
+            st.metric("Investimento", f"R$ {investimento:,.2f}", variacao('investimento'), delta_color="off")
         with col2:
-            st.metric("Quantidade de Vendas", f"{int(qtde_vendas):,}")
-            st.metric("Unidades Vendidas", f"{int(unidades_vendidas):,}")
+            st.metric("Quantidade de Vendas", f"{int(qtde_vendas):,}", variacao('quantidade_vendas'))
+            st.metric("Unidades Vendidas", f"{int(unidades_vendidas):,}", variacao('unidades_vendidas'))
         with col3:
-            st.metric("Visitas", f"{int(visitas):,}")
-            st.metric("Taxa de Conversão", f"{taxa_conversao:.2%}")
+            st.metric("Visitas", f"{int(visitas):,}", variacao('visitas'))
+            st.metric("Taxa de Conversão", f"{taxa_conversao:.2%}", variacao('taxa_conversao'))
         with col4:
-            st.metric("ACOS Médio", f"{acos:.2%}")
-            st.metric("TACOS Médio", f"{tacos:.2%}")
+            st.metric("ACOS", f"{acos:.2%}", variacao('acos'), delta_color="inverse")
+            st.metric("TACOS", f"{tacos:.2%}", variacao('tacos'), delta_color="inverse")
         with col5:
-            st.metric("ROAS", f"{roas:.2f}")
-            st.metric("ROI Média", f"{roi_media:.2f}")
+            st.metric("ROAS", f"{roas:.2f}", variacao('roas'))
+            st.metric("ROI Média", f"{roi_media:.2f}", variacao('roi_media'))
 
         st.markdown("---")
         
@@ -52,7 +80,9 @@ if not df_geral.empty:
             st.markdown("- **Analista Responsável:** Nome do Analista")
         
         st.subheader("Dados Detalhados do Período")
-        st.dataframe(df_filtered)
+        # Paginada no servidor: só a página visível é enviada a cada interação
+        render_detail_table(df_filtered, key="overview_detalhe",
+                            data_key=(indice, start_date, end_date, tuple(selected_clients)))
 
     else:
         st.info("Nenhum dado encontrado para os filtros selecionados.")
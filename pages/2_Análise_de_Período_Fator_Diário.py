@@ -2,32 +2,40 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils import load_data, get_sidebar_filters
+from utils import start_background_refresh, load_rollups, load_dimensions, get_sidebar_selection, weekday_profile
 
 st.set_page_config(layout="wide")
 st.title("📈 Análise de Período Fator (Diário)")
+start_background_refresh()  # no-op se o aquecimento já estiver rodando
 
-# Usa a mesma fonte de dados diários
-df_geral = load_data("Dados_Gerais")
+# Usa a mesma fonte de dados diários, via rollups; os filtros vêm só de data e cliente
+dimensoes = load_dimensions()
 
-if not df_geral.empty and 'data' in df_geral.columns:
-    df_filtered = get_sidebar_filters(df_geral)
+# Dias da semana em português, na ordem de dt.dayofweek (0 = segunda)
+ordem_dias = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+if not dimensoes.empty:
+    selection = get_sidebar_selection(dimensoes)
+    vendas_por_dia = pd.Series(dtype=float)
+    if selection is not None:
+        start_date, end_date, selected_clients = selection
+        full_history = start_date <= pd.Timestamp(dimensoes.min_date).date() and end_date >= pd.Timestamp(dimensoes.max_date).date()
+        rollups = load_rollups(start_date, end_date, selected_clients, dimensions=dimensoes)
+        # O perfil por dia da semana já vem agregado; não recalculamos day_name() a cada interação
+        vendas_por_dia = weekday_profile(rollups, start_date, end_date, selected_clients, full_history=full_history)
     
-    if not df_filtered.empty:
+    if not vendas_por_dia.empty:
         st.header("Análise de Performance Semanal")
 
         # --- Cálculos Diários ---
-        # Adiciona o nome do dia da semana para análise
-        df_filtered['dia_semana'] = df_filtered['data'].dt.day_name()
-        
-        total_vendas = df_filtered['quantidade_vendas'].sum()
-        vendas_por_dia = df_filtered.groupby('dia_semana')['quantidade_vendas'].sum().sort_values()
+        vendas_por_dia = vendas_por_dia.reindex(range(7)).fillna(0)
+        vendas_por_dia.index = ordem_dias
+        total_vendas = vendas_por_dia.sum()
         
-        dia_mais_ativo = vendas_por_dia.idxmax() if not vendas_por_dia.empty else "N/D"
-        dia_menos_ativo = vendas_por_dia.idxmin() if not vendas_por_dia.empty else "N/D"
+        dia_mais_ativo = vendas_por_dia.idxmax() if total_vendas > 0 else "N/D"
+        dia_menos_ativo = vendas_por_dia.idxmin() if total_vendas > 0 else "N/D"
         
-        dias_fds = ['Saturday', 'Sunday']
-        vendas_fds = df_filtered[df_filtered['dia_semana'].isin(dias_fds)]['quantidade_vendas'].sum()
+        vendas_fds = vendas_por_dia[['Sábado', 'Domingo']].sum()
         percentual_fds = vendas_fds / total_vendas if total_vendas > 0 else 0
 
         # --- KPIs ---
@@ -41,16 +49,7 @@ if not df_geral.empty and 'data' in df_geral.columns:
         
         st.subheader("Gráfico de Análise de Perfil de Vendas")
         
-        # Mapeia os dias da semana para português para o gráfico
-        dias_map = {
-            'Monday': 'Segunda', 'Tuesday': 'Terça', 'Wednesday': 'Quarta',
-            'Thursday': 'Quinta', 'Friday': 'Sexta', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-        }
-        vendas_por_dia.index = vendas_por_dia.index.map(dias_map)
-        # Ordena os dias para exibição correta no gráfico
-        ordem_dias = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
-        vendas_por_dia = vendas_por_dia.reindex(ordem_dias).fillna(0)
-        
+        vendas_por_dia = vendas_por_dia.rename('quantidade_vendas')
         fig = px.bar(
             vendas_por_dia, 
             x=vendas_por_dia.index, 
@@ -61,7 +60,7 @@ if not df_geral.empty and 'data' in df_geral.columns:
         fig.update_layout(xaxis={'categoryorder':'array', 'categoryarray': ordem_dias})
         st.plotly_chart(fig, use_container_width=True)
         
-        st.success(f"**Tomada de Decisão:** O dia com maior performance é **{dias_map.get(dia_mais_ativo, 'N/D')}**. Considere focar ou aumentar os investimentos neste dia da semana.")
+        st.success(f"**Tomada de Decisão:** O dia com maior performance é **{dia_mais_ativo}**. Considere focar ou aumentar os investimentos neste dia da semana.")
 
     else:
         st.info("Nenhum dado encontrado para os filtros selecionados.")
@@ -0,0 +1,55 @@
+# pages/3_Perfil_Horário.py
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from utils import start_background_refresh, load_data
+
+st.set_page_config(layout="wide")
+st.title("🕒 Perfil de Vendas por Hora e Dia da Semana")
+start_background_refresh()  # no-op se o aquecimento já estiver rodando
+
+# Lê o acumulador 24x7 mantido pela exportação horária (no máximo 168 linhas por cliente)
+df_perfil = load_data("Perfil_Horario")
+
+if not df_perfil.empty and {'cliente', 'dia_semana', 'hora'}.issubset(df_perfil.columns):
+    st.sidebar.header("Filtros Globais")
+    all_clients = sorted(df_perfil['cliente'].unique())
+    selected_clients = st.sidebar.multiselect("Selecione os Clientes:", options=all_clients, default=all_clients)
+
+    metricas = {'pedidos': 'Pedidos', 'unidades': 'Unidades Vendidas', 'faturamento': 'Faturamento'}
+    metrica = st.sidebar.radio("Métrica:", options=list(metricas.keys()), format_func=metricas.get)
+
+    df_selecionado = df_perfil[df_perfil['cliente'].isin(selected_clients)] if selected_clients else df_perfil
+
+    if not df_selecionado.empty:
+        ordem_dias = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+        grade = (
+            df_selecionado.pivot_table(index='dia_semana', columns='hora', values=metrica, aggfunc='sum')
+            .reindex(index=range(7), columns=range(24))
+            .fillna(0)
+        )
+        grade.index = ordem_dias
+
+        # --- KPIs ---
+        dia_pico, hora_pico = grade.stack().idxmax()
+        total = grade.values.sum()
+        col1, col2, col3 = st.columns(3)
+        col1.metric(f"Total de {metricas[metrica]}", f"{total:,.2f}" if metrica == 'faturamento' else f"{int(total):,}")
+        col2.metric("Pico de Vendas", f"{dia_pico}, {hora_pico:02d}h")
+        col3.metric("Participação do Horário Comercial (9h-18h)", f"{grade.loc[:, 9:17].values.sum() / total:.2%}" if total > 0 else "N/D")
+
+        st.markdown("---")
+
+        fig = px.imshow(
+            grade,
+            labels={'x': 'Hora do Dia', 'y': 'Dia da Semana', 'color': metricas[metrica]},
+            x=[f"{h:02d}h" for h in range(24)],
+            aspect='auto',
+            color_continuous_scale='Blues',
+            title=f"{metricas[metrica]} por Hora e Dia da Semana"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Nenhum dado encontrado para os filtros selecionados.")
+else:
+    st.warning("Não foi possível carregar os dados. Verifique a aba 'Perfil_Horario' na sua planilha.")
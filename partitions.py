@@ -0,0 +1,244 @@
+import argparse
+import logging
+
+import pandas as pd
+import gspread
+from google.oauth2.service_account import Credentials
+
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+CATALOG_WORKSHEET = "Catalogo_Particoes"
+CATALOG_COLUMNS = ["base", "periodo", "aba", "data_inicio", "data_fim"]
+ENABLED_MARKER = "*"  # linha (base, "*") marca a base como particionada, mesmo antes da primeira partição
+# Granularidade e coluna de data de cada aba base que pode ser particionada
+PARTITION_GRAIN = {
+    "Dados Consolidados v2": "ano",
+    "Dados_Horarios": "mes",
+    "Dados_Horarios_Agregados": "ano",
+    "Rollup_Diario": "ano",
+    "Itens": "mes",
+}
+PARTITION_DATE_COLUMNS = {
+    "Dados Consolidados v2": "periodo_consulta",
+    "Dados_Horarios": "data_hora",
+    "Dados_Horarios_Agregados": "data_hora",
+    "Rollup_Diario": "data",
+    "Itens": "data",
+}
+# Abas gravadas com RAW (rollups) são copiadas com valores não formatados; as demais, como o usuário as vê
+RAW_BASES = {"Rollup_Diario", "Itens"}
+MIGRATION_CHUNK_ROWS = 5000
+
+# --- Nomes e Limites dos Períodos ---
+
+def partition_period(base, date_str):
+    """Período da partição ('2025' ou '2025-03') de uma data 'YYYY-MM-DD...' da aba base."""
+    text = str(date_str)[:10]
+    return text[:7] if PARTITION_GRAIN.get(base, "ano") == "mes" else text[:4]
+
+def period_bounds(period):
+    """Primeiro e último dia ('YYYY-MM-DD') de um período anual ou mensal."""
+    if len(period) == 4:
+        return f"{period}-01-01", f"{period}-12-31"
+    year, month = int(period[:4]), int(period[5:7])
+    last_day = (pd.Timestamp(year=year, month=month, day=1) + pd.offsets.MonthEnd(1)).day
+    return f"{period}-01", f"{period}-{last_day:02d}"
+
+def partition_title(base, period):
+    return f"{base}_{period}"
+
+# --- Catálogo ---
+
+class PartitionCatalog:
+    """
+    Catálogo das partições por período, numa aba pequena (base, período, aba, primeiro e último dia).
+    Uma base só é particionada depois de registrada (ver `migrate_to_partitions`); até lá os
+    escritores continuam na aba única. As abas de partição são criadas sob demanda na primeira escrita.
+    """
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self._worksheets = {}
+        self._catalog_worksheet = None
+        self.load()
+
+    def load(self):
+        """(Re)lê a aba do catálogo; processos de longa duração a relêem antes de registrar uma partição."""
+        self.entries = {}  # base -> {período: aba}
+        try:
+            self._catalog_worksheet = self.spreadsheet.worksheet(CATALOG_WORKSHEET)
+            values = self._catalog_worksheet.get_all_values()
+        except gspread.WorksheetNotFound:
+            values = []
+        for row in values[1:]:
+            row = (row + [""] * len(CATALOG_COLUMNS))[:len(CATALOG_COLUMNS)]
+            if row[0]:
+                self.entries.setdefault(row[0], {})
+                if row[1] != ENABLED_MARKER and row[2]:
+                    self.entries[row[0]].setdefault(row[1], row[2])
+
+    def is_partitioned(self, base):
+        return base in self.entries
+
+    def _append_catalog_rows(self, rows):
+        if self._catalog_worksheet is None:
+            self._catalog_worksheet = self.spreadsheet.add_worksheet(title=CATALOG_WORKSHEET, rows="1", cols=len(CATALOG_COLUMNS))
+            self._catalog_worksheet.update([CATALOG_COLUMNS], value_input_option='RAW')
+            logger.info(f"Aba '{CATALOG_WORKSHEET}' criada com sucesso.")
+        self._catalog_worksheet.append_rows(rows, value_input_option='RAW')
+
+    def enable(self, base):
+        if base not in self.entries:
+            self._append_catalog_rows([[base, ENABLED_MARKER, "", "", ""]])
+            self.entries[base] = {}
+
+    def register(self, base, periods):
+        """
+        Registra a base e as partições já gravadas numa única escrita: os leitores só passam a usar
+        as partições quando todas estão completas. O catálogo é relido antes, para não repetir linhas.
+        """
+        self.load()
+        rows = [] if base in self.entries else [[base, ENABLED_MARKER, "", "", ""]]
+        new_periods = [period for period in periods if period not in self.entries.get(base, {})]
+        rows += [[base, period, partition_title(base, period), *period_bounds(period)] for period in new_periods]
+        if rows:
+            self._append_catalog_rows(rows)
+        self.entries.setdefault(base, {})
+        for period in new_periods:
+            self.entries[base][period] = partition_title(base, period)
+
+    def titles_between(self, base, start_date=None, end_date=None):
+        """Abas das partições da base que cruzam [start_date, end_date], da mais antiga para a mais nova."""
+        titles = []
+        for period, title in sorted(self.entries.get(base, {}).items()):
+            first_day, last_day = period_bounds(period)
+            if start_date is not None and last_day < str(start_date)[:10]:
+                continue
+            if end_date is not None and first_day > str(end_date)[:10]:
+                continue
+            titles.append(title)
+        return titles
+
+    def base_header(self, base):
+        """Cabeçalho da base: o da partição mais recente ou, sem partições, o da aba única."""
+        titles = self.titles_between(base)
+        try:
+            return self.spreadsheet.worksheet(titles[-1] if titles else base).row_values(1)
+        except gspread.WorksheetNotFound:
+            return []
+
+    def worksheet_for(self, base, date_str, header=None):
+        """
+        Aba da partição que contém a data, criada (com o cabeçalho) e registrada se ainda não existir.
+        Antes de registrar, o catálogo é relido: outro processo pode ter criado a partição depois da nossa leitura.
+        Só quem cria a aba a registra, então o catálogo não ganha linhas repetidas.
+        """
+        period = partition_period(base, date_str)
+        title = self.entries.get(base, {}).get(period)
+        if title in self._worksheets:
+            return self._worksheets[title]
+        if title is None:
+            self.load()
+            title = self.entries.get(base, {}).get(period)
+        if title is None:
+            title = partition_title(base, period)
+            header = list(header) if header is not None else self.base_header(base)
+            try:
+                worksheet = self.spreadsheet.worksheet(title)
+                logger.info(f"Partição '{title}' já criada por outro processo. Catálogo não alterado.")
+            except gspread.WorksheetNotFound:
+                worksheet = self.spreadsheet.add_worksheet(title=title, rows="1", cols=max(len(header), 1))
+                if header:
+                    worksheet.update([header], value_input_option='RAW')
+                logger.info(f"Partição '{title}' criada.")
+                self._append_catalog_rows([[base, period, title, *period_bounds(period)]])
+            self.entries.setdefault(base, {})[period] = title
+        else:
+            worksheet = self.spreadsheet.worksheet(title)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def route(self, base, date_str, header=None):
+        """Título da aba onde gravar uma data da base: a partição, ou a própria base se ela não for particionada."""
+        if not self.is_partitioned(base):
+            return base
+        return self.worksheet_for(base, date_str, header).title
+
+def read_partitioned_frame(spreadsheet, base, catalog=None, start_date=None, end_date=None):
+    """Registros da base (get_all_records), unindo só as partições que cruzam o período quando ela é particionada."""
+    catalog = catalog or PartitionCatalog(spreadsheet)
+    titles = catalog.titles_between(base, start_date, end_date) if catalog.is_partitioned(base) else [base]
+    frames = []
+    for title in titles:
+        try:
+            frames.append(pd.DataFrame(spreadsheet.worksheet(title).get_all_records()))
+        except gspread.WorksheetNotFound:
+            logger.info(f"Aba '{title}' não encontrada. Lida como vazia.")
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# --- Migração da Aba Única ---
+
+def migrate_to_partitions(spreadsheet, base):
+    """
+    Copia as linhas da aba única para as partições do período de cada linha e registra a base no catálogo.
+    O registro (ver PartitionCatalog.register) só acontece depois de todas as partições gravadas: se a cópia
+    for interrompida, a base continua na aba única e a migração pode ser repetida, regravando cada partição do zero.
+    A aba original não é alterada: depois de conferir as partições, ela pode ser arquivada ou apagada.
+    Rode entre as coletas: linhas gravadas na aba única durante a cópia não são migradas.
+    """
+    catalog = PartitionCatalog(spreadsheet)
+    if catalog.is_partitioned(base):
+        logger.warning(f"A base '{base}' já está particionada. Nada a fazer.")
+        return
+    date_column = PARTITION_DATE_COLUMNS[base]
+    raw = base in RAW_BASES
+    try:
+        values = spreadsheet.worksheet(base).get_all_values(value_render_option='UNFORMATTED_VALUE' if raw else 'FORMATTED_VALUE')
+    except gspread.WorksheetNotFound:
+        values = []
+    header = values[0] if values else []
+    if not header:
+        catalog.enable(base)
+        logger.info(f"Aba '{base}' vazia ou inexistente: partições serão criadas nas próximas escritas.")
+        return
+
+    date_position = header.index(date_column)
+    rows_by_period = {}
+    for row in values[1:]:
+        if date_position < len(row) and str(row[date_position]).strip():
+            rows_by_period.setdefault(partition_period(base, row[date_position]), []).append(row)
+
+    for period, rows in sorted(rows_by_period.items()):
+        title = partition_title(base, period)
+        try:
+            # Resto de uma migração interrompida: a partição é regravada inteira
+            worksheet = spreadsheet.worksheet(title)
+            worksheet.clear()
+        except gspread.WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title=title, rows="1", cols=max(len(header), 1))
+        worksheet.update([header], value_input_option='RAW')
+        for start in range(0, len(rows), MIGRATION_CHUNK_ROWS):
+            worksheet.append_rows(rows[start:start + MIGRATION_CHUNK_ROWS], value_input_option='RAW' if raw else 'USER_ENTERED')
+        logger.info(f"Partição '{title}': {len(rows)} linhas copiadas.")
+    catalog.register(base, sorted(rows_by_period))
+    logger.info(f"Base '{base}' particionada em {len(rows_by_period)} abas.")
+
+def main():
+    from meli_collector import load_clients_and_credentials
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Particiona abas da planilha por período e mantém o catálogo de partições.")
+    parser.add_argument('--migrar', choices=sorted(PARTITION_GRAIN), required=True, help="Aba base a particionar.")
+    args = parser.parse_args()
+
+    google_creds, _ = load_clients_and_credentials()
+    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+    creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
+    spreadsheet = telemetry.instrument_gspread(gspread.authorize(creds)).open("Histórico de Vendas Meli - 2024")
+    migrate_to_partitions(spreadsheet, args.migrar)
+
+if __name__ == "__main__":
+    main()
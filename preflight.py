@@ -0,0 +1,158 @@
+import time
+import json
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+PREFLIGHT_MAX_WORKERS = int(os.environ.get("MELI_PREFLIGHT_WORKERS", "8"))
+TOKEN_TTL_SECONDS = 5 * 60 * 60  # tokens do Mercado Livre valem 6h
+CLIENT_IDS_CACHE_FILE = "client_ids_cache.json"
+
+def describe_request_error(e):
+    """Texto do erro de uma requisição, com o corpo da resposta (JSON ou texto) quando houver."""
+    response = getattr(e, "response", None)
+    if response is None:
+        return str(e)
+    try:
+        body = response.json()
+    except ValueError:
+        body = (response.text or "").strip()[:300]
+    return f"HTTP {response.status_code}: {body}"
+
+# --- Cache de Ids por Cliente ---
+
+class ClientIdCache:
+    """
+    user_id e anunciante de cada cliente, persistidos em JSON. A entrada só vale para o mesmo app_id;
+    clientes sem anunciante voltam a consultar /advertising/advertisers a cada preparação.
+    """
+    def __init__(self, path=CLIENT_IDS_CACHE_FILE):
+        self.path = path
+        self.clients = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.clients = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Cache de ids '{path}' inválido. Começando vazio.")
+
+    def get(self, client_info):
+        entry = self.clients.get(client_info["client_name"])
+        if entry and entry.get("app_id") == str(client_info["app_id"]):
+            return entry
+        return None
+
+    def update(self, client_info, user_id, advertiser_id=None, advertiser_name=None):
+        with self.lock:
+            self.clients[client_info["client_name"]] = {
+                "app_id": str(client_info["app_id"]), "user_id": user_id,
+                "advertiser_id": advertiser_id, "advertiser_name": advertiser_name, "atualizado_em": time.time(),
+            }
+
+    def save(self):
+        # Clientes podem ser preparados em paralelo pelos workers do coletor
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.clients, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+# --- Preparação dos Clientes ---
+
+def resolve_client(client_info, get_token, make_collector, id_cache=None, resolve_advertiser=True):
+    """
+    Renova o token e resolve user_id e anunciante, usando o cache de ids quando possível.
+    Retorna ((collector, user_id, advertiser_id, nome), None) ou (None, motivo da falha).
+    """
+    client_name = client_info["client_name"]
+    access_token = get_token(client_info)
+    if not access_token:
+        return None, "falha ao renovar o access token"
+    collector = make_collector(access_token)
+
+    cached = id_cache.get(client_info) if id_cache is not None else None
+    user_id = cached["user_id"] if cached else collector.get_user_id()
+    if not user_id:
+        return None, "não foi possível obter o user_id"
+
+    advertiser_id, client_name_from_api = None, client_name
+    if cached and cached.get("advertiser_id"):
+        advertiser_id, client_name_from_api = cached["advertiser_id"], cached.get("advertiser_name") or client_name
+    elif resolve_advertiser:
+        advertisers_data = collector.get_advertisers()
+        if advertisers_data and advertisers_data.get('advertisers'):
+            advertiser = advertisers_data['advertisers'][0]
+            advertiser_id = advertiser['advertiser_id']
+            client_name_from_api = advertiser.get('advertiser_name', client_name)
+        else:
+            logger.warning(f"Nenhum anunciante encontrado para {client_name}. Métricas de Ads não serão coletadas.")
+
+    if id_cache is not None and (not cached or advertiser_id != cached.get("advertiser_id")):
+        id_cache.update(client_info, user_id, advertiser_id, client_name_from_api if advertiser_id else None)
+    return (collector, user_id, advertiser_id, client_name_from_api), None
+
+def run_preflight(clients_df, get_token, make_collector, id_cache=None, resolve_advertiser=True, max_workers=PREFLIGHT_MAX_WORKERS):
+    """
+    Valida as credenciais de todos os clientes em paralelo antes da coleta.
+    Retorna (preparados, inativos): preparados é {cliente: {"preparado": tupla, "expira_em": ts}}
+    e inativos é {cliente: motivo}, já resumidos no log.
+    """
+    started = time.time()
+    rows = [client_info for _, client_info in clients_df.iterrows()]
+
+    def _resolve(client_info):
+        try:
+            return resolve_client(client_info, get_token, make_collector, id_cache, resolve_advertiser)
+        except Exception as e:
+            return None, f"erro inesperado: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rows) or 1))) as executor:
+        results = list(executor.map(_resolve, rows))
+
+    prepared, dead = {}, {}
+    for client_info, (prepared_client, reason) in zip(rows, results):
+        if prepared_client:
+            prepared[client_info["client_name"]] = {"preparado": prepared_client, "expira_em": started + TOKEN_TTL_SECONDS}
+        else:
+            dead[client_info["client_name"]] = reason
+    if id_cache is not None:
+        id_cache.save()
+
+    logger.info(f"Pré-validação: {len(prepared)}/{len(rows)} clientes com credenciais válidas em {time.time() - started:.1f}s.")
+    if dead:
+        summary = "\n".join(f"  - {name}: {reason}" for name, reason in dead.items())
+        logger.error(f"{len(dead)} cliente(s) fora desta execução:\n{summary}")
+    return prepared, dead
+
+def get_fresh_client(prepared_clients, client_info, get_token, make_collector, id_cache=None, resolve_advertiser=True):
+    """
+    Cliente preparado com token válido: reaproveita sessão e ids e só renova o access token
+    quando ele está perto de expirar. Clientes ausentes de `prepared_clients` são preparados na hora.
+    """
+    client_name = client_info["client_name"]
+    cached = prepared_clients.get(client_name)
+    if cached and time.time() < cached["expira_em"]:
+        return cached["preparado"]
+    if cached:
+        access_token = get_token(client_info)
+        if access_token:
+            collector = cached["preparado"][0]
+            collector.access_token = access_token
+            collector.session.headers.update({"Authorization": f"Bearer {access_token}"})
+            cached["expira_em"] = time.time() + TOKEN_TTL_SECONDS
+            return cached["preparado"]
+        prepared_clients.pop(client_name)
+        return None
+    prepared_client, reason = resolve_client(client_info, get_token, make_collector, id_cache, resolve_advertiser)
+    if not prepared_client:
+        logger.error(f"Cliente {client_name} não pôde ser preparado: {reason}.")
+        return None
+    prepared_clients[client_name] = {"preparado": prepared_client, "expira_em": time.time() + TOKEN_TTL_SECONDS}
+    if id_cache is not None:
+        id_cache.save()
+    return prepared_client
@@ -9,11 +9,19 @@ from google.oauth2.service_account import Credentials
 import os
 from io import StringIO
 import toml
+from telemetry import telemetry
+from preflight import ClientIdCache, describe_request_error, run_preflight, get_fresh_client
+from scheduling import ClientRunHistory, RunDeadline, COLLECTOR_MAX_WORKERS, REALTIME_DEADLINE_MINUTES
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Configuração do Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Constantes ---
+MELI_API_BASE_URL = os.environ.get("MELI_API_BASE_URL", "https://api.mercadolibre.com")
+RUN_HISTORY_KIND = "realtime_update"
+
 # --- Módulos de Análise, Autenticação e Coleta ---
 
 def find_best_strategy(campaign_row, strategy_model_df):
@@ -57,7 +65,7 @@ def analyze_and_consolidate(campaigns_df):
     return consolidated_df
 
 def get_new_access_token(client_info):
-    url = "https://api.mercadolibre.com/oauth/token"
+    url = f"{MELI_API_BASE_URL}/oauth/token"
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
     data = {
         "grant_type": "refresh_token",
@@ -66,19 +74,20 @@ def get_new_access_token(client_info):
         "refresh_token": client_info["refresh_token"]
     }
     try:
-        response = requests.post(url, headers=headers, data=data)
+        response = requests.post(url, headers=headers, data=data, timeout=30, hooks=telemetry.hooks())
         response.raise_for_status()
         return response.json()["access_token"]
     except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao renovar o Access Token: {e.response.json()}")
+        logger.error(f"Erro ao renovar o Access Token de {client_info['client_name']}: {describe_request_error(e)}")
         return None
 
 class MercadoLivreAdsCollector:
     def __init__(self, access_token):
         self.access_token = access_token
-        self.base_url = "https://api.mercadolibre.com"
+        self.base_url = MELI_API_BASE_URL
         self.session = requests.Session()
         self.session.headers.update({"Authorization": f"Bearer {self.access_token}", "Content-Type": "application/json"})
+        telemetry.instrument_session(self.session)
         self.timeout = 30
 
     def get_user_id(self):
@@ -113,7 +122,7 @@ class MercadoLivreAdsCollector:
 
         visits_metrics = {}
         try:
-            url = f"https://api.mercadolibre.com/users/{seller_id}/items_visits?date_from={date_str}&date_to={date_str}"
+            url = f"{self.base_url}/users/{seller_id}/items_visits?date_from={date_str}&date_to={date_str}"
             response = self.session.get(url, timeout=self.timeout)
             response.raise_for_status()
             visits_data = response.json()
@@ -149,7 +158,7 @@ class MercadoLivreAdsCollector:
                 all_campaigns.extend(results)
                 if offset + 50 >= data.get('paging', {}).get('total', 0): break
                 offset += 50
-                time.sleep(0.2)
+                telemetry.sleep(0.2, "pausa_paginacao")
             except Exception as e:
                 logger.error(f"Erro ao buscar campanhas: {e}")
                 break
@@ -171,7 +180,7 @@ def export_to_google_sheets(df, sheet_name, worksheet_name, google_creds, update
     try:
         scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
         creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
-        client = gspread.authorize(creds)
+        client = telemetry.instrument_gspread(gspread.authorize(creds))
         spreadsheet = client.open(sheet_name)
         
         try:
@@ -224,65 +233,58 @@ def export_to_google_sheets(df, sheet_name, worksheet_name, google_creds, update
     except Exception as e:
         logger.error(f"ERRO AO EXPORTAR PARA '{worksheet_name}': {e}", exc_info=True)
 
-def main():
-    logger.info("Iniciando a execução da atualização em tempo real (v14 - Final).")
+def export_campaign_analysis(collector, advertiser_id, date_str, timestamp_geracao, client_name_from_api, google_creds):
+    """Coleta as campanhas do dia, recomenda a estratégia de cada uma e grava a aba 'Analise de Campanhas'."""
+    logger.info("Coletando dados detalhados de campanhas para o dia...")
+    campaigns_data = collector.get_all_campaigns_paginated(advertiser_id, date_str)
+    if campaigns_data:
+        df_campaigns_raw = pd.json_normalize(campaigns_data)
+        logger.info("Realizando analise estrategica...")
+        df_analysis = analyze_and_consolidate(df_campaigns_raw)
     
-    try:
-        if os.path.exists('.streamlit/secrets.toml'):
-            secrets = toml.load('.streamlit/secrets.toml')
-            google_creds = secrets['google_credentials']
-            with open('clients.csv', 'r') as f:
-                 clients_csv_data = f.read()
-        else:
-            google_creds_str = os.environ['GOOGLE_CREDENTIALS']
-            clients_csv_data = os.environ['MELI_CLIENTS_CSV']
-            google_creds = toml.loads(google_creds_str)['google_credentials']
-        
-        clients_df = pd.read_csv(StringIO(clients_csv_data))
-    except Exception as e:
-        logger.error(f"ERRO CRÍTICO ao carregar credenciais: {e}")
-        return
-
-    brasil_timezone = ZoneInfo("America/Sao_Paulo")
-    today = datetime.now(brasil_timezone)
-    date_str = today.strftime('%Y-%m-%d')
+        df_analysis.insert(0, 'data_geracao', timestamp_geracao)
+        df_analysis.insert(1, 'periodo_consulta', date_str)
+        df_analysis.insert(2, 'cliente', client_name_from_api)
     
-    logger.info(f"Coletando dados para o dia de hoje: {date_str}")
-
-    # Cabeçalho final conforme especificado no pasted_content.txt
-    FINAL_COLUMNS_ORDER_CONSOLIDATED = [
-        "data_geracao", "periodo_consulta", "cliente",
-        "Faturamento", "Investimento", "Quantidade de Vendas", "Unidades Vendidas", "Visitas",
-        "Taxa de Conversão Média", "ACOS", "TACOS", "ROAS", "ROI Média",
-        "Vendas por Ads", "Vendas sem Ads", "Cliques", "CPC", "CTR", "Impressões"
-    ]
+        colunas_finais = [
+            'data_geracao', 'periodo_consulta', 'cliente', 'Nome_Campanha', 'status', 
+            'Orcamento_Campanha', 'Orcamento_Recomendado', 
+            'ACOS_Campanha', 'ACOS_Recomendado', 'Estrategia_Recomendada'
+        ]
+        # Garante que apenas colunas existentes sejam selecionadas
+        colunas_existentes_df = [col for col in colunas_finais if col in df_analysis.columns]
+    
+        update_keys_campaigns = ['periodo_consulta', 'cliente', 'Nome_Campanha']
+        export_to_google_sheets(df_analysis[colunas_existentes_df], "Histórico de Vendas Meli - 2024", "Analise de Campanhas", google_creds, update_key_cols=update_keys_campaigns)
+    else:
+        logger.info(f"Nenhuma campanha encontrada para {client_name_from_api} no dia de hoje.")
 
-    for index, client_info in clients_df.iterrows():
-        client_name = client_info["client_name"]
+def collect_client_realtime(client_info, date_str, get_prepared_client):
+    """
+    Parte da coleta em tempo real que só fala com o Mercado Livre (roda nos workers do pool).
+    Retorna dict com a linha consolidada formatada, o coletor e o tempo gasto, ou None se o cliente falhar.
+    """
+    client_name = client_info["client_name"]
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    started = time.time()
+    with telemetry.client_timer(client_name):
         logger.info(f"\n--- Processando cliente: {client_name} ---")
-        
         try:
-            access_token = get_new_access_token(client_info)
-            if not access_token:
+            prepared_client = get_prepared_client(client_info)
+            if not prepared_client:
                 logger.error(f"Falha ao obter access token para {client_name}. Pulando.")
-                continue
-                
-            collector = MercadoLivreAdsCollector(access_token)
-            advertisers_data = collector.get_advertisers()
-            
-            if not advertisers_data or not advertisers_data.get('advertisers'):
+                return None
+
+            collector, user_id, advertiser_id, client_name_from_api = prepared_client
+            if not advertiser_id:
                 logger.error(f"Nenhum anunciante encontrado para {client_name}. Pulando.")
-                continue
-            
-            advertiser = advertisers_data['advertisers'][0]
-            advertiser_id = advertiser['advertiser_id']
-            client_name_from_api = advertiser.get('advertiser_name', client_name)
+                return None
+
             timestamp_geracao = datetime.now(brasil_timezone).strftime('%Y-%m-%d %H:%M:%S')
 
-            user_id = collector.get_user_id()
             business_metrics = collector.get_business_metrics(user_id, date_str) if user_id else {}
             ads_metrics = collector.get_ads_summary_metrics(advertiser_id, date_str)
-            
+
             # Processamento das métricas com valores numéricos
             faturamento = pd.to_numeric(business_metrics.get("faturamento_bruto"), errors='coerce')
             qtde_vendas = pd.to_numeric(business_metrics.get("quantidade_vendas"), errors='coerce')
@@ -322,42 +324,89 @@ def main():
             if cpc > 0: final_data["CPC"] = f"R$ {cpc:,.2f}"
             if ctr > 0: final_data["CTR"] = f"{ctr:.2f}%"
             if pd.notna(impressoes): final_data["Impressões"] = int(impressoes)
-            
-            df_final_consolidated = pd.DataFrame([final_data])
-            df_final_consolidated = df_final_consolidated.reindex(columns=FINAL_COLUMNS_ORDER_CONSOLIDATED)
-            
-            update_keys_consolidated = ['periodo_consulta', 'cliente']
-            export_to_google_sheets(df_final_consolidated, "Histórico de Vendas Meli - 2024", "Dados Consolidados v2", google_creds, update_key_cols=update_keys_consolidated)
-
-            # Mantendo a funcionalidade original de análise de campanhas
-            logger.info("Coletando dados detalhados de campanhas para o dia...")
-            campaigns_data = collector.get_all_campaigns_paginated(advertiser_id, date_str)
-            if campaigns_data:
-                df_campaigns_raw = pd.json_normalize(campaigns_data)
-                logger.info("Realizando analise estrategica...")
-                df_analysis = analyze_and_consolidate(df_campaigns_raw)
-                
-                df_analysis.insert(0, 'data_geracao', timestamp_geracao)
-                df_analysis.insert(1, 'periodo_consulta', date_str)
-                df_analysis.insert(2, 'cliente', client_name_from_api)
-                
-                colunas_finais = [
-                    'data_geracao', 'periodo_consulta', 'cliente', 'Nome_Campanha', 'status', 
-                    'Orcamento_Campanha', 'Orcamento_Recomendado', 
-                    'ACOS_Campanha', 'ACOS_Recomendado', 'Estrategia_Recomendada'
-                ]
-                # Garante que apenas colunas existentes sejam selecionadas
-                colunas_existentes_df = [col for col in colunas_finais if col in df_analysis.columns]
-                
-                update_keys_campaigns = ['periodo_consulta', 'cliente', 'Nome_Campanha']
-                export_to_google_sheets(df_analysis[colunas_existentes_df], "Histórico de Vendas Meli - 2024", "Analise de Campanhas", google_creds, update_key_cols=update_keys_campaigns)
-            else:
-                logger.info(f"Nenhuma campanha encontrada para {client_name_from_api} no dia de hoje.")
-
         except Exception as e:
             logger.error(f"ERRO INESPERADO ao processar o cliente {client_name}: {e}", exc_info=True)
-            continue # Continua para o próximo cliente em caso de erro
+            return None
+
+    return {
+        "cliente": client_name, "cliente_api": client_name_from_api, "collector": collector, "anunciante": advertiser_id,
+        "linha": final_data, "pedidos": business_metrics.get("quantidade_vendas", 0), "duracao_s": time.time() - started,
+    }
+
+def main():
+    logger.info("Iniciando a execução da atualização em tempo real (v14 - Final).")
+    
+    try:
+        if os.path.exists('.streamlit/secrets.toml'):
+            secrets = toml.load('.streamlit/secrets.toml')
+            google_creds = secrets['google_credentials']
+            with open('clients.csv', 'r') as f:
+                 clients_csv_data = f.read()
+        else:
+            google_creds_str = os.environ['GOOGLE_CREDENTIALS']
+            clients_csv_data = os.environ['MELI_CLIENTS_CSV']
+            google_creds = toml.loads(google_creds_str)['google_credentials']
+        
+        clients_df = pd.read_csv(StringIO(clients_csv_data))
+    except Exception as e:
+        logger.error(f"ERRO CRÍTICO ao carregar credenciais: {e}")
+        return
+
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    today = datetime.now(brasil_timezone)
+    date_str = today.strftime('%Y-%m-%d')
+    
+    logger.info(f"Coletando dados para o dia de hoje: {date_str}")
+    telemetry.start_run("realtime_update")
+
+    # Cabeçalho final conforme especificado no pasted_content.txt
+    FINAL_COLUMNS_ORDER_CONSOLIDATED = [
+        "data_geracao", "periodo_consulta", "cliente",
+        "Faturamento", "Investimento", "Quantidade de Vendas", "Unidades Vendidas", "Visitas",
+        "Taxa de Conversão Média", "ACOS", "TACOS", "ROAS", "ROI Média",
+        "Vendas por Ads", "Vendas sem Ads", "Cliques", "CPC", "CTR", "Impressões"
+    ]
+
+    # Credenciais de todos os clientes validadas em paralelo; user_id e anunciante vêm do cache quando possível
+    id_cache = ClientIdCache()
+    prepared_clients, _ = run_preflight(clients_df, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+
+    # Do cliente mais demorado para o mais rápido (histórico de execuções), em paralelo no pool de workers
+    # e com prazo dentro da janela de 2h; as escritas no Sheets ficam na thread principal, uma por vez
+    run_history = ClientRunHistory()
+    deadline = RunDeadline(REALTIME_DEADLINE_MINUTES * 60)
+
+    clients_by_name = {client_info["client_name"]: client_info for _, client_info in clients_df.iterrows() if client_info["client_name"] in prepared_clients}
+
+    def get_prepared_client(client_info):
+        return get_fresh_client(prepared_clients, client_info, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+
+    with ThreadPoolExecutor(max_workers=max(1, COLLECTOR_MAX_WORKERS)) as executor:
+        futures = [executor.submit(collect_client_realtime, clients_by_name[name], date_str, get_prepared_client)
+                   for name in run_history.order_longest_first(RUN_HISTORY_KIND, list(clients_by_name))]
+        for future in as_completed(futures):
+            result = future.result()
+            if not result: continue
+            client_name, client_name_from_api = result["cliente"], result["cliente_api"]
+            try:
+                df_final_consolidated = pd.DataFrame([result["linha"]]).reindex(columns=FINAL_COLUMNS_ORDER_CONSOLIDATED)
+                update_keys_consolidated = ['periodo_consulta', 'cliente']
+                export_to_google_sheets(df_final_consolidated, "Histórico de Vendas Meli - 2024", "Dados Consolidados v2", google_creds, update_key_cols=update_keys_consolidated)
+
+                # A análise de campanhas é a parte de baixa prioridade: adiada se o prazo da execução acabou
+                if deadline.allows("analise_campanhas"):
+                    export_campaign_analysis(result["collector"], result["anunciante"], date_str, result["linha"]["data_geracao"], client_name_from_api, google_creds)
+                else:
+                    logger.warning(f"Prazo da execução esgotado. Análise de campanhas de {client_name_from_api} adiada.")
+                run_history.record(RUN_HISTORY_KIND, client_name, result["duracao_s"], result["pedidos"])
+
+            except Exception as e:
+                logger.error(f"ERRO INESPERADO ao gravar o cliente {client_name}: {e}", exc_info=True)
+                continue # Continua para o próximo cliente em caso de erro
 
+    run_history.save()
+    deadline.log_summary()
+    telemetry.write_summary()
     logger.info("Atualização em tempo real (v14 - Final) finalizada.")
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+import json
+import os
+import logging
+import argparse
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+import historical_data_run_v2 as historical
+from meli_collector import (
+    get_new_access_token, MercadoLivreAdsCollector, load_clients_and_credentials, open_consolidated_sheet, prepare_all_clients,
+)
+from order_pipeline import fetch_updated_orders
+from ledger import CompletionLedger
+from rollups import refresh_rollups
+from preflight import ClientIdCache, get_fresh_client
+from telemetry import telemetry
+
+# --- Configuração do Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+RECONCILIATION_STATE_FILE = "reconciliation_state.json"
+DEFAULT_WINDOW_DAYS = 60
+DEFAULT_LOOKBACK_HOURS = 26  # sem marca d'água (ex.: runner efêmero), cobre a execução diária com folga
+WATERMARK_OVERLAP_MINUTES = 10  # alterações gravadas com atraso na busca por last_updated
+
+# --- Marca d'Água por Cliente ---
+
+def load_watermarks(path=RECONCILIATION_STATE_FILE):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            logger.warning(f"Estado da reconciliação '{path}' inválido. Usando a janela padrão.")
+    return {}
+
+def save_watermarks(watermarks, path=RECONCILIATION_STATE_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+# --- Reconciliação ---
+
+def affected_days(changed_orders, timezone, window_start, today):
+    """
+    Dias de criação (fuso de São Paulo) dos pedidos alterados, dentro de [window_start, hoje).
+    O dia de hoje fica com a coleta em tempo real; dias fora da janela são só contabilizados.
+    """
+    days, outside_window = set(), 0
+    for order in changed_orders:
+        created = pd.to_datetime(order.get("date_created"), errors='coerce')
+        if pd.isna(created):
+            continue
+        created_day = created.tz_convert(timezone).date()
+        if window_start <= created_day < today:
+            days.add(created_day.strftime('%Y-%m-%d'))
+        elif created_day < window_start:
+            outside_window += 1
+    return sorted(days, reverse=True), outside_window
+
+def reconcile_client(client_name, prepared_client, updated_from, updated_to, window_start, today,
+                     worksheet_consolidado, consolidado_index, ledger):
+    """
+    Busca os pedidos do cliente alterados no intervalo e recoleta apenas os dias afetados.
+    Retorna (cache atualizado, chaves escritas, True se todos os dias afetados foram regravados).
+    """
+    collector, user_id, _, _ = prepared_client
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    changed_orders = list(fetch_updated_orders(lambda url, params: collector._make_request(url, params=params), user_id, updated_from, updated_to))
+    days, outside_window = affected_days(changed_orders, brasil_timezone, window_start, today)
+    logger.info(f"'{client_name}': {len(changed_orders)} pedidos alterados desde {updated_from}, {len(days)} dias afetados"
+                + (f", {outside_window} pedidos de dias fora da janela ignorados." if outside_window else "."))
+    if not days:
+        return consolidado_index, set(), True
+
+    # A recoleta do dia refaz a linha inteira (pedidos, visitas e Ads) pelo mesmo caminho do histórico
+    consolidado_index, touched_keys = historical.process_client_days(
+        client_name, prepared_client, days, worksheet_consolidado, consolidado_index, ledger)
+    return consolidado_index, touched_keys, len(touched_keys) == len(days)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcilia dias já coletados a partir dos pedidos alterados (last_updated).")
+    parser.add_argument('--janela-dias', type=int, default=DEFAULT_WINDOW_DAYS, help='Só dias criados nesta janela são recalculados.')
+    parser.add_argument('--desde-horas', type=int, default=DEFAULT_LOOKBACK_HOURS, help="Início da busca para clientes sem marca d'água.")
+    args = parser.parse_args()
+
+    logger.info("Iniciando a reconciliação de pedidos alterados.")
+    telemetry.start_run("reconcile_orders")
+
+    try:
+        google_creds, clients_df = load_clients_and_credentials()
+        spreadsheet, worksheet_consolidado, consolidado_index = open_consolidated_sheet(google_creds)
+    except Exception as e:
+        logger.critical(f"ERRO CRÍTICO ao carregar credenciais ou conectar-se com o Google Sheets: {e}")
+        return
+
+    brasil_timezone = ZoneInfo("America/Sao_Paulo")
+    now = datetime.now(brasil_timezone)
+    today = now.date()
+    window_start = today - timedelta(days=args.janela_dias)
+    updated_to = now.isoformat(timespec='milliseconds')
+    default_from = (now - timedelta(hours=args.desde_horas)).isoformat(timespec='milliseconds')
+
+    watermarks = load_watermarks()
+    ledger = CompletionLedger()
+    id_cache = ClientIdCache()
+    prepared_clients, _ = prepare_all_clients(clients_df, id_cache)
+
+    for _, client_info in clients_df[clients_df['client_name'].isin(list(prepared_clients))].iterrows():
+        client_name = client_info["client_name"]
+        with telemetry.client_timer(client_name):
+            prepared_client = get_fresh_client(prepared_clients, client_info, get_new_access_token, MercadoLivreAdsCollector, id_cache)
+            if not prepared_client: continue
+            updated_from = watermarks.get(client_name, default_from)
+            try:
+                consolidado_index, touched_keys, complete = reconcile_client(
+                    client_name, prepared_client, updated_from, updated_to, window_start, today,
+                    worksheet_consolidado, consolidado_index, ledger)
+            except Exception as e:
+                logger.error(f"ERRO ao reconciliar '{client_name}'. A marca d'água não avança. Erro: {e}", exc_info=True)
+                continue
+
+            if touched_keys:
+                refresh_rollups(spreadsheet, consolidado_index.frame_for_clients({client for client, _ in touched_keys}), touched_keys)
+            if complete:
+                # Sobreposição pequena: pedidos alterados no limite entre duas execuções são buscados de novo
+                watermarks[client_name] = (now - timedelta(minutes=WATERMARK_OVERLAP_MINUTES)).isoformat(timespec='milliseconds')
+                save_watermarks(watermarks)
+            else:
+                logger.warning(f"Nem todos os dias afetados de '{client_name}' foram regravados. A marca d'água não avança.")
+            telemetry.sleep(1.5, "pausa_entre_clientes")
+
+    telemetry.write_summary()
+    logger.info("Reconciliação finalizada.")
+
+if __name__ == "__main__":
+    main()
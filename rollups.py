@@ -0,0 +1,289 @@
+import pandas as pd
+import gspread
+import logging
+import argparse
+from telemetry import telemetry
+from partitions import PartitionCatalog, PARTITION_DATE_COLUMNS, partition_period, read_partitioned_frame
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes das Tabelas de Agregação ---
+# Só as abas lidas pelo dashboard: os totais de semana e mês saem das somas acumuladas do índice diário
+ROLLUP_DAILY = "Rollup_Diario"
+ROLLUP_WEEKDAY = "Perfil_Dia_Semana"
+
+# Colunas somáveis, já com os nomes usados pelo dashboard (aba Dados_Gerais)
+SUM_METRICS = ["faturamento", "investimento", "quantidade_vendas", "unidades_vendidas", "visitas", "clicks", "prints"]
+# Colunas de taxa: guardamos a soma e o número de dias para reconstruir a média
+MEAN_METRICS = ["acos", "tacos", "roi_media"]
+
+# Mapeamento das colunas da aba "Dados Consolidados v2" para o formato do dashboard
+CONSOLIDATED_TO_DASHBOARD = {
+    "Faturamento": "faturamento",
+    "Investimento": "investimento",
+    "Quantidade de Vendas": "quantidade_vendas",
+    "Unidades Vendidas": "unidades_vendidas",
+    "Visitas": "visitas",
+    "Cliques": "clicks",
+    "Impressões": "prints",
+    "ACOS": "acos",
+    "TACOS": "tacos",
+    "ROI Média": "roi_media",
+}
+
+CONSOLIDATED_WORKSHEET = "Dados Consolidados v2"
+LEGACY_DAILY_WORKSHEET = "Dados_Gerais"  # base diária anterior aos coletores, já no formato do dashboard
+REBUILD_CHUNK_ROWS = 5000
+
+ROLLUP_KEYS = {
+    ROLLUP_DAILY: ["cliente", "data"],
+    ROLLUP_WEEKDAY: ["cliente", "dia_semana"],
+}
+
+# --- Conversão dos Valores Formatados ---
+
+def _parse_number(value):
+    """Converte valores como 'R$ 1,234.56', '12.34%' ou 1234 para float (percentuais viram fração)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if text in ["", "N/A", "None", "nan"]:
+        return None
+    is_percent = text.endswith("%")
+    text = text.replace("R$", "").replace("%", "").replace(" ", "")
+    if "," in text and "." in text:
+        # O último separador é o decimal
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return number / 100 if is_percent else number
+
+def consolidated_to_daily(df_consolidado):
+    """Converte linhas da aba consolidada para o formato numérico diário do dashboard."""
+    if df_consolidado.empty or "periodo_consulta" not in df_consolidado.columns:
+        return pd.DataFrame(columns=["cliente", "data"] + SUM_METRICS + MEAN_METRICS)
+
+    df_daily = pd.DataFrame({
+        "cliente": df_consolidado["cliente"].astype(str),
+        "data": pd.to_datetime(df_consolidado["periodo_consulta"], errors="coerce"),
+    })
+    for source_col, target_col in CONSOLIDATED_TO_DASHBOARD.items():
+        if source_col in df_consolidado.columns:
+            df_daily[target_col] = pd.to_numeric(df_consolidado[source_col].map(_parse_number), errors="coerce")
+        else:
+            df_daily[target_col] = float("nan")
+    df_daily = df_daily.dropna(subset=["data"])
+    # Em caso de chaves duplicadas na planilha, a última linha escrita prevalece
+    return df_daily.drop_duplicates(subset=["cliente", "data"], keep="last")
+
+def legacy_to_daily(df_legacy):
+    """Converte as linhas da aba Dados_Gerais (já com os nomes do dashboard) para o mesmo formato numérico diário."""
+    columns = ["cliente", "data"] + SUM_METRICS + MEAN_METRICS
+    if df_legacy.empty or not {"cliente", "data"}.issubset(df_legacy.columns):
+        return pd.DataFrame(columns=columns)
+    df_daily = pd.DataFrame({
+        "cliente": df_legacy["cliente"].astype(str),
+        "data": pd.to_datetime(df_legacy["data"], errors="coerce"),
+    })
+    for col in SUM_METRICS + MEAN_METRICS:
+        df_daily[col] = pd.to_numeric(df_legacy[col].map(_parse_number), errors="coerce") if col in df_legacy.columns else float("nan")
+    return df_daily.dropna(subset=["data"]).drop_duplicates(subset=["cliente", "data"], keep="last")
+
+# A base antiga não recebe mais escritas: é lida uma vez por processo e planilha
+_legacy_daily_cache = {}
+
+def load_legacy_daily(spreadsheet, catalog=None):
+    """Linhas diárias de Dados_Gerais no formato numérico (ver legacy_to_daily), em cache por planilha."""
+    if spreadsheet.id not in _legacy_daily_cache:
+        _legacy_daily_cache[spreadsheet.id] = legacy_to_daily(read_partitioned_frame(spreadsheet, LEGACY_DAILY_WORKSHEET, catalog))
+    return _legacy_daily_cache[spreadsheet.id]
+
+def merge_daily_sources(df_legacy, df_consolidated):
+    """Une a base antiga e a consolidada; na mesma chave (cliente, dia), a consolidada prevalece."""
+    return pd.concat([df_legacy, df_consolidated], ignore_index=True).drop_duplicates(subset=["cliente", "data"], keep="last")
+
+# --- Cálculo das Agregações ---
+
+def _aggregate(df_daily, period_col):
+    grouped = df_daily.groupby(["cliente", period_col])
+    df_rollup = grouped[SUM_METRICS].sum(min_count=1)
+    for col in MEAN_METRICS:
+        df_rollup[f"{col}_soma"] = grouped[col].sum(min_count=1)
+        df_rollup[f"{col}_dias"] = grouped[col].count()
+    df_rollup["dias"] = grouped.size()
+    return df_rollup.reset_index()
+
+def compute_rollups(df_daily):
+    """Calcula a tabela diária e o perfil por dia da semana a partir de linhas diárias."""
+    df_daily = df_daily.copy()
+    df_daily["dia_semana"] = df_daily["data"].dt.dayofweek
+
+    daily = df_daily[["cliente", "data", "dia_semana"] + SUM_METRICS + MEAN_METRICS].copy()
+    daily["data"] = daily["data"].dt.strftime("%Y-%m-%d")
+
+    return {
+        ROLLUP_DAILY: daily,
+        ROLLUP_WEEKDAY: _aggregate(df_daily, "dia_semana"),
+    }
+
+def compute_affected_rollups(df_consolidado, touched_keys, df_legacy=None):
+    """
+    Recalcula apenas os buckets (dia, dia da semana) afetados pelas chaves (cliente, 'YYYY-MM-DD')
+    escritas nesta execução. `df_legacy` (ver load_legacy_daily) entra no perfil por dia da semana
+    com os mesmos dias que a reconstrução completa usa, para não desfazê-la.
+    """
+    df_daily = consolidated_to_daily(df_consolidado)
+    if df_daily.empty or not touched_keys:
+        return {}
+
+    touched = pd.DataFrame(list(touched_keys), columns=["cliente", "data"])
+    touched["data"] = pd.to_datetime(touched["data"])
+    touched["dia_semana"] = touched["data"].dt.dayofweek
+
+    # O perfil por dia da semana depende de todo o histórico do cliente, mas só dos clientes tocados
+    clients = touched["cliente"].unique()
+    df_daily = df_daily[df_daily["cliente"].isin(clients)]
+    if df_legacy is not None and not df_legacy.empty:
+        df_daily = merge_daily_sources(df_legacy[df_legacy["cliente"].isin(clients)], df_daily)
+    rollups = compute_rollups(df_daily)
+
+    affected = {}
+    for name, df_rollup in rollups.items():
+        period_col = ROLLUP_KEYS[name][1]
+        touched_col = touched[["cliente", period_col]].copy()
+        if name == ROLLUP_DAILY:
+            touched_col[period_col] = touched_col[period_col].dt.strftime("%Y-%m-%d")
+        keys = set(map(tuple, touched_col.astype(str).values.tolist()))
+        mask = [(str(c), str(p)) in keys for c, p in zip(df_rollup["cliente"], df_rollup[period_col])]
+        affected[name] = df_rollup[mask]
+    return affected
+
+# --- Escrita no Google Sheets ---
+
+def upsert_rows_by_key(worksheet, df_rows, key_cols):
+    """
+    Atualiza em lote as linhas existentes (pela chave) e adiciona as novas.
+    Usa RAW para que as chaves de texto (datas, semanas) não sejam reformatadas pela planilha.
+    """
+    if df_rows.empty:
+        return
+    values = worksheet.get_all_values()
+    header = values[0] if values else []
+    if not header:
+        header = df_rows.columns.tolist()
+        worksheet.update([header], value_input_option='RAW')
+        values = [header]
+
+    key_positions = [header.index(col) for col in key_cols]
+    existing_index = {tuple(row[pos] if pos < len(row) else "" for pos in key_positions): row_number
+                      for row_number, row in enumerate(values[1:], start=2)}
+
+    df_aligned = df_rows.reindex(columns=header)
+    df_aligned = df_aligned.astype(object).where(pd.notna(df_aligned), "")
+    updates_to_batch, rows_to_append = [], []
+    for row in df_aligned.values.tolist():
+        key = tuple(str(row[pos]) for pos in key_positions)
+        if key in existing_index:
+            updates_to_batch.append({'range': f'A{existing_index[key]}', 'values': [row]})
+        else:
+            rows_to_append.append(row)
+
+    if updates_to_batch:
+        worksheet.batch_update(updates_to_batch, value_input_option='RAW')
+    if rows_to_append:
+        worksheet.append_rows(rows_to_append, value_input_option='RAW')
+    logger.info(f"Aba '{worksheet.title}': {len(updates_to_batch)} linhas atualizadas, {len(rows_to_append)} adicionadas.")
+
+def refresh_rollups(spreadsheet, df_consolidado, touched_keys):
+    """Propaga para as abas de rollup as chaves (cliente, data) escritas pelos coletores."""
+    if not touched_keys:
+        return
+    catalog = PartitionCatalog(spreadsheet)
+    affected = compute_affected_rollups(df_consolidado, touched_keys, load_legacy_daily(spreadsheet, catalog))
+    for name, df_rows in affected.items():
+        try:
+            if catalog.is_partitioned(name):
+                # Rollup particionado por período: cada linha vai só para a partição da sua data
+                periods = df_rows[PARTITION_DATE_COLUMNS[name]].astype(str).map(lambda d: partition_period(name, d))
+                for _, df_part in df_rows.groupby(periods):
+                    date_str = str(df_part[PARTITION_DATE_COLUMNS[name]].iloc[0])
+                    upsert_rows_by_key(catalog.worksheet_for(name, date_str, df_rows.columns.tolist()), df_part, ROLLUP_KEYS[name])
+                continue
+            try:
+                worksheet = spreadsheet.worksheet(name)
+            except gspread.WorksheetNotFound:
+                worksheet = spreadsheet.add_worksheet(title=name, rows="1", cols=len(df_rows.columns))
+                logger.info(f"Aba '{name}' criada com sucesso.")
+            upsert_rows_by_key(worksheet, df_rows, ROLLUP_KEYS[name])
+        except gspread.exceptions.APIError as e:
+            logger.error(f"ERRO DE API ao atualizar o rollup '{name}'. Pausando por 60s. Erro: {e}")
+            telemetry.sleep(60, "cota_sheets")
+
+# --- Reconstrução Completa ---
+
+def replace_rows(worksheet, df_rows):
+    """Substitui o conteúdo da aba pelas linhas (RAW), em blocos para não estourar o tamanho da requisição."""
+    df_rows = df_rows.astype(object).where(pd.notna(df_rows), "")
+    worksheet.clear()
+    worksheet.update([df_rows.columns.tolist()], value_input_option='RAW')
+    rows = df_rows.values.tolist()
+    for start in range(0, len(rows), REBUILD_CHUNK_ROWS):
+        worksheet.append_rows(rows[start:start + REBUILD_CHUNK_ROWS], value_input_option='RAW')
+    logger.info(f"Aba '{worksheet.title}': {len(rows)} linhas gravadas.")
+
+def rebuild_rollups(spreadsheet):
+    """
+    Recalcula todas as abas de rollup a partir do histórico inteiro: a aba consolidada e,
+    para os dias que só existem nela, a base diária antiga Dados_Gerais.
+    Os coletores só propagam as chaves que escrevem; rode uma vez antes de o dashboard
+    passar a ler os rollups (ou depois de corrigir dados antigos).
+    """
+    catalog = PartitionCatalog(spreadsheet)
+    df_consolidated = consolidated_to_daily(read_partitioned_frame(spreadsheet, CONSOLIDATED_WORKSHEET, catalog))
+    _legacy_daily_cache.pop(spreadsheet.id, None)  # a reconstrução sempre relê a base antiga
+    df_legacy = load_legacy_daily(spreadsheet, catalog)
+    df_daily = merge_daily_sources(df_legacy, df_consolidated)
+    logger.info(f"Base diária: {len(df_consolidated)} linhas consolidadas e {len(df_daily) - len(df_consolidated)} só em '{LEGACY_DAILY_WORKSHEET}'.")
+
+    for name, df_rows in compute_rollups(df_daily).items():
+        if catalog.is_partitioned(name):
+            periods = df_rows[PARTITION_DATE_COLUMNS[name]].astype(str).map(lambda d: partition_period(name, d))
+            for _, df_part in df_rows.groupby(periods):
+                date_str = str(df_part[PARTITION_DATE_COLUMNS[name]].iloc[0])
+                replace_rows(catalog.worksheet_for(name, date_str, df_rows.columns.tolist()), df_part)
+            continue
+        try:
+            worksheet = spreadsheet.worksheet(name)
+        except gspread.WorksheetNotFound:
+            worksheet = spreadsheet.add_worksheet(title=name, rows="1", cols=len(df_rows.columns))
+            logger.info(f"Aba '{name}' criada com sucesso.")
+        replace_rows(worksheet, df_rows)
+
+def main():
+    from meli_collector import load_clients_and_credentials
+    from google.oauth2.service_account import Credentials
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Manutenção das abas de rollup lidas pelo dashboard.")
+    parser.add_argument('--reconstruir', action='store_true', required=True, help="Recalcula todos os rollups a partir do histórico completo.")
+    parser.parse_args()
+
+    google_creds, _ = load_clients_and_credentials()
+    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+    creds = Credentials.from_service_account_info(google_creds, scopes=scopes)
+    spreadsheet = telemetry.instrument_gspread(gspread.authorize(creds)).open("Histórico de Vendas Meli - 2024")
+    telemetry.start_run("rollups_reconstruir")
+    rebuild_rollups(spreadsheet)
+    telemetry.write_summary()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import time
+import json
+import os
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+RUN_HISTORY_FILE = "client_run_history.json"
+HISTORY_ALPHA = 0.3  # peso da execução mais recente na média móvel exponencial
+DEFAULT_EXPECTED_SECONDS = 60
+COLLECTOR_MAX_WORKERS = int(os.environ.get("MELI_COLLECTOR_WORKERS", "4"))
+REALTIME_DEADLINE_MINUTES = 100  # folga dentro da janela de 2h até a próxima execução em tempo real
+
+# --- Histórico de Duração por Cliente ---
+
+class ClientRunHistory:
+    """
+    Duração e volume de pedidos por cliente e tipo de execução (média móvel exponencial), em JSON.
+    Usado para ordenar os clientes do mais longo para o mais curto (LPT) no pool de workers,
+    para que um vendedor grande não fique por último segurando a execução inteira.
+    """
+    def __init__(self, path=RUN_HISTORY_FILE):
+        self.path = path
+        self.runs = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.runs = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Histórico de execuções '{path}' inválido. Começando vazio.")
+
+    def record(self, run_kind, client_name, seconds, orders):
+        clients = self.runs.setdefault(run_kind, {})
+        entry = clients.get(client_name)
+        if entry:
+            entry["duracao_s"] = round(HISTORY_ALPHA * seconds + (1 - HISTORY_ALPHA) * entry["duracao_s"], 2)
+            entry["pedidos"] = round(HISTORY_ALPHA * orders + (1 - HISTORY_ALPHA) * entry["pedidos"], 1)
+            entry["execucoes"] += 1
+        else:
+            clients[client_name] = entry = {"duracao_s": round(seconds, 2), "pedidos": orders, "execucoes": 1}
+        entry["atualizado_em"] = time.time()
+
+    def expected_seconds(self, run_kind, client_name):
+        """Duração esperada; clientes sem histórico recebem a maior duração conhecida (entram primeiro)."""
+        clients = self.runs.get(run_kind, {})
+        if client_name in clients:
+            return clients[client_name]["duracao_s"]
+        return max((c["duracao_s"] for c in clients.values()), default=DEFAULT_EXPECTED_SECONDS)
+
+    def order_longest_first(self, run_kind, client_names):
+        return sorted(client_names, key=lambda name: self.expected_seconds(run_kind, name), reverse=True)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.runs, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+# --- Prazo da Execução ---
+
+class RunDeadline:
+    """
+    Orçamento de tempo de uma execução. O trabalho principal (linha consolidada) sempre roda;
+    o de baixa prioridade consulta `allows` e é adiado quando o orçamento acaba.
+    Sem orçamento (None), nada é adiado.
+    """
+    def __init__(self, budget_seconds=None):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.time()
+        self.deferred = Counter()
+
+    def remaining(self):
+        if self.budget_seconds is None:
+            return float("inf")
+        return self.budget_seconds - (time.time() - self.started_at)
+
+    def allows(self, work):
+        if self.remaining() > 0:
+            return True
+        self.deferred[work] += 1
+        return False
+
+    def log_summary(self):
+        if self.deferred:
+            detail = ", ".join(f"{work}: {count}" for work, count in self.deferred.items())
+            logger.warning(f"Prazo de {self.budget_seconds / 60:.0f} min excedido. Trabalho adiado para a próxima execução ({detail}).")
@@ -0,0 +1,277 @@
+import time
+import json
+import os
+import re
+import threading
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# --- Constantes ---
+TELEMETRY_DIR = os.environ.get("TELEMETRY_DIR", "telemetry")
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+METRIC_PREFIX = "meli_run"
+
+# --- Rótulos de Endpoint ---
+
+def endpoint_label(method, url):
+    """
+    Normaliza a URL para um rótulo de baixa cardinalidade:
+    ids numéricos, ids de planilha e intervalos A1 viram marcadores.
+    """
+    parsed = urlparse(url)
+    path = parsed.path
+    path = re.sub(r"/spreadsheets/[^/:]+", "/spreadsheets/{id}", path)
+    path = re.sub(r"/values/[^:/]+", "/values/{range}", path)
+    path = re.sub(r"/\d+(?=/|$)", "/{id}", path)
+    return f"{method} {path}"
+
+def service_label(url):
+    parsed = urlparse(url)
+    is_google = "googleapis" in parsed.netloc or parsed.path.startswith(("/v4/spreadsheets", "/drive/"))
+    return "sheets" if is_google else "meli"
+
+# --- Histograma ---
+
+class LatencyHistogram:
+    """Histograma cumulativo no formato do Prometheus (buckets 'le')."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q):
+        """Estimativa pelo limite superior do primeiro bucket que alcança o quantil."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= target:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {
+            "contagem": self.count, "soma_s": round(self.sum, 3), "max_s": round(self.max, 3),
+            "p50_s": self.quantile(0.5), "p95_s": self.quantile(0.95),
+            "buckets": {str(b): c for b, c in zip(self.buckets, self.counts)},
+        }
+
+# --- Telemetria da Execução ---
+
+class RunTelemetry:
+    """
+    Acumula métricas de uma execução: latência e status por endpoint (Mercado Livre e Sheets),
+    retentativas, tempo de espera (sleep/throttle), bytes recebidos e tempo de parede por cliente.
+    As requisições são medidas por hooks de resposta do requests, então qualquer sessão
+    instrumentada (coletor, token, gspread) é contabilizada sem alterar o código de chamada.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self.run_name = None
+        self.started_at = None
+        self.latency = defaultdict(LatencyHistogram)
+        self.status = defaultdict(int)
+        self.bytes = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.failures = defaultdict(int)
+        self.sleep_seconds = defaultdict(float)
+        self.client_seconds = defaultdict(float)
+        self.client_requests = defaultdict(int)
+
+    def start_run(self, run_name):
+        """Zera as métricas: em processos de longa duração (daemon), cada ciclo tem seu próprio resumo."""
+        with self.lock:
+            self._reset()
+        self.run_name = run_name
+        self.started_at = time.time()
+
+    @property
+    def current_client(self):
+        return getattr(self.local, "client", None)
+
+    # --- Coleta ---
+
+    def _on_response(self, response, *args, **kwargs):
+        request = response.request
+        key = (service_label(request.url), endpoint_label(request.method, request.url))
+        with self.lock:
+            self.latency[key].observe(response.elapsed.total_seconds())
+            self.status[key + (str(response.status_code),)] += 1
+            self.bytes[key] += len(response.content or b"")
+            if self.current_client:
+                self.client_requests[self.current_client] += 1
+        return response
+
+    def hooks(self):
+        """Hooks para uma chamada avulsa: requests.post(..., hooks=telemetry.hooks())."""
+        return {"response": [self._on_response]}
+
+    def instrument_session(self, session):
+        session.hooks.setdefault("response", []).append(self._on_response)
+        return session
+
+    def instrument_gspread(self, client):
+        """Instrumenta a sessão HTTP de um cliente gspread (v5: client.session; v6: client.http_client.session)."""
+        http_client = getattr(client, "http_client", client)
+        session = getattr(http_client, "session", None)
+        if session is not None:
+            self.instrument_session(session)
+        return client
+
+    def record_retry(self, method, url):
+        with self.lock:
+            self.retries[(service_label(url), endpoint_label(method, url))] += 1
+
+    def record_failure(self, method, url):
+        """Requisição sem resposta HTTP (timeout, conexão recusada)."""
+        with self.lock:
+            self.failures[(service_label(url), endpoint_label(method, url))] += 1
+
+    def sleep(self, seconds, reason):
+        """time.sleep contabilizado por motivo (backoff, pausa entre clientes, cota do Sheets...)."""
+        with self.lock:
+            self.sleep_seconds[reason] += seconds
+        time.sleep(seconds)
+
+    @contextmanager
+    def client_timer(self, client_name):
+        """Atribui as requisições e o tempo de parede do bloco ao cliente."""
+        previous = self.current_client
+        self.local.client = client_name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.client_seconds[client_name] += time.perf_counter() - started
+            self.local.client = previous
+
+    # --- Resumo ---
+
+    def summary(self):
+        with self.lock:
+            endpoints = {}
+            for (service, endpoint), histogram in self.latency.items():
+                endpoints[f"{service} {endpoint}"] = {
+                    "latencia": histogram.to_dict(),
+                    "status": {s: n for (sv, ep, s), n in self.status.items() if (sv, ep) == (service, endpoint)},
+                    "bytes": self.bytes[(service, endpoint)],
+                    "retentativas": self.retries.get((service, endpoint), 0),
+                    "falhas_sem_resposta": self.failures.get((service, endpoint), 0),
+                }
+            for (service, endpoint) in set(self.failures) - set(self.latency):
+                endpoints[f"{service} {endpoint}"] = {"falhas_sem_resposta": self.failures[(service, endpoint)],
+                                                      "retentativas": self.retries.get((service, endpoint), 0)}
+            sheets_calls = sum(h.count for (service, _), h in self.latency.items() if service == "sheets")
+            return {
+                "execucao": self.run_name,
+                "inicio": datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds') if self.started_at else None,
+                "duracao_s": round(time.time() - self.started_at, 3) if self.started_at else None,
+                "chamadas_sheets": sheets_calls,
+                "requisicoes_meli": sum(h.count for (service, _), h in self.latency.items() if service == "meli"),
+                "sleep_s": {reason: round(s, 2) for reason, s in self.sleep_seconds.items()},
+                "clientes": {c: {"tempo_s": round(s, 3), "requisicoes": self.client_requests.get(c, 0)}
+                             for c, s in sorted(self.client_seconds.items(), key=lambda item: -item[1])},
+                "endpoints": dict(sorted(endpoints.items(), key=lambda item: -item[1].get("latencia", {}).get("soma_s", 0))),
+            }
+
+    def prometheus_text(self, summary=None):
+        summary = summary or self.summary()
+        run = _escape(self.run_name or "desconhecido")
+        lines = []
+
+        def _metric(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        _metric("duration_seconds", "gauge", "Tempo de parede da execucao.")
+        lines.append(f'{METRIC_PREFIX}_duration_seconds{{run="{run}"}} {summary["duracao_s"] or 0}')
+        _metric("last_run_timestamp_seconds", "gauge", "Fim da ultima execucao (epoch).")
+        lines.append(f'{METRIC_PREFIX}_last_run_timestamp_seconds{{run="{run}"}} {int(time.time())}')
+
+        with self.lock:
+            _metric("request_duration_seconds", "histogram", "Latencia das requisicoes HTTP por endpoint.")
+            for (service, endpoint), histogram in sorted(self.latency.items()):
+                labels = f'run="{run}",service="{service}",endpoint="{_escape(endpoint)}"'
+                for bound, cumulative in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_count{{{labels}}} {histogram.count}')
+
+            _metric("requests_total", "counter", "Respostas HTTP por endpoint e status.")
+            for (service, endpoint, status), count in sorted(self.status.items()):
+                lines.append(f'{METRIC_PREFIX}_requests_total{{run="{run}",service="{service}",endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+
+            _metric("response_bytes_total", "counter", "Bytes recebidos por endpoint.")
+            for (service, endpoint), total in sorted(self.bytes.items()):
+                lines.append(f'{METRIC_PREFIX}_response_bytes_total{{run="{run}",service="{service}",endpoint="{_escape(endpoint)}"}} {total}')
+
+            _metric("retries_total", "counter", "Retentativas por endpoint.")
+            for (service, endpoint), count in sorted(self.retries.items()):
+                lines.append(f'{METRIC_PREFIX}_retries_total{{run="{run}",service="{service}",endpoint="{_escape(endpoint)}"}} {count}')
+
+            _metric("request_failures_total", "counter", "Requisicoes sem resposta HTTP (timeout, conexao).")
+            for (service, endpoint), count in sorted(self.failures.items()):
+                lines.append(f'{METRIC_PREFIX}_request_failures_total{{run="{run}",service="{service}",endpoint="{_escape(endpoint)}"}} {count}')
+
+            _metric("sleep_seconds_total", "counter", "Tempo de espera proposital por motivo.")
+            for reason, seconds in sorted(self.sleep_seconds.items()):
+                lines.append(f'{METRIC_PREFIX}_sleep_seconds_total{{run="{run}",reason="{_escape(reason)}"}} {seconds:.3f}')
+
+            _metric("client_duration_seconds", "gauge", "Tempo de parede por cliente.")
+            for client_name, seconds in sorted(self.client_seconds.items()):
+                lines.append(f'{METRIC_PREFIX}_client_duration_seconds{{run="{run}",client="{_escape(client_name)}"}} {seconds:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def write_summary(self, directory=TELEMETRY_DIR):
+        """
+        Grava <execucao>.json (último resumo), acrescenta o resumo em <execucao>_historico.jsonl
+        e publica <execucao>.prom para o textfile collector do node_exporter.
+        Falhas aqui nunca derrubam a execução.
+        """
+        try:
+            os.makedirs(directory, exist_ok=True)
+            summary = self.summary()
+            name = self.run_name or "execucao"
+            _atomic_write(os.path.join(directory, f"{name}.json"), json.dumps(summary, indent=2, ensure_ascii=False))
+            _atomic_write(os.path.join(directory, f"{name}.prom"), self.prometheus_text(summary))
+            with open(os.path.join(directory, f"{name}_historico.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            logger.info(f"Telemetria gravada em '{directory}': {summary['requisicoes_meli']} requisições ao Mercado Livre, "
+                        f"{summary['chamadas_sheets']} chamadas ao Sheets, {summary['duracao_s']}s.")
+            return summary
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar a telemetria da execução: {e}")
+            return None
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def _atomic_write(path, content):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+# Instância única por processo, compartilhada pelos módulos de coleta
+telemetry = RunTelemetry()
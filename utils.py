@@ -1,22 +1,421 @@
 # utils.py
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import os
+import time
+import tempfile
+import threading
+import logging
+import hashlib
+import re
 from gsheetsdb import connect
 
-@st.cache_data(ttl=600)
-def load_data(worksheet_name="Dados_Gerais"):
-    """Conecta a uma aba específica da planilha e retorna um DataFrame."""
+logger = logging.getLogger(__name__)
+
+# Abas de rollup mantidas pelos coletores (ver rollups.py) que o dashboard lê.
+# Os totais de período saem das somas acumuladas do índice diário: semanas e meses não são baixados.
+ROLLUP_SHEETS = {
+    "diario": "Rollup_Diario",
+    "dia_semana": "Perfil_Dia_Semana",
+}
+KEY_COLUMNS = ("data", "cliente")
+SUM_METRICS = ["faturamento", "investimento", "quantidade_vendas", "unidades_vendidas", "visitas", "clicks", "prints"]
+MEAN_METRICS = ["acos", "tacos", "roi_media"]
+ADS_REVENUE = "vendas_ads"  # reconstruída por dia como investimento / acos, para o ACOS do período
+
+# Snapshots locais (Arrow/Feather) compartilhados entre sessões, workers e reinícios
+SNAPSHOT_DIR = os.path.join(".cache", "snapshots")
+SNAPSHOT_TTL = 600
+REFRESH_AHEAD_FRACTION = 0.8  # o aquecimento renova o snapshot ao atingir 80% do TTL
+WARMUP_CHECK_SECONDS = 60
+WARMUP_SHEETS = [*ROLLUP_SHEETS.values(), "Perfil_Horario"]
+# Snapshots filtrados (um por predicado) só servem à partida a frio: limitados em disco e em memória
+MAX_FILTERED_SNAPSHOTS = 100
+MAX_CACHED_FRAMES = 32
+_FILTERED_SNAPSHOT_RE = re.compile(r"^(?P<sheet>.+)__[0-9a-f]{12}\.arrow$")
+# Catálogo das abas particionadas por período (ver partitions.py)
+CATALOG_SHEET = "Catalogo_Particoes"
+CATALOG_ENABLED_MARKER = "*"
+_refresh_lock = threading.Lock()
+_refreshing = set()
+
+def _sql_literal(value):
+    text = str(value)
+    return f'"{text}"' if "'" in text else f"'{text}'"
+
+def build_query(spreadsheet_url, worksheet_name, predicates=None):
+    """
+    Monta a consulta do gsheetsdb com o filtro e as colunas empurrados para o servidor:
+    período em 'data' (texto ISO, como gravado pelos rollups), clientes em 'cliente' e SELECT só das colunas pedidas.
+    """
+    predicates = predicates or {}
+    columns = predicates.get("columns")
+    select = ", ".join(f'"{col}"' for col in columns) if columns else "*"
+    conditions = []
+    if predicates.get("start_date") is not None:
+        conditions.append(f"data >= '{pd.Timestamp(predicates['start_date']):%Y-%m-%d}'")
+    if predicates.get("end_date") is not None:
+        conditions.append(f"data <= '{pd.Timestamp(predicates['end_date']):%Y-%m-%d}'")
+    if predicates.get("clients"):
+        conditions.append("(" + " OR ".join(f"cliente = {_sql_literal(c)}" for c in predicates["clients"]) + ")")
+    query = f'SELECT {select} FROM "{spreadsheet_url}&sheet={worksheet_name}"'
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query
+
+def filter_frame(df, predicates=None):
+    """Aplica localmente o mesmo filtro de build_query (snapshot completo já em disco ou consulta recusada)."""
+    predicates = predicates or {}
+    if df.empty:
+        return df
+    mask = pd.Series(True, index=df.index)
+    if 'data' in df.columns:
+        if predicates.get("start_date") is not None:
+            mask &= df['data'] >= pd.Timestamp(predicates["start_date"])
+        if predicates.get("end_date") is not None:
+            mask &= df['data'] < pd.Timestamp(predicates["end_date"]) + pd.Timedelta(days=1)
+    if predicates.get("clients") and 'cliente' in df.columns:
+        mask &= df['cliente'].isin(predicates["clients"])
+    columns = [col for col in (predicates.get("columns") or df.columns) if col in df.columns]
+    return df.loc[mask, columns].reset_index(drop=True)
+
+def _fetch_sheet(spreadsheet_url, worksheet_name, predicates=None):
+    """Baixa a aba via gsheetsdb (só as linhas e colunas dos predicados) e retorna o DataFrame já limpo."""
+    conn = connect()
+    if predicates:
+        try:
+            rows = conn.execute(build_query(spreadsheet_url, worksheet_name, predicates), headers=1)
+            return clean_data(pd.DataFrame(rows))
+        except Exception as e:
+            # Ex.: coluna 'data' com tipo de data na planilha não compara com texto; filtra no cliente
+            logger.warning(f"Consulta filtrada da aba '{worksheet_name}' recusada ({e}). Baixando a aba completa.")
+    rows = conn.execute(build_query(spreadsheet_url, worksheet_name), headers=1)
+    return filter_frame(clean_data(pd.DataFrame(rows)), predicates)
+
+def _predicates_key(predicates):
+    """Chave estável dos predicados, usada no nome do snapshot filtrado."""
+    if not predicates:
+        return None
+    text = repr(sorted((k, str(v)) for k, v in predicates.items() if v))
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+def _snapshot_path(worksheet_name, predicates=None):
+    key = _predicates_key(predicates)
+    name = f"{worksheet_name}__{key}" if key else worksheet_name
+    return os.path.join(SNAPSHOT_DIR, f"{name}.arrow")
+
+def write_snapshot(df, path):
+    """Grava o snapshot num arquivo temporário e o publica com os.replace (troca atômica)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
     try:
-        conn = connect()
-        spreadsheet_url = st.secrets["connections"]["gcs"]["spreadsheet"]
-        query = f'SELECT * FROM "{spreadsheet_url}&sheet={worksheet_name}"'
-        rows = conn.execute(query, headers=1)
-        df = pd.DataFrame(rows)
-        return clean_data(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Colunas com tipos mistos (clean_data ignora erros de conversão) viram texto
+        df = df.copy()
+        for col in df.select_dtypes(include="object").columns:
+            df[col] = df[col].map(lambda v: None if pd.isna(v) else str(v))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_snapshot_table(path):
+    """
+    Abre o snapshot por memory-map (somente leitura), sem copiar: a tabela Arrow aponta para as páginas
+    do arquivo, compartilhadas entre os processos. Retorna None se não existir ou estiver corrompido.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    except (OSError, pa.ArrowInvalid) as e:
+        logger.warning(f"Snapshot '{path}' ilegível, será recriado: {e}")
+        return None
+
+def read_snapshot(path):
+    """Snapshot inteiro como DataFrame (cópia no heap do processo); None se não existir ou estiver corrompido."""
+    table = read_snapshot_table(path)
+    return table.to_pandas() if table is not None else None
+
+def slice_table(table, predicates=None):
+    """
+    Aplica o filtro de filter_frame direto na tabela Arrow e converte para pandas só a fatia.
+    Colunas com tipo inesperado (ex.: 'data' gravada como texto) caem no filtro do pandas.
+    """
+    predicates = predicates or {}
+    try:
+        conditions = []
+        if 'data' in table.column_names:
+            data = table['data']
+            if predicates.get("start_date") is not None:
+                conditions.append(pc.greater_equal(data, pa.scalar(pd.Timestamp(predicates["start_date"]).to_pydatetime(), type=data.type)))
+            if predicates.get("end_date") is not None:
+                end = pd.Timestamp(predicates["end_date"]) + pd.Timedelta(days=1)
+                conditions.append(pc.less(data, pa.scalar(end.to_pydatetime(), type=data.type)))
+        if predicates.get("clients") and 'cliente' in table.column_names:
+            conditions.append(pc.is_in(table['cliente'], value_set=pa.array(list(predicates["clients"]), type=table['cliente'].type)))
+        if conditions:
+            mask = conditions[0]
+            for condition in conditions[1:]:
+                mask = pc.and_(mask, condition)
+            table = table.filter(mask)
+        columns = [col for col in (predicates.get("columns") or table.column_names) if col in table.column_names]
+        return table.select(columns).to_pandas()
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError) as e:
+        logger.warning(f"Filtro Arrow indisponível ({e}). Filtrando no pandas.")
+        return filter_frame(table.to_pandas(), predicates)
+
+def refresh_snapshot(spreadsheet_url, worksheet_name, predicates=None):
+    """Baixa a aba (ou a fatia dos predicados) e substitui o snapshot local de forma atômica."""
+    df = _fetch_sheet(spreadsheet_url, worksheet_name, predicates)
+    write_snapshot(df, _snapshot_path(worksheet_name, predicates))
+    prune_filtered_snapshots(worksheet_name if not predicates else None)
+    return df
+
+def prune_filtered_snapshots(full_sheet=None):
+    """
+    Remove os snapshots filtrados da aba `full_sheet` (com o snapshot completo em disco, as fatias
+    saem dele) e, no diretório todo, os mais antigos além de MAX_FILTERED_SNAPSHOTS.
+    """
+    try:
+        entries = [entry for entry in os.scandir(SNAPSHOT_DIR) if _FILTERED_SNAPSHOT_RE.match(entry.name)]
+    except FileNotFoundError:
+        return
+    obsolete = [entry for entry in entries if _FILTERED_SNAPSHOT_RE.match(entry.name).group("sheet") == full_sheet]
+    remaining = sorted((entry for entry in entries if entry not in obsolete), key=lambda entry: entry.stat().st_mtime)
+    for entry in obsolete + remaining[:max(0, len(remaining) - MAX_FILTERED_SNAPSHOTS)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+def refresh_snapshot_async(spreadsheet_url, worksheet_name, predicates=None):
+    """Dispara a atualização do snapshot em segundo plano (no máximo uma por snapshot neste processo)."""
+    path = _snapshot_path(worksheet_name, predicates)
+    with _refresh_lock:
+        if path in _refreshing:
+            return
+        _refreshing.add(path)
+
+    def _run():
+        try:
+            refresh_snapshot(spreadsheet_url, worksheet_name, predicates)
+            logger.info(f"Snapshot '{os.path.basename(path)}' atualizado.")
+        except Exception as e:
+            logger.error(f"Falha ao atualizar o snapshot da aba '{worksheet_name}': {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(path)
+
+    threading.Thread(target=_run, name=f"snapshot-{worksheet_name}", daemon=True).start()
+
+def _active_predicates(predicates):
+    return predicates if predicates and any(predicates.values()) else None
+
+def _backing_snapshot(worksheet_name, predicates=None):
+    """(caminho, predicados) do snapshot que atende à leitura: o completo, se existir; senão o da fatia."""
+    full_path = _snapshot_path(worksheet_name)
+    if predicates is None or os.path.exists(full_path):
+        return full_path, None
+    return _snapshot_path(worksheet_name, predicates), predicates
+
+def revalidate_snapshot(worksheet_name, predicates=None):
+    """
+    Verificada a cada leitura, fora do cache em memória: dispara a renovação em segundo plano do
+    snapshot vencido e retorna sua versão (mtime), que entra na chave do cache. Assim um snapshot
+    novo em disco é usado na leitura seguinte, sem esperar o TTL do cache.
+    """
+    path, slice_predicates = _backing_snapshot(worksheet_name, _active_predicates(predicates))
+    try:
+        version = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None  # partida a frio: o download é feito (uma vez) dentro do cache
+    if time.time() - version / 1e9 > SNAPSHOT_TTL:
+        try:
+            refresh_snapshot_async(st.secrets["connections"]["gcs"]["spreadsheet"], worksheet_name, slice_predicates)
+        except Exception as e:
+            logger.error(f"Falha ao agendar a renovação do snapshot da aba '{worksheet_name}': {e}")
+    return version
+
+def load_data(worksheet_name="Dados_Gerais", start_date=None, end_date=None, clients=None, columns=None):
+    """
+    Retorna o DataFrame de uma aba da planilha, lido do snapshot local.
+    Com período, clientes ou colunas, só a fatia pedida é baixada (WHERE/SELECT na consulta),
+    e o cache fica separado por predicado (limitado a MAX_CACHED_FRAMES entradas); se a aba já tem
+    snapshot completo em disco, a fatia sai dele.
+    Abas particionadas por período são lidas só nas partições que cruzam o período pedido.
+    O DataFrame é compartilhado entre as sessões: não o modifique no lugar.
+    """
+    predicates = _normalize_predicates(start_date, end_date, clients, columns)
+    partitions = sheet_partitions(worksheet_name, predicates["start_date"], predicates["end_date"])
+    if partitions is not None:
+        versions = tuple(revalidate_snapshot(partition, predicates) for partition in partitions)
+        return _load_partitions_cached(tuple(partitions), versions, **predicates)
+    return _load_data_cached(worksheet_name, revalidate_snapshot(worksheet_name, predicates), **predicates)
+
+def _normalize_predicates(start_date=None, end_date=None, clients=None, columns=None):
+    return {
+        "start_date": pd.Timestamp(start_date).date() if start_date is not None else None,
+        "end_date": pd.Timestamp(end_date).date() if end_date is not None else None,
+        "clients": tuple(sorted(clients)) if clients else None,
+        "columns": tuple(columns) if columns else None,
+    }
+
+def data_version(worksheet_name, start_date=None, end_date=None, clients=None, columns=None):
+    """
+    Versão dos snapshots que atendem à leitura de load_data (mtime de cada um, com as partições do período).
+    Para caches construídos sobre load_data: entra na chave, e um snapshot novo invalida a entrada.
+    """
+    predicates = _normalize_predicates(start_date, end_date, clients, columns)
+    partitions = sheet_partitions(worksheet_name, predicates["start_date"], predicates["end_date"])
+    if partitions is not None:
+        return tuple((partition, revalidate_snapshot(partition, predicates)) for partition in partitions)
+    return revalidate_snapshot(worksheet_name, predicates)
+
+@st.cache_resource(ttl=SNAPSHOT_TTL, max_entries=MAX_CACHED_FRAMES)
+def _load_partitions_cached(partitions, versions, start_date=None, end_date=None, clients=None, columns=None):
+    """União das partições do período, cada uma com o próprio snapshot e o mesmo filtro."""
+    frames = [_load_data_cached(partition, version, start_date, end_date, clients, columns) for partition, version in zip(partitions, versions)]
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+# --- Abas Particionadas ---
+
+def catalog_partitions(catalog, worksheet_name):
+    """[(aba, primeiro dia, último dia)] das partições da base, da mais antiga para a mais nova; None se não é particionada."""
+    if catalog is None or catalog.empty or not {'base', 'periodo', 'aba'}.issubset(catalog.columns):
+        return None
+    rows = catalog[catalog['base'].astype(str) == worksheet_name]
+    if rows.empty:
+        return None
+    rows = rows[rows['periodo'].astype(str) != CATALOG_ENABLED_MARKER]
+    # Uma partição registrada duas vezes seria somada em dobro na união
+    rows = rows.drop_duplicates(subset='aba').sort_values('data_inicio')
+    return list(zip(rows['aba'].astype(str), rows['data_inicio'].astype(str), rows['data_fim'].astype(str)))
+
+@st.cache_resource(ttl=SNAPSHOT_TTL)
+def load_partition_catalog(version=None):
+    """Catálogo de partições (aba pequena); vazio quando a planilha não tem abas particionadas."""
+    try:
+        catalog = read_snapshot(_snapshot_path(CATALOG_SHEET))
+        if catalog is not None:
+            return catalog
+        return refresh_snapshot(st.secrets["connections"]["gcs"]["spreadsheet"], CATALOG_SHEET)
+    except Exception as e:
+        logger.info(f"Sem catálogo de partições: {e}")
+        return pd.DataFrame()
+
+def sheet_partitions(worksheet_name, start_date=None, end_date=None):
+    """Abas-partição da base que cruzam o período (datas ISO comparadas como texto); None se não é particionada."""
+    partitions = catalog_partitions(load_partition_catalog(revalidate_snapshot(CATALOG_SHEET)), worksheet_name)
+    if partitions is None:
+        return None
+    start = f"{pd.Timestamp(start_date):%Y-%m-%d}" if start_date is not None else None
+    end = f"{pd.Timestamp(end_date):%Y-%m-%d}" if end_date is not None else None
+    return [title for title, first_day, last_day in partitions
+            if (start is None or last_day >= start) and (end is None or first_day <= end)]
+
+@st.cache_resource(ttl=SNAPSHOT_TTL, max_entries=MAX_CACHED_FRAMES)
+def _load_data_cached(worksheet_name, version=None, start_date=None, end_date=None, clients=None, columns=None):
+    """
+    Lê o snapshot `version` (ver revalidate_snapshot) da aba. O snapshot completo, mesmo vencido,
+    atende também às leituras filtradas: só a fatia é convertida para pandas.
+    """
+    predicates = _active_predicates({"start_date": start_date, "end_date": end_date, "clients": clients, "columns": columns})
+    try:
+        path, slice_predicates = _backing_snapshot(worksheet_name, predicates)
+        table = read_snapshot_table(path)
+        if table is None:
+            # Partida a frio: única situação em que a sessão espera pelo download
+            return refresh_snapshot(st.secrets["connections"]["gcs"]["spreadsheet"], worksheet_name, slice_predicates)
+        return slice_table(table, predicates) if predicates and slice_predicates is None else table.to_pandas()
     except Exception as e:
         st.error(f"Erro ao carregar dados da aba '{worksheet_name}': {e}")
         return pd.DataFrame()
 
+# --- Aquecimento em Segundo Plano ---
+
+def _refresh_due(path):
+    return not os.path.exists(path) or time.time() - os.path.getmtime(path) >= SNAPSHOT_TTL * REFRESH_AHEAD_FRACTION
+
+def refresh_due_snapshots(spreadsheet_url, sheets=WARMUP_SHEETS):
+    """
+    Renova, em sequência, os snapshots completos ausentes ou perto de expirar.
+    Se o rollup diário estiver vazio, a aba Dados_Gerais (base diária de reserva) entra na lista.
+    Abas particionadas viram suas partições: só a mais recente (a que recebe escritas) é renovada
+    antes do TTL; as antigas só são baixadas quando ainda não têm snapshot.
+    """
+    try:
+        if _refresh_due(_snapshot_path(CATALOG_SHEET)):
+            refresh_snapshot(spreadsheet_url, CATALOG_SHEET)
+    except Exception as e:
+        logger.info(f"Sem catálogo de partições: {e}")
+    catalog = read_snapshot(_snapshot_path(CATALOG_SHEET))
+
+    targets = []  # (aba, renovar antes do TTL)
+    for worksheet_name in sheets:
+        partitions = catalog_partitions(catalog, worksheet_name)
+        if partitions is None:
+            targets.append((worksheet_name, True))
+        else:
+            targets.extend((title, position == len(partitions) - 1) for position, (title, _, _) in enumerate(partitions))
+    daily = read_snapshot(_snapshot_path(ROLLUP_SHEETS["diario"]))
+    if daily is not None and daily.empty:
+        targets.append(("Dados_Gerais", True))
+
+    refreshed = []
+    for worksheet_name, keep_fresh in targets:
+        path = _snapshot_path(worksheet_name)
+        if not (_refresh_due(path) if keep_fresh else not os.path.exists(path)):
+            continue
+        with _refresh_lock:
+            if path in _refreshing:
+                continue
+            _refreshing.add(path)
+        try:
+            df = refresh_snapshot(spreadsheet_url, worksheet_name)
+            refreshed.append(worksheet_name)
+            if worksheet_name == ROLLUP_SHEETS["diario"] and df.empty and ("Dados_Gerais", True) not in targets:
+                targets.append(("Dados_Gerais", True))
+        except Exception as e:
+            logger.error(f"Falha ao aquecer o snapshot da aba '{worksheet_name}': {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(path)
+    return refreshed
+
+@st.cache_resource
+def start_background_refresh():
+    """
+    Inicia (uma vez por processo) a thread que mantém os snapshots das páginas aquecidos,
+    renovando-os antes do TTL. Assim nenhuma sessão espera pelo download da planilha.
+    """
+    try:
+        spreadsheet_url = st.secrets["connections"]["gcs"]["spreadsheet"]
+    except Exception as e:
+        logger.error(f"Aquecimento dos snapshots desativado: {e}")
+        return None
+
+    def _run():
+        while True:
+            refreshed = refresh_due_snapshots(spreadsheet_url)
+            if refreshed:
+                logger.info(f"Snapshots aquecidos: {', '.join(refreshed)}.")
+            time.sleep(WARMUP_CHECK_SECONDS)
+
+    thread = threading.Thread(target=_run, name="snapshot-warmup", daemon=True)
+    thread.start()
+    return thread
+
 def clean_data(df):
     """Limpa e converte colunas para os tipos corretos."""
     if df.empty:
@@ -35,16 +434,141 @@ def clean_data(df):
         
     return df_clean
 
-def get_sidebar_filters(df):
-    """Cria e gerencia os filtros na barra lateral."""
+# --- Índice Ordenado por Cliente e Data ---
+
+def implied_ads_revenue(df):
+    """Vendas atribuídas aos anúncios em cada dia, reconstruídas de investimento / acos (acos em fração)."""
+    acos = pd.to_numeric(df['acos'], errors='coerce')
+    investimento = pd.to_numeric(df['investimento'], errors='coerce')
+    return (investimento / acos).where(acos > 0, 0.0).fillna(0.0)
+
+class DashboardIndex:
+    """
+    Mantém o dataset ordenado por (cliente, data), com os clientes como códigos
+    categóricos e o offset de cada cliente. A seleção de período vira uma busca
+    binária dentro de cada partição e a de clientes, uma consulta aos offsets.
+    Somas acumuladas das métricas sobre essa ordem dão o total de qualquer período
+    com duas consultas por cliente, sem percorrer as linhas.
+    """
+    def __init__(self, df):
+        if df.empty or 'data' not in df.columns:
+            df = pd.DataFrame(columns=['data', 'cliente'])
+        df = df.dropna(subset=['data'])
+        clientes = pd.Categorical(df['cliente'].astype(str) if 'cliente' in df.columns else [''] * len(df))
+        codes = clientes.codes.astype(np.int64)
+        order = np.lexsort((df['data'].values, codes))
+
+        self.df = df.iloc[order].reset_index(drop=True)
+        self.dates = self.df['data'].values.astype('datetime64[ns]')
+        self.clients = list(clientes.categories)
+        self.client_codes = {client: code for code, client in enumerate(self.clients)}
+        self.offsets = np.searchsorted(codes[order], np.arange(len(self.clients) + 1))
+        self.empty = self.df.empty
+        self.min_date = self.dates.min() if not self.empty else None
+        self.max_date = self.dates.max() if not self.empty else None
+
+        # Prefixos com um zero à frente: a soma de [first, last) é prefix[last] - prefix[first]
+        self.prefix = {}
+        for col in SUM_METRICS + MEAN_METRICS:
+            if col not in self.df.columns:
+                continue
+            values = pd.to_numeric(self.df[col], errors='coerce')
+            self.prefix[col] = np.concatenate(([0.0], np.cumsum(values.fillna(0).to_numpy(dtype=float))))
+            if col in MEAN_METRICS:
+                self.prefix[f"{col}_dias"] = np.concatenate(([0], np.cumsum(values.notna().to_numpy(dtype=np.int64))))
+        if 'acos' in self.df.columns and 'investimento' in self.df.columns:
+            self.prefix[ADS_REVENUE] = np.concatenate(([0.0], np.cumsum(implied_ads_revenue(self.df).to_numpy(dtype=float))))
+
+    def bounds(self, start_date, end_date, clients=None):
+        """Intervalos [first, last) do dataset ordenado no período [start_date, end_date], um por cliente."""
+        start = np.datetime64(pd.Timestamp(start_date), 'ns')
+        end = np.datetime64(pd.Timestamp(end_date) + pd.Timedelta(days=1), 'ns')
+        codes = [self.client_codes[c] for c in clients if c in self.client_codes] if clients else range(len(self.clients))
+        ranges = []
+        for code in codes:
+            lo, hi = self.offsets[code], self.offsets[code + 1]
+            partition = self.dates[lo:hi]
+            first = lo + np.searchsorted(partition, start, side='left')
+            last = lo + np.searchsorted(partition, end, side='left')
+            if last > first:
+                ranges.append((first, last))
+        return ranges
+
+    def slices(self, start_date, end_date, clients=None):
+        """Fatias (no dataset ordenado) das linhas no período [start_date, end_date] dos clientes, uma por cliente."""
+        return [slice(first, last) for first, last in self.bounds(start_date, end_date, clients)]
+
+    def totals(self, start_date, end_date, clients=None):
+        """
+        Totais do período pelas somas acumuladas: métricas somáveis, vendas por anúncios
+        e a média diária de acos/tacos/roi_media (as razões do período saem de derived_ratios).
+        """
+        ranges = self.bounds(start_date, end_date, clients)
+
+        def _range_sum(key):
+            prefix = self.prefix[key]
+            return sum(prefix[last] - prefix[first] for first, last in ranges)
+
+        totals = {col: (_range_sum(col) if col in self.prefix else 0) for col in SUM_METRICS + [ADS_REVENUE]}
+        for col in MEAN_METRICS:
+            dias = _range_sum(f"{col}_dias") if col in self.prefix else 0
+            totals[col] = _range_sum(col) / dias if dias > 0 else 0
+        return totals
+
+    def select(self, start_date, end_date, clients=None):
+        """Retorna as linhas do período e clientes selecionados (um único cliente sai como visão, sem cópia)."""
+        parts = [self.df.iloc[part] for part in self.slices(start_date, end_date, clients)]
+        if not parts:
+            return self.df.iloc[0:0]
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+@st.cache_resource(max_entries=MAX_CACHED_FRAMES, hash_funcs={pd.DataFrame: id})
+def _index_for_frame(df):
+    """Índice de um DataFrame já carregado, construído uma vez por objeto (o frame fica na entrada, então o id não é reaproveitado)."""
+    return df, DashboardIndex(df)
+
+def as_index(df):
+    """O próprio índice, ou o índice em cache do DataFrame (sem refazer a ordenação a cada interação)."""
+    return df if isinstance(df, DashboardIndex) else _index_for_frame(df)[1]
+
+def load_index(worksheet_name="Dados_Gerais", start_date=None, end_date=None, clients=None, columns=None):
+    """Carrega a aba (ou a fatia filtrada) e constrói o índice ordenado uma única vez por versão do snapshot, compartilhado entre as sessões."""
+    version = data_version(worksheet_name, start_date, end_date, clients, columns)
+    return _load_index_cached(worksheet_name, version, start_date, end_date, clients, columns)
+
+@st.cache_resource(ttl=SNAPSHOT_TTL, max_entries=MAX_CACHED_FRAMES)
+def _load_index_cached(worksheet_name, version, start_date=None, end_date=None, clients=None, columns=None):
+    return DashboardIndex(load_data(worksheet_name, start_date, end_date, clients, columns))
+
+def daily_source_sheet():
+    """
+    Aba diária do dashboard: o rollup diário, quando ele cobre o histórico da aba Dados_Gerais;
+    senão (rollup vazio ou ainda não reconstruído com `python rollups.py --reconstruir`), a aba Dados_Gerais.
+    """
+    rollup_keys = load_data(ROLLUP_SHEETS["diario"], columns=KEY_COLUMNS)
+    if rollup_keys.empty or 'data' not in rollup_keys.columns:
+        return "Dados_Gerais"
+    legacy_keys = load_data("Dados_Gerais", columns=KEY_COLUMNS)
+    if not legacy_keys.empty and 'data' in legacy_keys.columns and legacy_keys['data'].min() < rollup_keys['data'].min():
+        logger.warning("O rollup diário não cobre o início de Dados_Gerais. Rode 'python rollups.py --reconstruir'.")
+        return "Dados_Gerais"
+    return ROLLUP_SHEETS["diario"]
+
+def load_dimensions():
+    """Índice só com data e cliente de toda a base diária, para montar os filtros sem baixar as métricas."""
+    return load_index(daily_source_sheet(), columns=KEY_COLUMNS)
+
+def get_sidebar_selection(df):
+    """Cria os filtros na barra lateral e retorna (data inicial, data final, clientes) ou None."""
     st.sidebar.header("Filtros Globais")
-    
-    if df.empty or 'data' not in df.columns or df['data'].isnull().all():
+
+    index = as_index(df)
+    if index.empty:
         st.sidebar.warning("Não há dados de data para criar o filtro.")
-        return pd.DataFrame()
+        return None
 
-    min_date = df['data'].min().date()
-    max_date = df['data'].max().date()
+    min_date = pd.Timestamp(index.min_date).date()
+    max_date = pd.Timestamp(index.max_date).date()
     
     start_date, end_date = st.sidebar.date_input(
         "Selecione o Período:",
@@ -55,20 +579,141 @@ def get_sidebar_filters(df):
     )
 
     selected_clients = []
-    if 'cliente' in df.columns:
-        all_clients = sorted(df['cliente'].unique())
+    if 'cliente' in index.df.columns:
+        all_clients = sorted(index.clients)
         selected_clients = st.sidebar.multiselect(
             "Selecione os Clientes:",
             options=all_clients,
             default=all_clients
         )
-    
-    df_filtered = df[
-        (df['data'].dt.date >= start_date) &
-        (df['data'].dt.date <= end_date)
-    ]
 
-    if selected_clients:
-        df_filtered = df_filtered[df_filtered['cliente'].isin(selected_clients)]
+    return start_date, end_date, selected_clients
+
+def get_sidebar_filters(df):
+    """Cria e gerencia os filtros na barra lateral."""
+    index = as_index(df)
+    selection = get_sidebar_selection(index)
+    if selection is None:
+        return pd.DataFrame()
+    start_date, end_date, selected_clients = selection
+
+    return index.select(start_date, end_date, selected_clients)
+
+# --- Tabela Detalhada Paginada ---
+
+DETAIL_PAGE_SIZES = [25, 50, 100, 250]
+CSV_CHUNK_ROWS = 50_000
+
+def search_positions(df, text):
+    """Posições das linhas em que alguma coluna de texto contém `text` (sem diferenciar maiúsculas)."""
+    if not text:
+        return np.arange(len(df))
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.select_dtypes(include=['object', 'category', 'string']).columns:
+        mask |= df[col].astype(str).str.contains(text, case=False, regex=False, na=False).to_numpy()
+    return np.flatnonzero(mask)
+
+def sort_positions(df, positions, column, ascending=True):
+    """Reordena as posições pela coluna (ordenação estável, nulos no fim)."""
+    values = pd.Series(df[column].to_numpy()[positions])
+    order = values.sort_values(ascending=ascending, kind='mergesort', na_position='last').index.to_numpy()
+    return positions[order]
+
+def iter_csv_chunks(df, chunk_rows=CSV_CHUNK_ROWS):
+    """CSV em blocos de linhas, com o cabeçalho só no primeiro."""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0)
+
+def _frame_signature(df):
+    """Identifica o conteúdo do DataFrame entre reruns quando quem chama não informa `data_key`."""
+    return (len(df), tuple(df.columns), int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+def render_detail_table(df, key="detalhe", file_name="dados_detalhados.csv", data_key=None):
+    """
+    Tabela paginada no servidor: busca e ordenação rodam aqui e só a página visível vai para o navegador.
+    As posições ordenadas ficam na sessão por (dados, busca, ordem, sentido): trocar de página ou o
+    tamanho da página não reordena. `data_key` identifica os dados (ex.: índice e seleção); sem ele,
+    usa-se um hash das linhas. O CSV só é montado quando pedido, em blocos, num arquivo temporário.
+    """
+    if df.empty:
+        st.info("Nenhum dado para exibir.")
+        return
+
+    page_key = f"{key}_pagina"
+
+    def _back_to_first_page():
+        st.session_state[page_key] = 1
+
+    col_busca, col_ordem, col_sentido, col_tamanho = st.columns([3, 2, 1, 1])
+    busca = col_busca.text_input("Buscar", key=f"{key}_busca", on_change=_back_to_first_page)
+    ordenar_por = col_ordem.selectbox("Ordenar por", list(df.columns), key=f"{key}_ordem", on_change=_back_to_first_page)
+    decrescente = col_sentido.checkbox("Decrescente", key=f"{key}_decrescente", on_change=_back_to_first_page)
+    tamanho = col_tamanho.selectbox("Linhas por página", DETAIL_PAGE_SIZES, index=1, key=f"{key}_tamanho", on_change=_back_to_first_page)
+
+    signature = (data_key if data_key is not None else _frame_signature(df), busca.strip(), ordenar_por, decrescente)
+    cached = st.session_state.get(f"{key}_posicoes")
+    if cached is not None and cached[0] == signature:
+        positions = cached[1]
+    else:
+        positions = sort_positions(df, search_positions(df, busca.strip()), ordenar_por, ascending=not decrescente)
+        st.session_state[f"{key}_posicoes"] = (signature, positions)
+    total_pages = max(1, -(-len(positions) // tamanho))
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    pagina = st.number_input("Página", min_value=1, max_value=total_pages, step=1, key=page_key)
+
+    inicio = (pagina - 1) * tamanho
+    st.dataframe(df.iloc[positions[inicio:inicio + tamanho]], use_container_width=True, hide_index=True)
+    st.caption(f"{len(positions):,} linhas · página {pagina} de {total_pages}")
+
+    if st.button("Preparar CSV", key=f"{key}_csv"):
+        # Os blocos vão direto para o disco: o resultado inteiro nunca vira uma única string em memória
+        with tempfile.TemporaryFile() as csv_file:
+            for chunk in iter_csv_chunks(df.iloc[positions]):
+                csv_file.write(chunk.encode('utf-8'))
+            csv_file.seek(0)
+            st.download_button("Baixar CSV", csv_file, file_name=file_name, mime="text/csv", key=f"{key}_download")
+
+# --- Leitura das Tabelas de Rollup ---
+
+def load_rollups(start_date=None, end_date=None, clients=None, dimensions=None):
+    """
+    Carrega o índice da base diária (rollup diário ou, sem ele, a aba Dados_Gerais) e o perfil por
+    dia da semana. Com período e clientes, só a fatia selecionada da base diária é baixada; o perfil
+    é pequeno e vem inteiro.
+    """
+    rollups = {"dia_semana": load_data(ROLLUP_SHEETS["dia_semana"])}
+    if clients and dimensions is not None and set(clients) >= set(dimensions.clients):
+        clients = None  # todos os clientes: o filtro só alongaria a consulta
+    clients = tuple(sorted(clients)) if clients else None
+    daily_sheet = daily_source_sheet()
+    rollups["indice"] = load_index(daily_sheet, start_date, end_date, clients)
+    return rollups
+
+def previous_period(start_date, end_date):
+    """Período imediatamente anterior, com o mesmo número de dias."""
+    days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    return (pd.Timestamp(start_date) - pd.Timedelta(days=days)).date(), (pd.Timestamp(start_date) - pd.Timedelta(days=1)).date()
+
+def derived_ratios(totals):
+    """Razões calculadas a partir das somas do período (não da média das razões diárias)."""
+    faturamento, investimento = totals.get('faturamento', 0), totals.get('investimento', 0)
+    visitas, prints, vendas_ads = totals.get('visitas', 0), totals.get('prints', 0), totals.get(ADS_REVENUE, 0)
+    return {
+        'roas': faturamento / investimento if investimento > 0 else 0,
+        'acos': investimento / vendas_ads if vendas_ads > 0 else 0,
+        'tacos': investimento / faturamento if faturamento > 0 else 0,
+        'taxa_conversao': totals.get('quantidade_vendas', 0) / visitas if visitas > 0 else 0,
+        'ctr': totals.get('clicks', 0) / prints if prints > 0 else 0,
+    }
 
-    return df_filtered
\ No newline at end of file
+def weekday_profile(rollups, start_date, end_date, clients, full_history=False):
+    """Soma de quantidade_vendas por dia da semana (0 = segunda)."""
+    profile = rollups["dia_semana"]
+    if full_history and not profile.empty:
+        df_rows = profile[profile["cliente"].isin(clients)] if clients else profile
+    else:
+        df_rows = rollups["indice"].select(start_date, end_date, clients)
+        if "dia_semana" not in df_rows.columns:
+            df_rows = df_rows.assign(dia_semana=df_rows["data"].dt.dayofweek)
+    return df_rows.groupby("dia_semana")["quantidade_vendas"].sum()